@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import json
+import poplib
+import imaplib
+import logging
+import threading
+from email import message_from_bytes, message_from_string, policy
+from .deliverystatus import STATUS_DELAYED, STATUS_FAILED, STATUS_DELIVERED
+from .smtptransfer import decode_xtext
+
+# DSN actions (RFC 3464) mapped to delivery status
+ACTION_STATUSES = {
+    "failed": STATUS_FAILED,
+    "delayed": STATUS_DELAYED,
+    "delivered": STATUS_DELIVERED,
+    "relayed": STATUS_DELIVERED,
+    "expanded": STATUS_DELIVERED,
+}
+
+
+def parse_bounce(data):
+    """
+    Parse delivery status notification (RFC 3464)
+
+    Original message is identified by its envelope id or by its Message-ID found in
+    returned headers.
+
+    Args:
+        data (bytes): raw message
+
+    Returns:
+        list: recipients status, empty if message is not a delivery status notification::
+
+            [
+                {
+                    messageid (str): original message Message-ID
+                    recipient (str): recipient address (None if unknown)
+                    status (str): delayed, failed or delivered
+                    diagnostic (str): server diagnostic (None if not available)
+                },
+                ...
+            ]
+
+    """
+    message = message_from_bytes(data, policy=policy.compat32)
+    if message.get_content_type() != "multipart/report":
+        return []
+
+    envelope_id = None
+    message_id = None
+    statuses = []
+    for part in message.walk():
+        content_type = part.get_content_type()
+        if content_type == "message/delivery-status":
+            blocks = part.get_payload()
+            if not blocks:
+                continue
+            if blocks[0].get("Original-Envelope-Id"):
+                envelope_id = decode_xtext(blocks[0].get("Original-Envelope-Id").strip())
+            for block in blocks[1:]:
+                status = ACTION_STATUSES.get(str(block.get("Action", "")).strip().lower())
+                if status is None:
+                    continue
+                recipient = block.get("Original-Recipient") or block.get("Final-Recipient") or ""
+                diagnostic = " ".join(
+                    str(block.get(field)).strip()
+                    for field in ("Status", "Diagnostic-Code")
+                    if block.get(field)
+                )
+                statuses.append({
+                    "recipient": recipient.partition(";")[2].strip() or None,
+                    "status": status,
+                    "diagnostic": diagnostic or None,
+                })
+        elif content_type == "message/rfc822" and isinstance(part.get_payload(), list):
+            message_id = part.get_payload()[0].get("Message-ID")
+        elif content_type == "text/rfc822-headers":
+            message_id = message_from_string(part.get_payload(decode=True).decode("utf-8", "replace")).get("Message-ID")
+
+    message_id = envelope_id or (message_id.strip() if message_id else None)
+    if not message_id:
+        return []
+    return [{"messageid": message_id, **status} for status in statuses]
+
+
+class ImapBounceSource:
+    """
+    Fetch new messages of an IMAP mailbox
+
+    Messages are fetched incrementally using their UID, the mailbox is never rescanned
+    and messages are not modified (fetched with BODY.PEEK).
+    """
+
+    def __init__(self, server, port, ssl, login, password, mailbox="INBOX", timeout=30.0):
+        """
+        Constructor
+
+        Args:
+            server (str): imap server address
+            port (int): imap server port
+            ssl (bool): connect using ssl
+            login (str): login
+            password (str): password
+            mailbox (str, optional): mailbox bounces are received in. Defaults to INBOX.
+            timeout (float, optional): connection timeout in seconds. Defaults to 30.
+        """
+        self.server = server
+        self.port = port
+        self.ssl = ssl
+        self.login = login
+        self.password = password
+        self.mailbox = mailbox
+        self.timeout = timeout
+
+    def fetch(self, state):
+        """
+        Fetch messages received since last fetch
+
+        Messages already in mailbox at first fetch (or after mailbox UIDVALIDITY changed)
+        are skipped.
+
+        Args:
+            state (dict): source state, updated with last fetched UID
+
+        Returns:
+            list: raw messages (bytes)
+        """
+        imap_class = imaplib.IMAP4_SSL if self.ssl else imaplib.IMAP4
+        imap = imap_class(self.server, self.port, timeout=self.timeout)
+        try:
+            imap.login(self.login, self.password)
+            typ, data = imap.select(self.mailbox, readonly=True)
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f'Unable to select mailbox "{self.mailbox}": {data}')
+            uid_validity = int(imap.response("UIDVALIDITY")[1][0])
+            if state.get("uidvalidity") != uid_validity:
+                state.clear()
+                state.update({"uidvalidity": uid_validity, "lastuid": self.__get_last_uid(imap)})
+                return []
+
+            typ, data = imap.uid("SEARCH", "UID", f"{state['lastuid'] + 1}:*")
+            # "n:*" range always contains last message, even if its UID is lower than n
+            uids = sorted(uid for uid in map(int, data[0].split()) if uid > state["lastuid"])
+            messages = []
+            for uid in uids:
+                typ, data = imap.uid("FETCH", str(uid), "(BODY.PEEK[])")
+                if typ != "OK":
+                    raise imaplib.IMAP4.error(f"Unable to fetch message {uid}: {data}")
+                if data and isinstance(data[0], tuple):
+                    messages.append(data[0][1])
+                state["lastuid"] = uid
+            return messages
+        finally:
+            try:
+                imap.logout()
+            except Exception:
+                pass
+
+    def __get_last_uid(self, imap):
+        """
+        Return UID of last message in selected mailbox
+
+        Args:
+            imap (IMAP4): imap connection
+
+        Returns:
+            int: last UID (0 if mailbox is empty)
+        """
+        uid_next = imap.response("UIDNEXT")[1][0]
+        if uid_next:
+            return int(uid_next) - 1
+        _, data = imap.uid("SEARCH", "ALL")
+        return max(map(int, data[0].split()), default=0)
+
+
+class PopBounceSource:
+    """
+    Fetch new messages of a POP3 mailbox
+
+    Messages are identified by their UIDL, only messages not seen before are retrieved.
+    Messages are not deleted.
+    """
+
+    def __init__(self, server, port, ssl, login, password, timeout=30.0):
+        """
+        Constructor
+
+        Args:
+            server (str): pop server address
+            port (int): pop server port
+            ssl (bool): connect using ssl
+            login (str): login
+            password (str): password
+            timeout (float, optional): connection timeout in seconds. Defaults to 30.
+        """
+        self.server = server
+        self.port = port
+        self.ssl = ssl
+        self.login = login
+        self.password = password
+        self.timeout = timeout
+
+    def fetch(self, state):
+        """
+        Fetch messages received since last fetch
+
+        Messages already in mailbox at first fetch are skipped.
+
+        Args:
+            state (dict): source state, updated with seen UIDLs
+
+        Returns:
+            list: raw messages (bytes)
+        """
+        pop_class = poplib.POP3_SSL if self.ssl else poplib.POP3
+        pop = pop_class(self.server, self.port, timeout=self.timeout)
+        try:
+            pop.user(self.login)
+            pop.pass_(self.password)
+            _, listing, _ = pop.uidl()
+            uidls = dict(line.decode("utf-8").split(" ", 1)[::-1] for line in listing)
+            if "seen" not in state:
+                state["seen"] = sorted(uidls)
+                return []
+
+            seen = set(state["seen"])
+            messages = []
+            for uidl, number in uidls.items():
+                if uidl in seen:
+                    continue
+                _, lines, _ = pop.retr(int(number))
+                messages.append(b"\r\n".join(lines))
+            # deleted messages are forgotten
+            state["seen"] = sorted(uidls)
+            return messages
+        finally:
+            try:
+                pop.quit()
+            except Exception:
+                pass
+
+
+class BouncePoller:
+    """
+    Poll a mailbox for delivery status notifications
+
+    Source state (last fetched message) is persisted so messages are fetched only once.
+    """
+
+    def __init__(self, source, callback, state_filepath, cleep_filesystem, interval=300.0):
+        """
+        Constructor
+
+        Args:
+            source (ImapBounceSource|PopBounceSource): mailbox source
+            callback (callable): function called with recipients status (see parse_bounce)
+            state_filepath (str): source state file path
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+            interval (float, optional): polling interval in seconds. Defaults to 300.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.source = source
+        self.callback = callback
+        self.state_filepath = state_filepath
+        self.cleep_filesystem = cleep_filesystem
+        self.interval = interval
+        self.__state = self.__load_state()
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """
+        Start polling
+        """
+        self.__thread = threading.Thread(target=self.__run, name="EmailBounces", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop polling. Returns once running poll is done, next polls do nothing.
+        """
+        self.__stop.set()
+        if self.__thread:
+            self.__thread.join()
+        with self.__lock:
+            pass
+
+    def poll(self):
+        """
+        Fetch new messages and report delivery status notifications
+
+        Returns:
+            int: number of recipients status found (0 if poller is stopped)
+        """
+        with self.__lock:
+            if self.__stop.is_set():
+                return 0
+            # source updates state while fetching, keep it only if whole fetch succeeded
+            state = copy.deepcopy(self.__state)
+            messages = self.source.fetch(state)
+            self.__state = state
+            self.__save_state()
+
+        statuses = []
+        for message in messages:
+            try:
+                statuses.extend(parse_bounce(message))
+            except Exception:
+                self.logger.exception("Unable to parse message")
+        if statuses:
+            self.callback(statuses)
+
+        return len(statuses)
+
+    def __run(self):
+        """
+        Polling thread
+        """
+        while not self.__stop.is_set():
+            try:
+                self.poll()
+            except Exception as error:
+                self.logger.warning("Unable to poll bounces: %s", str(error))
+            self.__stop.wait(self.interval)
+
+    def __load_state(self):
+        """
+        Load source state
+
+        Returns:
+            dict: source state
+        """
+        try:
+            with open(self.state_filepath, "r", encoding="utf-8") as filep:
+                return json.load(filep)
+        except (OSError, ValueError):
+            return {}
+
+    def __save_state(self):
+        """
+        Save source state
+        """
+        dirpath = os.path.dirname(self.state_filepath)
+        if not os.path.exists(dirpath):
+            self.cleep_filesystem.mkdir(dirpath, True)
+        tmp_filepath = self.state_filepath + ".tmp"
+        filep = self.cleep_filesystem.open(tmp_filepath, "w", encoding="utf-8")
+        try:
+            json.dump(self.__state, filep)
+        finally:
+            self.cleep_filesystem.close(filep)
+        self.cleep_filesystem.rename(tmp_filepath, self.state_filepath)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import mailbox
+import threading
+from .smtptransfer import BODY_8BITMIME
+
+MAILBOX_FORMATS = ("maildir", "mbox")
+
+
+class DeliveryBackend:
+    """
+    Delivery backend interface
+
+    A delivery backend replaces smtp session to deliver fully serialized messages.
+    Backends implement _write, deliveries are counted and timed by the base class.
+    Backends must be usable from several send workers at the same time.
+    """
+
+    name = None
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.__lock = threading.Lock()
+        self.__messages = 0
+        self.__bytes = 0
+        self.__duration = 0.0
+        self.__first_delivery = None
+        self.__last_delivery = None
+
+    def get_transfer_mode(self):
+        """
+        Return transfer mode messages are built for
+
+        Returns:
+            tuple: body type and chunking flag (see smtptransfer.get_transfer_mode)
+        """
+        return BODY_8BITMIME, False
+
+    def deliver(self, sender, recipients, data):
+        """
+        Deliver message
+
+        Args:
+            sender (str): envelope sender
+            recipients (list): envelope recipients
+            data (bytes): serialized message (CRLF line endings)
+
+        Returns:
+            int: number of delivered bytes
+        """
+        start = time.monotonic()
+        self._write(sender, recipients, data)
+        end = time.monotonic()
+
+        with self.__lock:
+            self.__messages += 1
+            self.__bytes += len(data)
+            self.__duration += end - start
+            if self.__first_delivery is None:
+                self.__first_delivery = end
+            self.__last_delivery = end
+
+        return len(data)
+
+    def _write(self, sender, recipients, data):
+        """
+        Write message to backend
+
+        Args:
+            sender (str): envelope sender
+            recipients (list): envelope recipients
+            data (bytes): serialized message (CRLF line endings)
+        """
+        raise NotImplementedError()
+
+    def get_stats(self):
+        """
+        Return delivery statistics
+
+        Returns:
+            dict: statistics::
+
+                {
+                    backend (str): backend name
+                    messages (int): number of delivered messages
+                    bytes (int): number of delivered bytes
+                    duration (float): time spent delivering messages in seconds
+                    rate (float): messages per second between first and last delivery
+                }
+
+        """
+        with self.__lock:
+            elapsed = (self.__last_delivery or 0.0) - (self.__first_delivery or 0.0)
+            return {
+                "backend": self.name,
+                "messages": self.__messages,
+                "bytes": self.__bytes,
+                "duration": self.__duration,
+                "rate": (self.__messages - 1) / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def close(self):
+        """
+        Release backend resources
+        """
+
+
+class NullBackend(DeliveryBackend):
+    """
+    Backend dropping messages, only deliveries are counted
+    """
+
+    name = "null"
+
+    def _write(self, sender, recipients, data):
+        pass
+
+
+class CaptureBackend(DeliveryBackend):
+    """
+    Backend storing messages in a local maildir or mbox
+    """
+
+    name = "capture"
+
+    def __init__(self, path, cleep_filesystem, mailbox_format="maildir"):
+        """
+        Constructor
+
+        Args:
+            path (str): maildir directory or mbox file path
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+            mailbox_format (str, optional): maildir or mbox. Defaults to maildir.
+
+        Raises:
+            ValueError: if mailbox format is not supported
+        """
+        DeliveryBackend.__init__(self)
+        if mailbox_format not in MAILBOX_FORMATS:
+            raise ValueError(f'Unsupported mailbox format "{mailbox_format}"')
+        self.path = path
+        self.cleep_filesystem = cleep_filesystem
+        self.mailbox_format = mailbox_format
+        self.__mailbox = None
+        self.__lock = threading.Lock()
+
+    def _write(self, sender, recipients, data):
+        # mailbox files use local line endings
+        data = data.replace(b"\r\n", b"\n")
+        with self.__lock:
+            # mailbox module writes files itself
+            self.cleep_filesystem.enable_write()
+            try:
+                if self.__mailbox is None:
+                    self.__mailbox = self.__open_mailbox()
+                if self.mailbox_format == "mbox":
+                    self.__mailbox.lock()
+                    try:
+                        message = mailbox.mboxMessage(data)
+                        message.set_from(sender or "MAILER-DAEMON")
+                        self.__mailbox.add(message)
+                        self.__mailbox.flush()
+                    finally:
+                        self.__mailbox.unlock()
+                else:
+                    self.__mailbox.add(data)
+            finally:
+                self.cleep_filesystem.disable_write()
+
+    def __open_mailbox(self):
+        """
+        Open mailbox, creating it if necessary
+
+        Returns:
+            mailbox.Mailbox: mailbox
+        """
+        if self.mailbox_format == "mbox":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            return mailbox.mbox(self.path, create=True)
+        return mailbox.Maildir(self.path, create=True)
+
+    def close(self):
+        with self.__lock:
+            if self.__mailbox is not None:
+                self.__mailbox.close()
+                self.__mailbox = None
+
+
+DELIVERY_BACKENDS = ("smtp", CaptureBackend.name, NullBackend.name)
+
+
+def get_delivery_parameters(backend, capture_path, capture_format):
+    """
+    Return delivery backend parameters, to be checked with _check_parameters
+
+    Args:
+        backend (str): delivery backend (smtp, capture or null)
+        capture_path (str): maildir directory or mbox file
+        capture_format (str): capture mailbox format (maildir or mbox)
+
+    Returns:
+        list: parameters description
+    """
+    return [
+        {
+            "name": "backend",
+            "value": backend,
+            "type": str,
+            "validator": lambda val: val in DELIVERY_BACKENDS,
+            "message": "Delivery backend must be choosen from list",
+        },
+        {"name": "capture_path", "value": capture_path, "type": str, "none": True},
+        {
+            "name": "capture_format",
+            "value": capture_format,
+            "type": str,
+            "validator": lambda val: val in MAILBOX_FORMATS,
+            "message": "Capture format must be maildir or mbox",
+        },
+    ]
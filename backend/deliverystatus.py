@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from .journal import JsonLinesJournal
+
+STATUS_SENT = "sent"
+STATUS_REFUSED = "refused"
+STATUS_DELAYED = "delayed"
+STATUS_FAILED = "failed"
+STATUS_DELIVERED = "delivered"
+
+
+class DeliveryStatusIndex:
+    """
+    Per-recipient delivery status of sent messages indexed by Message-ID
+
+    Recipients start as sent (accepted by relay) or refused (refused by relay) and
+    are updated by delivery status notifications. Only latest messages are kept.
+
+    Index is persisted in an append-only journal of add/update records, compacted
+    when it contains too many records.
+    """
+
+    COMPACT_MIN_RECORDS = 1000
+
+    def __init__(self, filepath, cleep_filesystem, max_messages=1000):
+        """
+        Constructor
+
+        Args:
+            filepath (str): journal file path
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+            max_messages (int, optional): number of messages kept. Defaults to 1000.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.filepath = filepath
+        self.max_messages = max_messages
+        self.__entries = OrderedDict()
+        self.__journal = JsonLinesJournal(filepath, cleep_filesystem)
+        self.__lock = threading.Lock()
+
+    def open(self):
+        """
+        Load journal
+        """
+        with self.__lock:
+            self.__load()
+            self.__compact()
+
+    def add(self, message_id, recipients, refused=None):
+        """
+        Add sent message
+
+        Args:
+            message_id (str): message Message-ID
+            recipients (list): envelope recipients
+            refused (dict, optional): recipients refused by relay as returned by smtplib sendmail. Defaults to None.
+        """
+        refused = {recipient.lower(): error for recipient, error in (refused or {}).items()}
+        statuses = {}
+        for recipient in recipients:
+            error = refused.get(recipient.lower())
+            statuses[recipient.lower()] = {
+                "status": STATUS_REFUSED if error else STATUS_SENT,
+                "diagnostic": self.__get_diagnostic(error) if error else None,
+            }
+        entry = {"messageid": message_id, "timestamp": int(time.time()), "recipients": statuses}
+
+        with self.__lock:
+            # entry is indexed before being written, in case journal is compacted
+            self.__add_entry(entry)
+            self.__write({"op": "add", **entry})
+
+    def update(self, message_id, recipient, status, diagnostic=None):
+        """
+        Update recipient delivery status
+
+        Args:
+            message_id (str): message Message-ID
+            recipient (str): recipient address (None to update all recipients)
+            status (str): delivery status
+            diagnostic (str, optional): delivery diagnostic. Defaults to None.
+
+        Returns:
+            bool: True if message is indexed
+        """
+        record = {
+            "op": "update",
+            "messageid": message_id,
+            "recipient": recipient.lower() if recipient else None,
+            "status": status,
+            "diagnostic": diagnostic,
+        }
+        with self.__lock:
+            if message_id not in self.__entries:
+                return False
+            self.__update_entry(record)
+            self.__write(record)
+
+        return True
+
+    def get(self, message_id):
+        """
+        Return message delivery status
+
+        Args:
+            message_id (str): message Message-ID
+
+        Returns:
+            dict: message delivery status (see get_entries) or None if message is not indexed
+        """
+        with self.__lock:
+            entry = self.__entries.get(message_id)
+            return json.loads(json.dumps(entry)) if entry else None
+
+    def get_entries(self):
+        """
+        Return delivery status of indexed messages
+
+        Returns:
+            list: messages delivery status (oldest first)::
+
+                [
+                    {
+                        messageid (str): message Message-ID
+                        timestamp (int): send timestamp
+                        recipients (dict): recipients status indexed by address::
+
+                            {
+                                status (str): sent, refused, delayed, failed or delivered
+                                diagnostic (str): server diagnostic (None if not available)
+                            }
+
+                    },
+                    ...
+                ]
+
+        """
+        with self.__lock:
+            return json.loads(json.dumps(list(self.__entries.values())))
+
+    def __get_diagnostic(self, error):
+        """
+        Return diagnostic from smtp error
+
+        Args:
+            error (tuple): smtp code and message
+
+        Returns:
+            str: diagnostic
+        """
+        code, message = error
+        if isinstance(message, bytes):
+            message = message.decode("utf-8", "replace")
+        return f"{code} {message}"
+
+    def __add_entry(self, entry):
+        """
+        Add entry dropping oldest ones
+
+        Args:
+            entry (dict): message entry
+        """
+        self.__entries[entry["messageid"]] = entry
+        while len(self.__entries) > self.max_messages:
+            self.__entries.popitem(last=False)
+
+    def __update_entry(self, record):
+        """
+        Apply update record
+
+        Args:
+            record (dict): update record
+        """
+        entry = self.__entries.get(record["messageid"])
+        if entry is None:
+            return
+        recipients = [record["recipient"]] if record["recipient"] else list(entry["recipients"])
+        for recipient in recipients:
+            entry["recipients"][recipient] = {
+                "status": record["status"],
+                "diagnostic": record["diagnostic"],
+            }
+
+    def __load(self):
+        """
+        Load journal
+        """
+        for record in self.__journal.load():
+            if record.pop("op") == "add":
+                self.__add_entry(record)
+            else:
+                self.__update_entry(record)
+
+    def __compact(self):
+        """
+        Rewrite journal with kept messages only
+        """
+        self.__journal.rewrite([{"op": "add", **entry} for entry in self.__entries.values()])
+
+    def __write(self, record):
+        """
+        Append record to journal, compacting it when needed
+
+        Args:
+            record (dict): journal record
+        """
+        self.__journal.append(record)
+        if self.__journal.records > max(
+            DeliveryStatusIndex.COMPACT_MIN_RECORDS, 4 * len(self.__entries)
+        ):
+            self.__compact()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+from cleep.exception import CommandError
+from .bounces import BouncePoller, ImapBounceSource, PopBounceSource
+from .deliverystatus import DeliveryStatusIndex
+
+BOUNCE_PROTOCOLS = ("imap", "pop")
+
+
+def get_poller_parameters(server, port, ssl, login, password, mailbox, interval):
+    """
+    Return bounce poller parameters, to be checked with _check_parameters
+
+    Args:
+        server (str): mailbox server address
+        port (int): mailbox server port
+        ssl (bool): connect using ssl
+        login (str): mailbox login
+        password (str): mailbox password
+        mailbox (str): imap mailbox bounces are received in
+        interval (int): polling interval in seconds
+
+    Returns:
+        list: parameters description
+    """
+    return [
+        {"name": "server", "value": server, "type": str},
+        {
+            "name": "port",
+            "value": port,
+            "type": int,
+            "validator": lambda val: 0 < val < 65536,
+            "message": "Port is invalid",
+        },
+        {"name": "ssl", "value": ssl, "type": bool},
+        {"name": "login", "value": login, "type": str},
+        {"name": "password", "value": password, "type": str},
+        {"name": "mailbox", "value": mailbox, "type": str},
+        {
+            "name": "interval",
+            "value": interval,
+            "type": int,
+            "validator": lambda val: val >= 60,
+            "message": "Polling interval must be at least 60 seconds",
+        },
+    ]
+
+
+class DeliveryTracker:
+    """
+    Track per-recipient delivery status of sent messages
+
+    Status is indexed when messages are delivered and updated by delivery status
+    notifications (bounces) fetched by the bounce poller.
+    """
+
+    def __init__(self, status_filepath, bounces_filepath, cleep_filesystem):
+        """
+        Constructor
+
+        Args:
+            status_filepath (str): delivery status journal path
+            bounces_filepath (str): bounce poller state path
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.bounces_filepath = bounces_filepath
+        self.cleep_filesystem = cleep_filesystem
+        self.status = DeliveryStatusIndex(status_filepath, cleep_filesystem)
+        self.__poller = None
+
+    def open(self):
+        """
+        Load delivery status index
+        """
+        self.status.open()
+
+    def stop(self):
+        """
+        Stop bounce poller
+        """
+        if self.__poller:
+            self.__poller.stop()
+
+    def configure_poller(self, poller, reset_state=False):
+        """
+        Create or drop bounce poller
+
+        Args:
+            poller (dict): bounce poller configuration (None to disable poller)
+            reset_state (bool, optional): forget messages fetched by previous poller. Defaults to False.
+        """
+        if self.__poller:
+            # wait for running poll, it would write previous poller state
+            self.__poller.stop()
+            self.__poller = None
+        if reset_state and os.path.exists(self.bounces_filepath):
+            self.cleep_filesystem.rm(self.bounces_filepath)
+
+        if not poller:
+            return
+        if poller["protocol"] == "imap":
+            source = ImapBounceSource(
+                poller["server"],
+                poller["port"],
+                poller["ssl"],
+                poller["login"],
+                poller["password"],
+                poller["mailbox"],
+            )
+        else:
+            source = PopBounceSource(
+                poller["server"], poller["port"], poller["ssl"], poller["login"], poller["password"]
+            )
+        self.__poller = BouncePoller(
+            source,
+            self.__update_status,
+            self.bounces_filepath,
+            self.cleep_filesystem,
+            poller["interval"],
+        )
+        self.__poller.start()
+
+    def poll(self):
+        """
+        Poll bounces mailbox now
+
+        Returns:
+            int: number of recipients delivery status found
+
+        Raises:
+            CommandError: if bounce poller is not configured or mailbox polling failed
+        """
+        poller = self.__poller
+        if poller is None:
+            raise CommandError("Bounce poller is not configured")
+
+        try:
+            return poller.poll()
+        except Exception as error:
+            self.logger.exception("Unable to poll bounces:")
+            raise CommandError(f"Unable to poll bounces: {error}") from error
+
+    def get_status(self, message_id=None):
+        """
+        Return per-recipient delivery status of sent emails
+
+        Args:
+            message_id (str, optional): return status of this message only. Defaults to None (all messages).
+
+        Returns:
+            list|dict: messages delivery status (see DeliveryStatusIndex.get_entries) or message
+                       delivery status if message_id is specified
+
+        Raises:
+            CommandError: if message is unknown
+        """
+        if message_id is None:
+            return self.status.get_entries()
+        status = self.status.get(message_id)
+        if status is None:
+            raise CommandError(f'Unknown message "{message_id}"')
+        return status
+
+    def __update_status(self, statuses):
+        """
+        Update recipients delivery status from delivery status notifications
+
+        Args:
+            statuses (list): recipients status (see parse_bounce)
+        """
+        for status in statuses:
+            if not self.status.update(
+                status["messageid"], status["recipient"], status["status"], status["diagnostic"]
+            ):
+                self.logger.debug('Delivery status of unknown message "%s" dropped', status["messageid"])
@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import smtplib
-import mimetypes
 import os
-from email.message import EmailMessage
 from cleep.core import CleepRenderer
-from cleep.exception import CommandError, MissingParameter
+from cleep.exception import CommandError
 from cleep.profiles.alertprofile import AlertProfile
 from cleep.libs.internals.tools import TRACE
+from .imagetransform import ImageTransformer
+from .deliverybackends import get_delivery_parameters
+from .deliverytracker import DeliveryTracker, BOUNCE_PROTOCOLS, get_poller_parameters
+from .emailscheduler import EmailScheduler
+from .mailmerge import MailMerge, get_mail_merge_parameters
+from .messagesender import MessageSender, is_valid_attachment, get_message_parameters
+from .relayconnection import RelaySessions
+from .sendconfig import SendConfigSnapshot, get_providers, get_send_config, get_config_parameters
+from .sendprofiler import SendProfiler
+from .sendworker import SendWorkerPool, SendTimeout, SendQueueFull
 
 __all__ = ["Email"]
 
@@ -46,27 +53,38 @@ class Email(CleepRenderer):
         "tls": False,
         "ssl": False,
         "sender": None,
+        "imagetransform": False,
+        "imagemaxdimension": 1280,
+        "imagequality": 75,
+        "prewarm": False,
+        "timeouts": {
+            "connect": 10,
+            "tls": 10,
+            "auth": 10,
+            "data": 60,
+        },
+        "adaptivetimeouts": False,
+        "delivery": "smtp",
+        "capturepath": None,
+        "captureformat": "maildir",
+        "dsn": True,
+        "bouncepoller": None,
     }
 
     RENDERER_PROFILES = [AlertProfile]
 
-    CUSTOM_PROVIDER_KEY = "custom"
-    PROVIDERS = {
-        "gmail": {
-            "label": "Google Gmail",
-            "server": "smtp.gmail.com",
-            "port": 465,
-            "tls": False,
-            "ssl": True,
-        },
-        "yahoo": {
-            "label": "Yahoo! Mail",
-            "server": "smtp.mail.yahoo.com",
-            "port": 587,
-            "tls": True,
-            "ssl": False,
-        },
-    }
+    SEND_REPORTS_SIZE = 50
+    SEND_WORKERS = 4
+    SEND_QUEUE_SIZE = 100
+    SEND_TIMEOUT = 300
+    RESOLVER_TTL = 300.0
+    PREWARM_MAX_IDLE = 240.0
+    SCHEDULE_FILE = "email.schedule"
+    PROFILES_DIR = "email.profiles"
+    CAPTURE_DIR = "email.capture"
+    STATUS_FILE = "email.status"
+    BOUNCES_FILE = "email.bounces"
+    INLINE_RESOURCES_CACHE_SIZE = 20
 
     def __init__(self, bootstrap, debug_enabled):
         """
@@ -78,6 +96,94 @@ class Email(CleepRenderer):
         """
         CleepRenderer.__init__(self, bootstrap, debug_enabled)
 
+        self.__send_pool = SendWorkerPool(Email.SEND_WORKERS, Email.SEND_QUEUE_SIZE)
+        # relay is not used by capture and null delivery backends
+        self.__send_config = SendConfigSnapshot(
+            lambda: self.__get_config(check_relay=self.__sender.delivery is None)
+        )
+        self.__sessions = RelaySessions(
+            Email.DEFAULT_CONFIG["timeouts"], Email.RESOLVER_TTL, Email.PREWARM_MAX_IDLE
+        )
+        self.__tracker = DeliveryTracker(
+            os.path.join(self.CONFIG_DIR, Email.STATUS_FILE),
+            os.path.join(self.CONFIG_DIR, Email.BOUNCES_FILE),
+            self.cleep_filesystem,
+        )
+        self.__sender = MessageSender(
+            self.__sessions,
+            self.__tracker.status,
+            lambda: self.logger.getEffectiveLevel() == TRACE,
+            Email.SEND_REPORTS_SIZE,
+            Email.INLINE_RESOURCES_CACHE_SIZE,
+        )
+        self.__mail_merge = MailMerge(self.__sender)
+        self.__scheduler = None
+        self.__profiler = SendProfiler(
+            os.path.join(self.CONFIG_DIR, Email.PROFILES_DIR), self.cleep_filesystem
+        )
+
+    def _configure(self):
+        """
+        Configure module
+        """
+        self.__configure_image_transformer()
+        self.__configure_delivery_backend()
+        self.__tracker.open()
+        self.__tracker.configure_poller(self._get_config().get("bouncepoller"))
+        self.__scheduler = EmailScheduler(
+            os.path.join(self.CONFIG_DIR, Email.SCHEDULE_FILE),
+            self.cleep_filesystem,
+            self.__send_scheduled_email,
+            Email.SEND_WORKERS,
+        )
+        self.__scheduler.start()
+        self.__prewarm()
+
+    def _on_stop(self):
+        """
+        Stop module
+        """
+        self.cancel_mail_merge()
+        if self.__scheduler:
+            self.__scheduler.stop()
+        self.__send_pool.shutdown()
+        self.__sessions.drop_warm_session()
+        if self.__sender.image_transformer:
+            self.__sender.image_transformer.shutdown()
+        if self.__sender.delivery:
+            self.__sender.delivery.close()
+        self.__tracker.stop()
+
+    def __configure_image_transformer(self):
+        """
+        Create or drop image transformer according to configuration
+        """
+        config = self._get_config()
+        if self.__sender.image_transformer:
+            self.__sender.image_transformer.shutdown()
+            self.__sender.image_transformer = None
+
+        if not config.get("imagetransform"):
+            return
+        if not ImageTransformer.is_available():
+            self.logger.warning("Image transform is enabled but Pillow is not installed")
+            return
+        self.__sender.image_transformer = ImageTransformer(
+            config.get("imagemaxdimension"), config.get("imagequality")
+        )
+
+    def __configure_delivery_backend(self):
+        """
+        Create delivery backend according to configuration
+        """
+        config = self._get_config()
+        self.__sender.configure_delivery(
+            config.get("delivery"),
+            config.get("capturepath") or os.path.join(self.CONFIG_DIR, Email.CAPTURE_DIR),
+            config.get("captureformat"),
+            self.cleep_filesystem,
+        )
+
     def get_module_config(self):
         """
         Return full module configuration
@@ -93,6 +199,17 @@ class Email(CleepRenderer):
                     login (string): smtp server login
                     sender (string): default sender
                     provider (str): configured provider
+                    imagetransform (bool): True if image attachments are transformed
+                    imagemaxdimension (int): maximum width or height of transformed images
+                    imagequality (int): JPEG quality of transformed images
+                    prewarm (bool): True if smtp session is pre-warmed
+                    timeouts (dict): session phases timeouts in seconds (connect, tls, auth, data)
+                    adaptivetimeouts (bool): True if timeouts are derived from observed durations
+                    delivery (str): delivery backend (smtp, capture or null)
+                    capturepath (str): capture backend maildir directory or mbox file
+                    captureformat (str): capture backend mailbox format (maildir or mbox)
+                    dsn (bool): True if delivery status notifications are requested
+                    bouncepoller (dict): bounce poller configuration without password (None if disabled)
                     providers (list): list of provider names::
 
                         (
@@ -107,19 +224,14 @@ class Email(CleepRenderer):
 
         """
         config = self._get_config()
+        config["providers"] = get_providers()
 
-        # append providers
-        config["providers"] = []
-        for provider_name, provider in Email.PROVIDERS.items():
-            config["providers"].append(
-                {"label": provider["label"], "key": provider_name}
-            )
-        config["providers"].append(
-            {"label": "Custom email provider", "key": Email.CUSTOM_PROVIDER_KEY}
-        )
-
-        # delete configured password
+        # delete configured passwords
         del config["password"]
+        if config.get("bouncepoller"):
+            config["bouncepoller"] = {
+                key: value for key, value in config["bouncepoller"].items() if key != "password"
+            }
 
         return config
 
@@ -146,6 +258,8 @@ class Email(CleepRenderer):
         bcc=None,
         attachments=None,
         sender=None,
+        inline_images=None,
+        timeout=None,
     ):
         """
         Send test email
@@ -156,208 +270,315 @@ class Email(CleepRenderer):
             recipient (str): coma separated recipients
             cc (str, optional): coma separated carbon copy recipients. Defaults to None.
             bcc (str, optional): coma separated blind carbon copy recipients. Defaults to None.
-            attachments (list, optional): list of attachments. Must be filepaths. Defaults to None.::
-
-                ( filepath1, filepath2, ...)
+            attachments (list, optional): list of attachments. Items are filepaths or in-memory attachments. Defaults to None.::
+
+                (
+                    filepath1,
+                    {
+                        filename (str): attachment filename
+                        content (bytes|bytearray|memoryview|file-like): attachment content. File-like
+                            contents are read entirely in memory.
+                        mimetype (str, optional): attachment mime type. Guessed from filename if not specified
+                    },
+                    ...
+                )
 
             sender (str, optional): overwrite default sender. Defaults to None
+            inline_images (dict, optional): images displayed in content. Must be filepaths indexed by content id.
+                Images are referenced in html content with "cid:<content id>". Defaults to None.::
+
+                { "logo": filepath1, "snapshot": filepath2, ...}
+
+            timeout (int, optional): maximum duration of sending in seconds (including time waiting for a
+                free send worker). Defaults to SEND_TIMEOUT.
 
         Returns:
             bool: True if message sent successfully. Nonetheless email may returned in error afterwards.
         """
         self._check_parameters(
-            [
+            get_message_parameters(subject, content, recipient, cc, bcc, sender, inline_images)
+            + [
                 {
-                    "name": "subject",
-                    "value": subject,
-                    "type": str,
-                    "empty": False,
-                    "none": False,
-                },
-                {
-                    "name": "content",
-                    "value": content,
-                    "type": str,
-                    "empty": False,
-                    "none": False,
-                },
-                {
-                    "name": "recipient",
-                    "value": recipient,
-                    "type": str,
-                    "empty": False,
-                    "none": False,
+                    "name": "attachments",
+                    "value": attachments,
+                    "type": list,
+                    "none": True,
+                    "validator": lambda val: all(is_valid_attachment(v) for v in val),
                 },
                 {
-                    "name": "cc",
-                    "value": cc,
-                    "type": str,
+                    "name": "timeout",
+                    "value": timeout,
+                    "type": int,
                     "none": True,
+                    "validator": lambda val: val > 0,
                 },
+            ]
+        )
+
+        config = self.__get_send_config()
+        if attachments is None:
+            attachments = []
+
+        send = self.__sender.send
+        if self.__profiler.remaining:
+            send = self.__profiler.wrap(send, "send_email")
+
+        try:
+            return self.__send_pool.run(
+                send,
+                timeout or Email.SEND_TIMEOUT,
+                config,
+                subject,
+                content,
+                recipient,
+                cc,
+                bcc,
+                attachments,
+                sender,
+                inline_images,
+            )
+        except SendQueueFull as error:
+            raise CommandError("Too many emails are pending, email not sent") from error
+        except SendTimeout as error:
+            raise CommandError("Email sending timed out") from error
+
+    def mail_merge(self, filepath, subject, content, recipient_field="email", sender=None):
+        """
+        Send personalized emails to all recipients of a CSV or JSON lines file
+
+        Subject and content are templates where recipient fields are referenced as $field
+        or ${field}. Field values are html escaped in content. Emails are sent in background
+        on a single session, use get_mail_merge_status to follow progress.
+
+        Args:
+            filepath (str): recipients file. CSV file with header or JSON lines (.jsonl, .ndjson, .json) file.
+            subject (str): email subject template
+            content (str): email content template
+            recipient_field (str, optional): field containing recipient email. Defaults to "email".
+            sender (str, optional): overwrite default sender. Defaults to None.
+
+        Returns:
+            bool: True if mail merge started
+
+        Raises:
+            CommandError: if a mail merge is already running
+        """
+        self._check_parameters(
+            get_mail_merge_parameters(filepath, subject, content, recipient_field, sender)
+        )
+
+        self.__mail_merge.start(
+            filepath, self.__get_send_config(), subject, content, recipient_field, sender
+        )
+
+        return True
+
+    def get_mail_merge_status(self):
+        """
+        Return status of current or last mail merge
+
+        Returns:
+            dict: mail merge status (see MailMergeProgress.get_status) or None if no mail merge was started
+        """
+        return self.__mail_merge.get_status()
+
+    def cancel_mail_merge(self):
+        """
+        Cancel running mail merge
+
+        Returns:
+            bool: True if a running mail merge was cancelled
+        """
+        return self.__mail_merge.cancel()
+
+    def schedule_email(
+        self,
+        send_at,
+        subject,
+        content,
+        recipient,
+        cc=None,
+        bcc=None,
+        attachments=None,
+        sender=None,
+        inline_images=None,
+    ):
+        """
+        Schedule email sending
+
+        Scheduled emails are persisted and sent at startup if their send time was missed.
+
+        Args:
+            send_at (int): send timestamp
+            subject (str): email subject
+            content (str): email content. Html or text.
+            recipient (str): coma separated recipients
+            cc (str, optional): coma separated carbon copy recipients. Defaults to None.
+            bcc (str, optional): coma separated blind carbon copy recipients. Defaults to None.
+            attachments (list, optional): list of attachments. Must be filepaths. Defaults to None.
+            sender (str, optional): overwrite default sender. Defaults to None
+            inline_images (dict, optional): images displayed in content, filepaths indexed by content id.
+                Defaults to None.
+
+        Returns:
+            str: scheduled email id
+        """
+        self._check_parameters(
+            [
                 {
-                    "name": "bcc",
-                    "value": bcc,
-                    "type": str,
-                    "none": True,
+                    "name": "send_at",
+                    "value": send_at,
+                    "type": int,
                 },
                 {
                     "name": "attachments",
                     "value": attachments,
                     "type": list,
                     "none": True,
-                    "validator": lambda val: all(isinstance(v,str) for v in val),
+                    "validator": lambda val: all(isinstance(v, str) for v in val),
                 },
+            ]
+            + get_message_parameters(subject, content, recipient, cc, bcc, sender, inline_images)
+        )
+
+        return self.__scheduler.add(
+            send_at,
+            {
+                "subject": subject,
+                "content": content,
+                "recipient": recipient,
+                "cc": cc,
+                "bcc": bcc,
+                "attachments": attachments,
+                "sender": sender,
+                "inline_images": inline_images,
+            },
+        )
+
+    def cancel_scheduled(self, scheduled_id):
+        """
+        Cancel scheduled email
+
+        Args:
+            scheduled_id (str): scheduled email id returned by schedule_email
+
+        Returns:
+            bool: True if email was cancelled, False if it does not exist or was already sent
+        """
+        self._check_parameters(
+            [
                 {
-                    "name": "sender",
-                    "value": sender,
+                    "name": "scheduled_id",
+                    "value": scheduled_id,
                     "type": str,
                     "empty": False,
-                    "none": True,
                 },
             ]
         )
 
-        config = self.__get_config()
-        if attachments is None:
-            attachments = []
+        return self.__scheduler.cancel(scheduled_id)
 
-        try:
-            mail = EmailMessage()
-            mail["Subject"] = subject
-            mail["From"] = sender or config.get("sender") or config.get("login")
-            mail["To"] = recipient
-            mail.preamble = "You will not see this in a MIME-aware mail reader.\n"
-            mail.set_content(f"<html><head></head><body>{content}</body>", subtype="html")
-
-            for attachment in attachments:
-                if not os.path.isfile(attachment):
-                    continue
-                ctype, encoding = mimetypes.guess_type(attachment)
-                if ctype is None or encoding is not None:
-                    ctype = "application/octet-stream"
-                maintype, subtype = ctype.split("/", 1)
-                with open(attachment, "rb") as filep:
-                    mail.add_attachment(
-                        filep.read(),
-                        maintype=maintype,
-                        subtype=subtype,
-                        filename=os.path.basename(attachment),
-                    )
-
-            smtp_server = None
-            server = config.get("server")
-            port = config.get("port")
-            ssl = config.get("ssl", False)
-            self.logger.debug("SSL enabled: %s", ssl)
-            if ssl:
-                self.logger.debug("Connect SMTP server with SSL on %s:%s", server, port)
-                smtp_server = smtplib.SMTP_SSL(server, port)
-            else:
-                self.logger.debug(
-                    "Connect SMTP server without SSL on %s:%s", server, port)
-                smtp_server = smtplib.SMTP(server, port)
-            self.logger.debug("Smtp server: %s", smtp_server)
-            if self.logger.getEffectiveLevel() == TRACE:
-                smtp_server.set_debuglevel(True)
-            if config.get("tls"):
-                self.logger.debug("StartTLS session")
-                smtp_server.starttls()
-            if config.get("login"):
-                self.logger.debug("Connect to server using credentials")
-                smtp_server.login(config.get("login"), config.get("password"))
-            self.logger.debug("Connected to server")
-
-            smtp_server.send_message(mail)
-            smtp_server.quit()
-
-            return True
-
-        except smtplib.SMTPServerDisconnected as error:
-            self.logger.exception("Failed to send email:")
-            raise CommandError("Server disconnected") from error
-
-        except smtplib.SMTPSenderRefused as error:
-            self.logger.exception("Failed to send email:")
-            raise CommandError("Email sender must be a valid email address") from error
-
-        except smtplib.SMTPRecipientsRefused as error:
-            self.logger.exception("Failed to send email:")
-            raise CommandError("Some recipients were refused") from error
-
-        except smtplib.SMTPDataError as error:
-            self.logger.exception("Failed to send email:")
-            raise CommandError("Problem with email content") from error
-
-        except smtplib.SMTPConnectError as error:
-            self.logger.exception("Failed to send email:")
-            raise CommandError(
-                "Unable to establish connection with smtp server. Please check server address"
-            ) from error
-
-        except smtplib.SMTPAuthenticationError as error:
-            self.logger.exception("Failed to send email:")
-            raise CommandError("Authentication failed. Please check credentials.") from error
+    def get_scheduled_emails(self):
+        """
+        Return pending scheduled emails
 
-        except Exception as error:
-            self.logger.exception("Failed to send email:")
-            raise CommandError("Unable to send email. Please check configuration") from error
+        Returns:
+            list: scheduled emails sorted by send time::
+
+                [
+                    {
+                        id (str): scheduled email id
+                        sendat (float): send timestamp
+                        params (dict): send_email parameters
+                    },
+                    ...
+                ]
 
-    def __get_config(self):
         """
-        Check and return valid configuration
+        return self.__scheduler.get_entries()
 
-        Returns:
-            dict: current configuration ready to be used to send mail::
+    def __send_scheduled_email(self, params):
+        """
+        Send scheduled email (scheduler callback)
 
+        Args:
+            params (dict): send_email parameters
+        """
+        self.send_email(**params)
+
+    def __prewarm(self):
+        """
+        Pre-warm smtp session if enabled
+        """
+        if self._get_config().get("prewarm"):
+            self.__sessions.prewarm(self.__get_send_config, self.logger.getEffectiveLevel() == TRACE)
+
+    def set_prewarm(self, enabled):
+        """
+        Enable or disable smtp session pre-warming
+
+        When enabled, an authenticated session is opened at startup and after each
+        configuration change so next email is sent without connection delay.
+
+        Args:
+            enabled (bool): True to enable pre-warming
+
+        Returns:
+            bool: True if config saved successfully
+        """
+        self._check_parameters(
+            [
                 {
-                    server (str): smtp server address
-                    port (int): smtp server port
-                    ssl (bool): ssl flag
-                    tls (bool): tls flag
-                    sender (str): custom sender value
-                    login (str): login
-                    password (str): password
-                }
+                    "name": "enabled",
+                    "value": enabled,
+                    "type": bool,
+                },
+            ]
+        )
+
+        saved = self._update_config({"prewarm": enabled})
+        if enabled:
+            self.__prewarm()
+        else:
+            self.__sessions.drop_warm_session()
+
+        return saved
+
+    def get_send_reports(self):
+        """
+        Return reports of latest sent emails
+
+        Returns:
+            list: list of reports, oldest first (see MessageSender.get_reports)
+        """
+        return self.__sender.get_reports()
+
+    def __get_send_config(self):
+        """
+        Return read-only snapshot of send configuration
+
+        Returns:
+            MappingProxyType: send configuration (see get_send_config)
 
         Raises:
             MissingParameter: if inconsistent configuration value found
         """
-        config = self._get_config()
+        return self.__send_config.get()
 
-        if config.get("provider") in Email.PROVIDERS and (
-            not config.get("login") or not config.get("password")
-        ):
-            raise MissingParameter(
-                "Credentials must be specified with choosen provider"
-            )
-        if config["provider"] == Email.CUSTOM_PROVIDER_KEY and (
-            not config.get("server") or not config.get("port")
-        ):
-            raise MissingParameter(
-                "Server/port address must be configured when using custom provider"
-            )
+    def __get_config(self, check_relay=True):
+        """
+        Check and return valid configuration
 
-        provider = config.get("provider")
-        if provider == Email.CUSTOM_PROVIDER_KEY:
-            return {
-                "server": config.get("server"),
-                "port": config.get("port"),
-                "ssl": config.get("ssl"),
-                "tls": config.get("tls"),
-                "sender": config.get("sender"),
-                "login": config.get("login"),
-                "password": config.get("password"),
-            }
+        Args:
+            check_relay (bool, optional): check smtp relay is configured. Defaults to True.
 
-        return {
-            "server": Email.PROVIDERS.get(provider).get("server"),
-            "port": Email.PROVIDERS.get(provider).get("port"),
-            "ssl": Email.PROVIDERS.get(provider).get("ssl"),
-            "tls": Email.PROVIDERS.get(provider).get("tls"),
-            "sender": config.get("sender"),
-            "login": config.get("login"),
-            "password": config.get("password"),
-        }
+        Returns:
+            dict: current configuration ready to be used to send mail (see get_send_config)
+
+        Raises:
+            MissingParameter: if inconsistent configuration value found
+        """
+        return get_send_config(self._get_config(), check_relay)
 
     def set_config(
         self,
@@ -386,76 +607,358 @@ class Email(CleepRenderer):
         Returns:
             bool: True if config saved successfully
         """
+        self._check_parameters(
+            get_config_parameters(provider, server, port, login, password, tls, ssl, sender)
+        )
+
+        return self.__update_send_config(
+            {
+                "provider": provider,
+                "server": server,
+                "port": port,
+                "login": login,
+                "password": password,
+                "tls": tls,
+                "ssl": ssl,
+                "sender": sender,
+            }
+        )
+
+    def __update_send_config(self, values):
+        """
+        Update configuration used to send emails
+
+        Send configuration snapshot is replaced and a new session is pre-warmed.
+
+        Args:
+            values (dict): configuration values to update
+
+        Returns:
+            bool: True if config saved successfully
+        """
+        saved = self.__send_config.update(lambda: self._update_config(values))
+        self.__prewarm()
+
+        return saved
+
+    def set_timeouts(self, connect=10, tls=10, auth=10, data=60, adaptive=False):
+        """
+        Set smtp session timeouts
+
+        In adaptive mode, timeouts are derived from durations observed on the relay
+        and configured timeouts are used as upper bounds.
+
+        Args:
+            connect (int, optional): connection timeout in seconds. Defaults to 10.
+            tls (int, optional): StartTLS timeout in seconds. Defaults to 10.
+            auth (int, optional): authentication timeout in seconds. Defaults to 10.
+            data (int, optional): message sending timeout in seconds. Defaults to 60.
+            adaptive (bool, optional): derive timeouts from observed durations. Defaults to False.
+
+        Returns:
+            bool: True if config saved successfully
+        """
+        timeouts = {"connect": connect, "tls": tls, "auth": auth, "data": data}
         self._check_parameters(
             [
                 {
-                    "name": "provider",
-                    "value": provider,
-                    "type": str,
-                    "validator": lambda val: val in Email.PROVIDERS or val == Email.CUSTOM_PROVIDER_KEY,
-                    "message": "Provider must be choosen from list",
-                },
+                    "name": name,
+                    "value": value,
+                    "type": int,
+                    "validator": lambda val: val > 0,
+                }
+                for name, value in timeouts.items()
+            ]
+            + [
                 {
-                    "name": "server",
-                    "value": server,
-                    "type": str,
-                    "none": True,
-                    "empty": False,
+                    "name": "adaptive",
+                    "value": adaptive,
+                    "type": bool,
                 },
+            ]
+        )
+
+        return self.__update_send_config(
+            {
+                "timeouts": timeouts,
+                "adaptivetimeouts": adaptive,
+            }
+        )
+
+    def get_relay_latencies(self):
+        """
+        Return durations observed for each smtp session phase
+
+        Returns:
+            dict: statistics per relay and phase (see RelayLatencies.get_stats)
+        """
+        return self.__sessions.latencies.get_stats()
+
+    def enable_profiling(self, sends=10, memory=False):
+        """
+        Profile next sends (cProfile, and tracemalloc if memory is enabled)
+
+        Stats files are written to module data directory.
+
+        Args:
+            sends (int, optional): number of sends to profile. Defaults to 10.
+            memory (bool, optional): also trace memory allocations. Defaults to False.
+
+        Returns:
+            bool: True if profiling is enabled
+        """
+        self._check_parameters(
+            [
                 {
-                    "name": "port",
-                    "value": port,
+                    "name": "sends",
+                    "value": sends,
                     "type": int,
-                    "none": True,
+                    "validator": lambda val: val > 0,
+                    "message": "Number of sends to profile must be greater than 0",
                 },
                 {
-                    "name": "login",
-                    "value": login,
+                    "name": "memory",
+                    "value": memory,
+                    "type": bool,
+                },
+            ]
+        )
+
+        self.__profiler.enable(sends, memory)
+
+        return True
+
+    def disable_profiling(self):
+        """
+        Stop profiling sends
+
+        Returns:
+            bool: True if profiling is disabled
+        """
+        self.__profiler.disable()
+
+        return True
+
+    def get_profiling_status(self):
+        """
+        Return profiling status
+
+        Returns:
+            dict: profiling status (see SendProfiler.get_status)
+        """
+        return self.__profiler.get_status()
+
+    def set_delivery_backend(self, backend, capture_path=None, capture_format="maildir"):
+        """
+        Set backend emails are delivered to
+
+        Capture and null backends do not send emails: capture backend stores messages in
+        a local mailbox and null backend drops them. Both count delivered bytes and timings.
+
+        Args:
+            backend (str): delivery backend (smtp, capture or null)
+            capture_path (str, optional): maildir directory or mbox file. Defaults to module data directory.
+            capture_format (str, optional): capture mailbox format (maildir or mbox). Defaults to maildir.
+
+        Returns:
+            bool: True if config saved successfully
+        """
+        self._check_parameters(get_delivery_parameters(backend, capture_path, capture_format))
+
+        saved = self._update_config(
+            {
+                "delivery": backend,
+                "capturepath": capture_path,
+                "captureformat": capture_format,
+            }
+        )
+        self.__send_config.update(self.__configure_delivery_backend)
+
+        return saved
+
+    def get_delivery_stats(self):
+        """
+        Return delivery backend statistics
+
+        Returns:
+            dict: statistics (see DeliveryBackend.get_stats) or None if emails are sent through smtp
+        """
+        delivery = self.__sender.delivery
+        return delivery.get_stats() if delivery else None
+
+    def set_dsn(self, enabled):
+        """
+        Request delivery status notifications (DSN) for failed or delayed recipients
+
+        Notifications are only requested from relays supporting DSN extension.
+
+        Args:
+            enabled (bool): request delivery status notifications
+
+        Returns:
+            bool: True if config saved successfully
+        """
+        self._check_parameters(
+            [
+                {
+                    "name": "enabled",
+                    "value": enabled,
+                    "type": bool,
+                },
+            ]
+        )
+
+        return self.__update_send_config({"dsn": enabled})
+
+    def get_delivery_status(self, message_id=None):
+        """
+        Return per-recipient delivery status of sent emails
+
+        Args:
+            message_id (str, optional): return status of this message only. Defaults to None (all messages).
+
+        Returns:
+            list|dict: messages delivery status (see DeliveryStatusIndex.get_entries) or message
+                       delivery status if message_id is specified
+
+        Raises:
+            CommandError: if message is unknown
+        """
+        self._check_parameters(
+            [
+                {
+                    "name": "message_id",
+                    "value": message_id,
                     "type": str,
                     "none": True,
-                    "empty": True,
                 },
+            ]
+        )
+
+        return self.__tracker.get_status(message_id)
+
+    def set_bounce_poller(
+        self,
+        protocol=None,
+        server=None,
+        port=None,
+        ssl=True,
+        login=None,
+        password=None,
+        mailbox="INBOX",
+        interval=300,
+    ):
+        """
+        Configure mailbox polled for delivery status notifications (bounces)
+
+        Only messages received after first poll are fetched, and each message is fetched once.
+
+        Args:
+            protocol (str, optional): mailbox protocol (imap or pop). Defaults to None (poller disabled).
+            server (str, optional): mailbox server address. Defaults to None.
+            port (int, optional): mailbox server port. Defaults to None.
+            ssl (bool, optional): connect using ssl. Defaults to True.
+            login (str, optional): mailbox login. Defaults to None.
+            password (str, optional): mailbox password. Defaults to None.
+            mailbox (str, optional): imap mailbox bounces are received in. Defaults to INBOX.
+            interval (int, optional): polling interval in seconds. Defaults to 300.
+
+        Returns:
+            bool: True if config saved successfully
+        """
+        self._check_parameters(
+            [
                 {
-                    "name": "password",
-                    "value": password,
+                    "name": "protocol",
+                    "value": protocol,
                     "type": str,
                     "none": True,
-                    "empty": True,
+                    "validator": lambda val: val in BOUNCE_PROTOCOLS,
+                    "message": "Protocol must be imap or pop",
                 },
+            ]
+        )
+
+        poller = None
+        if protocol:
+            self._check_parameters(
+                get_poller_parameters(server, port, ssl, login, password, mailbox, interval)
+            )
+            poller = {
+                "protocol": protocol,
+                "server": server,
+                "port": port,
+                "ssl": ssl,
+                "login": login,
+                "password": password,
+                "mailbox": mailbox,
+                "interval": interval,
+            }
+
+        saved = self._update_config({"bouncepoller": poller})
+        # state of previous mailbox is meaningless
+        self.__tracker.configure_poller(poller, reset_state=True)
+
+        return saved
+
+    def poll_bounces(self):
+        """
+        Poll bounces mailbox now
+
+        Returns:
+            int: number of recipients delivery status found
+
+        Raises:
+            CommandError: if bounce poller is not configured or mailbox polling failed
+        """
+        return self.__tracker.poll()
+
+    def set_image_transform(self, enabled, max_dimension=1280, quality=75):
+        """
+        Configure transform (resize, recompression and metadata removal) of image attachments
+
+        Args:
+            enabled (bool): enable image transform
+            max_dimension (int, optional): maximum width or height of images. Defaults to 1280.
+            quality (int, optional): JPEG quality (1-95). Defaults to 75.
+
+        Returns:
+            bool: True if config saved successfully
+        """
+        self._check_parameters(
+            [
                 {
-                    "name": "tls",
-                    "value": tls,
+                    "name": "enabled",
+                    "value": enabled,
                     "type": bool,
-                    "none": False,
                 },
                 {
-                    "name": "ssl",
-                    "value": ssl,
-                    "type": bool,
-                    "none": False,
+                    "name": "max_dimension",
+                    "value": max_dimension,
+                    "type": int,
+                    "validator": lambda val: val > 0,
                 },
                 {
-                    "name": "sender",
-                    "value": sender,
-                    "type": str,
-                    "none": True,
-                    "empty": False,
+                    "name": "quality",
+                    "value": quality,
+                    "type": int,
+                    "validator": lambda val: 1 <= val <= 95,
                 },
             ]
         )
+        if enabled and not ImageTransformer.is_available():
+            raise CommandError("Image transform requires Pillow library")
 
-        return self._update_config(
+        saved = self._update_config(
             {
-                "provider": provider,
-                "server": server,
-                "port": port,
-                "login": login,
-                "password": password,
-                "tls": tls,
-                "ssl": ssl,
-                "sender": sender,
+                "imagetransform": enabled,
+                "imagemaxdimension": max_dimension,
+                "imagequality": quality,
             }
         )
+        self.__configure_image_transformer()
+
+        return saved
 
     def on_render(self, profile_name, profile_values):
         """
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import uuid
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .journal import JsonLinesJournal
+
+
+class EmailScheduler:
+    """
+    Persistent scheduler of delayed emails
+
+    Pending emails are kept in a heap ordered by send time so adding, cancelling and
+    dispatching cost O(log n). Cancelled emails are dropped from the heap lazily.
+    A single thread sleeps until next send time (or until a sooner email is added).
+    Sleeps are capped to MAX_WAIT because send times are wall clock timestamps while
+    waits use monotonic clock: a wall clock step (NTP sync at boot) is caught up quickly.
+
+    Scheduled emails are persisted in an append-only journal of add/remove records,
+    compacted at startup and when it contains too many removed records. Emails are
+    removed from journal once sent, so an email being sent during a crash is sent again.
+    """
+
+    COMPACT_MIN_RECORDS = 1000
+    MAX_WAIT = 60.0
+
+    def __init__(self, filepath, cleep_filesystem, callback, workers=1):
+        """
+        Constructor
+
+        Args:
+            filepath (str): journal file path
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+            callback (callable): function called with email parameters (dict) when email is due
+            workers (int, optional): number of emails sent concurrently. Defaults to 1.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.filepath = filepath
+        self.callback = callback
+        self.workers = workers
+        self.__entries = {}
+        self.__dispatching = {}
+        self.__heap = []
+        self.__journal = JsonLinesJournal(filepath, cleep_filesystem)
+        self.__condition = threading.Condition()
+        self.__running = False
+        self.__thread = None
+        self.__executor = None
+
+    def start(self):
+        """
+        Load persisted emails and start scheduler
+        """
+        with self.__condition:
+            self.__load()
+            self.__compact()
+            self.__running = True
+        self.__executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="EmailScheduled"
+        )
+        self.__thread = threading.Thread(
+            target=self.__run, name="EmailScheduler", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop scheduler without waiting for emails being sent. Pending emails are kept
+        in journal.
+        """
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
+        if self.__thread:
+            self.__thread.join()
+        if self.__executor:
+            # not started emails are still in journal, they are sent at next start
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def add(self, send_at, params):
+        """
+        Schedule email
+
+        Args:
+            send_at (float): send timestamp
+            params (dict): email parameters (must be json serializable)
+
+        Returns:
+            str: scheduled email id
+        """
+        entry = {"id": uuid.uuid4().hex, "sendat": send_at, "params": params}
+        with self.__condition:
+            # entry is indexed before being written, in case journal is compacted
+            self.__entries[entry["id"]] = entry
+            self.__write({"op": "add", **entry})
+            heapq.heappush(self.__heap, (send_at, entry["id"]))
+            if self.__heap[0][1] == entry["id"]:
+                self.__condition.notify()
+
+        return entry["id"]
+
+    def cancel(self, scheduled_id):
+        """
+        Cancel scheduled email
+
+        Args:
+            scheduled_id (str): scheduled email id
+
+        Returns:
+            bool: True if email was cancelled, False if it does not exist or is already sent
+        """
+        with self.__condition:
+            if self.__entries.pop(scheduled_id, None) is None:
+                return False
+            self.__write({"op": "remove", "id": scheduled_id})
+            # rebuild heap if it is mostly made of cancelled entries
+            if len(self.__heap) > 2 * len(self.__entries) + 64:
+                self.__heap = [item for item in self.__heap if item[1] in self.__entries]
+                heapq.heapify(self.__heap)
+
+        return True
+
+    def get_entries(self):
+        """
+        Return scheduled emails
+
+        Returns:
+            list: scheduled emails sorted by send time::
+
+                [
+                    {
+                        id (str): scheduled email id
+                        sendat (float): send timestamp
+                        params (dict): email parameters
+                    },
+                    ...
+                ]
+
+        """
+        with self.__condition:
+            entries = list(self.__entries.values())
+        return sorted(entries, key=lambda entry: entry["sendat"])
+
+    def __run(self):
+        """
+        Scheduler thread
+        """
+        with self.__condition:
+            while self.__running:
+                if not self.__heap:
+                    self.__condition.wait()
+                    continue
+
+                send_at, scheduled_id = self.__heap[0]
+                if scheduled_id not in self.__entries:
+                    heapq.heappop(self.__heap)
+                    continue
+                delay = send_at - time.time()
+                if delay > 0:
+                    self.__condition.wait(min(delay, EmailScheduler.MAX_WAIT))
+                    continue
+
+                heapq.heappop(self.__heap)
+                entry = self.__entries.pop(scheduled_id)
+                # kept in journal until sent
+                self.__dispatching[scheduled_id] = entry
+                self.__executor.submit(self.__dispatch, entry)
+
+    def __dispatch(self, entry):
+        """
+        Send due email and remove it from journal
+
+        Args:
+            entry (dict): scheduled email
+        """
+        try:
+            self.callback(entry["params"])
+        except Exception:
+            self.logger.exception('Scheduled email "%s" failed', entry["id"])
+        with self.__condition:
+            del self.__dispatching[entry["id"]]
+            self.__write({"op": "remove", "id": entry["id"]})
+
+    def __load(self):
+        """
+        Load journal
+        """
+        for record in self.__journal.load():
+            if record["op"] == "add":
+                self.__entries[record["id"]] = {
+                    "id": record["id"],
+                    "sendat": record["sendat"],
+                    "params": record["params"],
+                }
+            else:
+                self.__entries.pop(record["id"], None)
+        self.__heap = [(entry["sendat"], entry["id"]) for entry in self.__entries.values()]
+        heapq.heapify(self.__heap)
+
+    def __compact(self):
+        """
+        Rewrite journal with pending and being sent emails only
+        """
+        self.__journal.rewrite(
+            [
+                {"op": "add", **entry}
+                for entry in list(self.__entries.values()) + list(self.__dispatching.values())
+            ]
+        )
+
+    def __write(self, record):
+        """
+        Append record to journal, compacting it when needed
+
+        Args:
+            record (dict): journal record
+        """
+        self.__journal.append(record)
+        if self.__journal.records > max(
+            EmailScheduler.COMPACT_MIN_RECORDS,
+            4 * (len(self.__entries) + len(self.__dispatching)),
+        ):
+            self.__compact()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = None
+    ImageOps = None
+
+# image formats handled by transform and their Pillow save options
+SUPPORTED_TYPES = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+}
+
+
+def transform_image(filepath, image_format, max_dimension, quality):
+    """
+    Resize, recompress and strip metadata of specified image
+
+    This function is executed in a separate process.
+
+    Args:
+        filepath (str): image path
+        image_format (str): Pillow output format (JPEG, PNG)
+        max_dimension (int): maximum width or height of output image
+        quality (int): JPEG quality (1-95)
+
+    Returns:
+        tuple: original size (int), transformed image content (bytes) and duration in seconds (float)
+    """
+    start = time.monotonic()
+    with Image.open(filepath) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        # info holds metadata written back by save (comment, icc profile, exif, dpi...)
+        image.info.clear()
+        output = io.BytesIO()
+        if image_format == "JPEG":
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+        else:
+            image.save(output, format="PNG", optimize=True)
+
+    return os.path.getsize(filepath), output.getvalue(), time.monotonic() - start
+
+
+class ImageTransformer:
+    """
+    Transform image attachments in a process pool and cache the results
+
+    Transformed images are cached by source path and modification time.
+    """
+
+    def __init__(self, max_dimension, quality, workers=1, cache_size=20):
+        """
+        Constructor
+
+        Args:
+            max_dimension (int): maximum width or height of transformed images
+            quality (int): JPEG quality of transformed images
+            workers (int, optional): number of transform processes. Defaults to 1.
+            cache_size (int, optional): number of transformed images kept in cache. Defaults to 20.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.workers = workers
+        self.cache_size = cache_size
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__executor = None
+
+    @staticmethod
+    def is_available():
+        """
+        Return True if image transform dependencies are installed
+
+        Returns:
+            bool: True if transform is available
+        """
+        return Image is not None
+
+    @staticmethod
+    def is_supported(ctype):
+        """
+        Return True if content type can be transformed
+
+        Args:
+            ctype (str): content type
+
+        Returns:
+            bool: True if content type is supported
+        """
+        return ctype in SUPPORTED_TYPES
+
+    def submit(self, filepath, ctype):
+        """
+        Submit image transform
+
+        Args:
+            filepath (str): image path
+            ctype (str): image content type
+
+        Returns:
+            Future: future resolving to transform_image result. Result duration is 0 if cached.
+        """
+        stat = os.stat(filepath)
+        key = (filepath, stat.st_mtime_ns, stat.st_size, self.max_dimension, self.quality)
+        with self.__lock:
+            if key in self.__cache:
+                self.__cache.move_to_end(key)
+                future = Future()
+                future.set_result((stat.st_size, self.__cache[key], 0.0))
+                return future
+
+            if self.__executor is None:
+                # forking a multithreaded process may deadlock in child
+                self.__executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+                )
+            future = self.__executor.submit(
+                transform_image,
+                filepath,
+                SUPPORTED_TYPES[ctype],
+                self.max_dimension,
+                self.quality,
+            )
+
+        future.add_done_callback(lambda done: self.__cache_result(key, done))
+        return future
+
+    def __cache_result(self, key, future):
+        """
+        Store transform result in cache
+
+        Args:
+            key (tuple): cache key
+            future (Future): transform future
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self.__lock:
+            self.__cache[key] = future.result()[1]
+            while len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+
+    def shutdown(self):
+        """
+        Stop transform processes
+        """
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False, cancel_futures=True)
+                self.__executor = None
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from collections import OrderedDict
+from email.message import MIMEPart
+
+
+class InlineResourceCache:
+    """
+    Bounded cache of encoded inline (Content-ID) MIME parts
+
+    Parts are indexed by file path, modification time, size, content id and
+    transfer encoding options so the same resource is encoded once and its part
+    reused by all messages referencing it. Cached parts must not be modified.
+    """
+
+    def __init__(self, max_size=20):
+        """
+        Constructor
+
+        Args:
+            max_size (int, optional): maximum number of cached parts. Defaults to 20.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__parts = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get_part(self, filepath, cid, ctype, content_options=None):
+        """
+        Return encoded inline part of specified file
+
+        Args:
+            filepath (str): resource path
+            cid (str): content id referenced in html content as "cid:<cid>"
+            ctype (str): resource content type
+            content_options (dict, optional): set_content extra options (transfer encoding). Defaults to None.
+
+        Returns:
+            MIMEPart: encoded part
+        """
+        content_options = content_options or {}
+        stat = os.stat(filepath)
+        key = (
+            filepath,
+            stat.st_mtime_ns,
+            stat.st_size,
+            cid,
+            ctype,
+            tuple(sorted(content_options.items())),
+        )
+        with self.__lock:
+            if key in self.__parts:
+                self.hits += 1
+                self.__parts.move_to_end(key)
+                return self.__parts[key]
+            self.misses += 1
+
+        maintype, subtype = ctype.split("/", 1)
+        part = MIMEPart()
+        with open(filepath, "rb") as filep:
+            part.set_content(
+                filep.read(),
+                maintype=maintype,
+                subtype=subtype,
+                disposition="inline",
+                filename=os.path.basename(filepath),
+                cid=f"<{cid}>",
+                **content_options,
+            )
+
+        with self.__lock:
+            self.__parts[key] = part
+            while len(self.__parts) > self.max_size:
+                self.__parts.popitem(last=False)
+
+        return part
+
+    def clear(self):
+        """
+        Clear cache
+        """
+        with self.__lock:
+            self.__parts.clear()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+
+
+class JsonLinesJournal:
+    """
+    Append-only journal of json records, one record per line
+
+    Owner replays records at startup and rewrites journal with its current state
+    (compaction) when it contains too many obsolete records. Journal is not thread
+    safe, owner serializes calls.
+
+    Writes go through cleep filesystem (root filesystem may be read-only), journal file
+    is only opened while a record is written.
+    """
+
+    def __init__(self, filepath, cleep_filesystem):
+        """
+        Constructor
+
+        Args:
+            filepath (str): journal file path
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.filepath = filepath
+        self.cleep_filesystem = cleep_filesystem
+        self.records = 0
+
+    def load(self):
+        """
+        Read journal records
+
+        Yields:
+            dict: journal record
+        """
+        if not os.path.exists(self.filepath):
+            return
+
+        with open(self.filepath, "r", encoding="utf-8") as filep:
+            for line in filep:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last record may be truncated after a crash
+                    self.logger.warning('Invalid record dropped from "%s"', self.filepath)
+                    continue
+                yield record
+
+    def rewrite(self, records):
+        """
+        Replace journal content with specified records
+
+        Args:
+            records (list): journal records
+        """
+        self.__make_dir()
+        tmp_filepath = self.filepath + ".tmp"
+        filep = self.cleep_filesystem.open(tmp_filepath, "w", encoding="utf-8")
+        try:
+            for record in records:
+                filep.write(json.dumps(record) + "\n")
+        finally:
+            self.cleep_filesystem.close(filep)
+        self.cleep_filesystem.rename(tmp_filepath, self.filepath)
+        self.records = len(records)
+
+    def append(self, record):
+        """
+        Append record to journal
+
+        Args:
+            record (dict): journal record
+        """
+        self.__make_dir()
+        filep = self.cleep_filesystem.open(self.filepath, "a", encoding="utf-8")
+        try:
+            filep.write(json.dumps(record) + "\n")
+        finally:
+            self.cleep_filesystem.close(filep)
+        self.records += 1
+
+    def __make_dir(self):
+        """
+        Create journal directory if necessary
+        """
+        dirpath = os.path.dirname(self.filepath)
+        if not os.path.exists(dirpath):
+            self.cleep_filesystem.mkdir(dirpath, True)
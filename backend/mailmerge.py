@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import html
+import json
+import time
+import logging
+import smtplib
+import threading
+from collections import deque
+from string import Template
+from cleep.exception import CommandError
+from .deliverybackends import DeliveryBackend
+
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson", ".json")
+
+
+def get_mail_merge_parameters(filepath, subject, content, recipient_field, sender):
+    """
+    Return mail merge parameters, to be checked with _check_parameters
+
+    Args:
+        filepath (str): recipients file path
+        subject (str): email subject template
+        content (str): email content template
+        recipient_field (str): field containing recipient email
+        sender (str): overwrite default sender
+
+    Returns:
+        list: parameters description
+    """
+    return [
+        {
+            "name": "filepath",
+            "value": filepath,
+            "type": str,
+            "validator": os.path.isfile,
+            "message": "Recipients file does not exist",
+        },
+        {"name": "subject", "value": subject, "type": str, "empty": False},
+        {"name": "content", "value": content, "type": str, "empty": False},
+        {"name": "recipient_field", "value": recipient_field, "type": str, "empty": False},
+        {"name": "sender", "value": sender, "type": str, "empty": False, "none": True},
+    ]
+
+
+def read_recipients(filepath):
+    """
+    Iterate over recipients of a CSV (with header) or JSON lines file
+
+    Records are read one at a time so memory usage does not depend on file size.
+
+    Args:
+        filepath (str): recipients file path
+
+    Yields:
+        dict: recipient fields (JSON lines records are yielded as parsed, they may not be objects)
+    """
+    if filepath.lower().endswith(JSON_LINES_EXTENSIONS):
+        with open(filepath, "r", encoding="utf-8") as filep:
+            for line in filep:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        return
+
+    with open(filepath, "r", encoding="utf-8", newline="") as filep:
+        yield from csv.DictReader(filep)
+
+
+def count_recipients(filepath):
+    """
+    Count recipients of file without loading it
+
+    Args:
+        filepath (str): recipients file path
+
+    Returns:
+        int: number of recipients
+    """
+    return sum(1 for _ in read_recipients(filepath))
+
+
+def render(template, fields, escape=False):
+    """
+    Render template with recipient fields
+
+    Fields are referenced as $field or ${field}. Unknown fields are left untouched.
+
+    Args:
+        template (string.Template): template
+        fields (dict): recipient fields
+        escape (bool, optional): escape field values for html. Defaults to False.
+
+    Returns:
+        str: rendered template
+    """
+    values = {key: "" if value is None else str(value) for key, value in fields.items()}
+    if escape:
+        values = {key: html.escape(value) for key, value in values.items()}
+    return template.safe_substitute(values)
+
+
+class MailMergeProgress:
+    """
+    Progress of a mail merge
+    """
+
+    MAX_ERRORS = 10
+
+    def __init__(self, filepath, total):
+        """
+        Constructor
+
+        Args:
+            filepath (str): recipients file path
+            total (int): number of recipients
+        """
+        self.filepath = filepath
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.running = True
+        self.errors = deque(maxlen=MailMergeProgress.MAX_ERRORS)
+        self.__started_at = time.monotonic()
+        self.__ended_at = None
+        self.__cancelled = threading.Event()
+        self.__lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        """
+        Return True if mail merge was cancelled
+        """
+        return self.__cancelled.is_set()
+
+    def cancel(self):
+        """
+        Cancel mail merge
+        """
+        self.__cancelled.set()
+
+    def add_sent(self):
+        """
+        Count sent email
+        """
+        with self.__lock:
+            self.sent += 1
+
+    def add_failed(self, index, error):
+        """
+        Count failed email
+
+        Args:
+            index (int): recipient index in file
+            error (str): failure reason
+        """
+        with self.__lock:
+            self.failed += 1
+            self.errors.append({"index": index, "error": error})
+
+    def add_error(self, error):
+        """
+        Store error not related to a recipient (mail merge aborted)
+
+        Args:
+            error (str): error
+        """
+        with self.__lock:
+            self.errors.append({"index": None, "error": error})
+
+    def finish(self):
+        """
+        End mail merge
+        """
+        with self.__lock:
+            self.running = False
+            self.__ended_at = time.monotonic()
+
+    def get_status(self):
+        """
+        Return mail merge status
+
+        Returns:
+            dict: status::
+
+                {
+                    filepath (str): recipients file path
+                    running (bool): True if mail merge is running
+                    cancelled (bool): True if mail merge was cancelled
+                    total (int): number of recipients
+                    processed (int): number of processed recipients
+                    sent (int): number of sent emails
+                    failed (int): number of failed emails
+                    rate (float): processed recipients per second
+                    eta (float): estimated remaining time in seconds (None if unknown)
+                    errors (list): latest errors ({index (int), error (str)}), index is None if mail merge aborted
+                }
+
+        """
+        with self.__lock:
+            processed = self.sent + self.failed
+            duration = (self.__ended_at or time.monotonic()) - self.__started_at
+            rate = processed / duration if duration > 0 else 0.0
+            eta = None
+            if not self.running:
+                eta = 0.0
+            elif rate > 0:
+                eta = (self.total - processed) / rate
+
+            return {
+                "filepath": self.filepath,
+                "running": self.running,
+                "cancelled": self.cancelled,
+                "total": self.total,
+                "processed": processed,
+                "sent": self.sent,
+                "failed": self.failed,
+                "rate": rate,
+                "eta": eta,
+                "errors": list(self.errors),
+            }
+
+
+
+class MailMerge:
+    """
+    Send mail merge emails in background, one mail merge at a time
+    """
+
+    def __init__(self, sender):
+        """
+        Constructor
+
+        Args:
+            sender (MessageSender): message sender
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.sender = sender
+        self.__progress = None
+        self.__lock = threading.Lock()
+
+    def start(self, filepath, config, subject, content, recipient_field, sender):
+        """
+        Start mail merge
+
+        Args:
+            filepath (str): recipients file path
+            config (dict): send configuration snapshot
+            subject (str): email subject template
+            content (str): email content template
+            recipient_field (str): field containing recipient email
+            sender (str): overwrite default sender
+
+        Raises:
+            CommandError: if a mail merge is already running or recipients file is invalid
+        """
+        with self.__lock:
+            if self.__progress and self.__progress.running:
+                raise CommandError("A mail merge is already running")
+            try:
+                total = count_recipients(filepath)
+            except Exception as error:
+                self.logger.exception('Unable to read recipients file "%s"', filepath)
+                raise CommandError("Invalid recipients file") from error
+            self.__progress = MailMergeProgress(filepath, total)
+
+        threading.Thread(
+            target=self.__run,
+            args=(
+                self.__progress,
+                config,
+                Template(subject),
+                Template(content),
+                recipient_field,
+                sender,
+            ),
+            name="EmailMailMerge",
+            daemon=True,
+        ).start()
+
+    def get_status(self):
+        """
+        Return status of current or last mail merge
+
+        Returns:
+            dict: mail merge status (see MailMergeProgress.get_status) or None if no mail merge was started
+        """
+        with self.__lock:
+            return self.__progress.get_status() if self.__progress else None
+
+    def cancel(self):
+        """
+        Cancel running mail merge
+
+        Returns:
+            bool: True if a running mail merge was cancelled
+        """
+        with self.__lock:
+            if not self.__progress or not self.__progress.running:
+                return False
+            self.__progress.cancel()
+            return True
+
+    def __run(self, progress, config, subject, content, recipient_field, sender):
+        """
+        Send mail merge emails reusing the same session
+
+        Args:
+            progress (MailMergeProgress): mail merge progress
+            config (dict): send configuration snapshot
+            subject (Template): subject template
+            content (Template): content template
+            recipient_field (str): field containing recipient email
+            sender (str): overwrite default sender
+        """
+        smtp_server = None
+        body_type, chunking = None, False
+        try:
+            for index, fields in enumerate(read_recipients(progress.filepath)):
+                if progress.cancelled:
+                    break
+                if not isinstance(fields, dict):
+                    progress.add_failed(index, "Recipient record is not an object")
+                    continue
+                if not fields.get(recipient_field):
+                    progress.add_failed(index, f'No "{recipient_field}" field')
+                    continue
+
+                for attempt in range(2):
+                    if smtp_server is None:
+                        # unable to open session aborts mail merge
+                        smtp_server, body_type, chunking = self.sender.open_delivery(config)
+                    try:
+                        mail, report = self.sender.build_message(
+                            config,
+                            render(subject, fields),
+                            render(content, fields, escape=True),
+                            fields[recipient_field],
+                            [],
+                            sender,
+                            None,
+                            body_type,
+                        )
+                        self.sender.deliver(
+                            config, smtp_server, mail, report["messageid"], body_type, chunking
+                        )
+                        progress.add_sent()
+                        break
+                    except smtplib.SMTPServerDisconnected as error:
+                        # server may limit number of emails per session, retry once on new session
+                        smtp_server = None
+                        if attempt > 0:
+                            progress.add_failed(index, str(error) or "Server disconnected")
+                    except (
+                        smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPSenderRefused,
+                        smtplib.SMTPDataError,
+                    ) as error:
+                        progress.add_failed(index, str(error))
+                        if not isinstance(smtp_server, DeliveryBackend):
+                            try:
+                                smtp_server.rset()
+                            except Exception:
+                                self.sender.sessions.close(smtp_server)
+                                smtp_server = None
+                        break
+                    except Exception as error:
+                        self.logger.exception("Mail merge email failed:")
+                        progress.add_failed(index, str(error))
+                        self.sender.sessions.close(smtp_server)
+                        smtp_server = None
+                        break
+        except Exception as error:
+            self.logger.exception("Mail merge failed:")
+            progress.add_error(str(error))
+        finally:
+            if smtp_server:
+                self.sender.sessions.close(smtp_server)
+            progress.finish()
+            self.logger.info("Mail merge terminated: %s", progress.get_status())
@@ -0,0 +1,613 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import smtplib
+import mimetypes
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from email.message import EmailMessage
+from email.utils import make_msgid, parseaddr
+from cleep.exception import CommandError
+from .imagetransform import ImageTransformer
+from .inlineresources import InlineResourceCache
+from .deliverybackends import DeliveryBackend, CaptureBackend, NullBackend
+from .sendworker import SendCancelled
+from .smtptimeouts import PhaseTimeout
+from .smtptransfer import (
+    get_transfer_mode,
+    set_text_content,
+    get_bytes_content_options,
+    get_envelope,
+    is_dsn_supported,
+    serialize_message,
+    send_data,
+    stream_data,
+)
+
+
+def is_valid_attachment(attachment):
+    """
+    Check attachment format
+
+    Args:
+        attachment (any): attachment to check
+
+    Returns:
+        bool: True if attachment is a filepath or a valid in-memory attachment
+    """
+    if isinstance(attachment, str):
+        return True
+    if not isinstance(attachment, dict) or not isinstance(attachment.get("filename"), str):
+        return False
+    mimetype = attachment.get("mimetype")
+    if mimetype is not None and (not isinstance(mimetype, str) or "/" not in mimetype):
+        return False
+    content = attachment.get("content")
+    return isinstance(content, (bytes, bytearray, memoryview)) or callable(getattr(content, "read", None))
+
+
+def get_domain(address):
+    """
+    Return domain of email address, used to generate Message-ID
+
+    Args:
+        address (str): email address
+
+    Returns:
+        str: address domain or "localhost" if address has no domain
+    """
+    _, email = parseaddr(address or "")
+    return email.rpartition("@")[2] or "localhost"
+
+
+def get_content_type(filepath):
+    """
+    Guess content type of specified file
+
+    Args:
+        filepath (str): file path
+
+    Returns:
+        str: content type. Defaults to application/octet-stream.
+    """
+    ctype, encoding = mimetypes.guess_type(filepath)
+    if ctype is None or encoding is not None:
+        ctype = "application/octet-stream"
+    return ctype
+
+
+def get_message_parameters(subject, content, recipient, cc, bcc, sender, inline_images):
+    """
+    Return parameters shared by commands sending a message, to be checked with _check_parameters
+
+    Args:
+        subject (str): email subject
+        content (str): email content
+        recipient (str): coma separated recipients
+        cc (str): coma separated carbon copy recipients
+        bcc (str): coma separated blind carbon copy recipients
+        sender (str): overwrite default sender
+        inline_images (dict): inline images indexed by content id
+
+    Returns:
+        list: parameters description
+    """
+    return [
+        {"name": "subject", "value": subject, "type": str, "empty": False},
+        {"name": "content", "value": content, "type": str, "empty": False},
+        {"name": "recipient", "value": recipient, "type": str, "empty": False},
+        {"name": "cc", "value": cc, "type": str, "none": True},
+        {"name": "bcc", "value": bcc, "type": str, "none": True},
+        {"name": "sender", "value": sender, "type": str, "empty": False, "none": True},
+        {
+            "name": "inline_images",
+            "value": inline_images,
+            "type": dict,
+            "none": True,
+            "validator": lambda val: all(
+                isinstance(k, str) and isinstance(v, str) for k, v in val.items()
+            ),
+        },
+    ]
+
+
+class MessageSender:
+    """
+    Build messages and deliver them through smtp relay or configured delivery backend
+
+    Recipients delivery status is indexed for each delivered message and a report of
+    latest sent messages is kept.
+    """
+
+    # seconds an attachment waits for its image transform
+    IMAGE_TRANSFORM_TIMEOUT = 30.0
+    # messages with more content bytes are serialized straight to the socket
+    STREAM_MIN_BYTES = 256 * 1024
+
+    def __init__(
+        self, sessions, delivery_status, debug_enabled, reports_size=50, inline_resources_size=20
+    ):
+        """
+        Constructor
+
+        Args:
+            sessions (RelaySessions): relay sessions factory
+            delivery_status (DeliveryStatusIndex): recipients delivery status index
+            debug_enabled (callable): return True to enable smtplib debug output
+            reports_size (int, optional): number of send reports kept. Defaults to 50.
+            inline_resources_size (int, optional): number of inline parts kept in cache. Defaults to 20.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.sessions = sessions
+        self.delivery_status = delivery_status
+        self.debug_enabled = debug_enabled
+        # delivery backend (None to deliver through smtp) and image transformer, set by owner
+        self.delivery = None
+        self.image_transformer = None
+        self.inline_resources = InlineResourceCache(inline_resources_size)
+        self.__reports = deque(maxlen=reports_size)
+
+    def configure_delivery(self, delivery, capture_path, capture_format, cleep_filesystem):
+        """
+        Create delivery backend (None to deliver through smtp)
+
+        Args:
+            delivery (str): delivery backend (smtp, capture or null)
+            capture_path (str): capture backend maildir directory or mbox file
+            capture_format (str): capture backend mailbox format (maildir or mbox)
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+        """
+        previous = self.delivery
+
+        if delivery == CaptureBackend.name:
+            self.delivery = CaptureBackend(capture_path, cleep_filesystem, capture_format)
+        elif delivery == NullBackend.name:
+            self.delivery = NullBackend()
+        else:
+            self.delivery = None
+
+        if previous:
+            previous.close()
+        if self.delivery:
+            self.logger.warning('Emails are not sent, "%s" delivery backend is enabled', delivery)
+
+    def send(
+        self, job, config, subject, content, recipient, cc, bcc, attachments, sender, inline_images
+    ):
+        """
+        Send email (executed by send worker)
+
+        Args:
+            job (SendJob): send job
+            config (dict): send configuration snapshot
+            subject (str): email subject
+            content (str): email content
+            recipient (str): coma separated recipients
+            cc (str): coma separated carbon copy recipients
+            bcc (str): coma separated blind carbon copy recipients
+            attachments (list): list of attachments
+            sender (str): overwrite default sender
+            inline_images (dict): inline images indexed by content id
+
+        Returns:
+            bool: True if message sent successfully
+
+        Raises:
+            CommandError: if email sending failed
+        """
+
+        try:
+            # start image transforms while connecting to server
+            transforms = self.__submit_image_transforms(attachments)
+
+            session, body_type, chunking = self.open_delivery(config, job)
+            self.logger.debug("Transfer mode: body=%s chunking=%s", body_type, chunking)
+
+            try:
+                mail, report = self.build_message(
+                    config,
+                    subject,
+                    content,
+                    recipient,
+                    attachments,
+                    sender,
+                    inline_images,
+                    body_type,
+                    transforms,
+                    cc,
+                    bcc,
+                )
+                job.check()
+                wire_bytes = self.deliver(
+                    config,
+                    session,
+                    mail,
+                    report["messageid"],
+                    body_type,
+                    chunking,
+                    report["payloadbytes"] >= MessageSender.STREAM_MIN_BYTES,
+                )
+            except BaseException:
+                self.sessions.close(session, abort=True)
+                raise
+            if isinstance(session, DeliveryBackend):
+                delivery = session.name
+            else:
+                delivery = "smtp"
+                session.quit()
+
+            report.update({
+                "timestamp": int(time.time()),
+                "delivery": delivery,
+                "bodytype": body_type,
+                "chunking": chunking,
+                "wirebytes": wire_bytes,
+            })
+            self.__add_report(report)
+
+            return True
+
+        except SendCancelled as error:
+            self.logger.warning("Email sending cancelled")
+            raise CommandError("Email sending cancelled") from error
+
+        except PhaseTimeout as error:
+            self.logger.error("Failed to send email: %s", str(error))
+            raise CommandError(
+                f"Smtp server did not answer in time ({error.phase} phase). Please check server address"
+            ) from error
+
+        except smtplib.SMTPServerDisconnected as error:
+            self.logger.exception("Failed to send email:")
+            raise CommandError("Server disconnected") from error
+
+        except smtplib.SMTPSenderRefused as error:
+            self.logger.exception("Failed to send email:")
+            raise CommandError("Email sender must be a valid email address") from error
+
+        except smtplib.SMTPRecipientsRefused as error:
+            self.logger.exception("Failed to send email:")
+            raise CommandError("Some recipients were refused") from error
+
+        except smtplib.SMTPDataError as error:
+            self.logger.exception("Failed to send email:")
+            raise CommandError("Problem with email content") from error
+
+        except smtplib.SMTPConnectError as error:
+            self.logger.exception("Failed to send email:")
+            raise CommandError(
+                "Unable to establish connection with smtp server. Please check server address"
+            ) from error
+
+        except smtplib.SMTPAuthenticationError as error:
+            self.logger.exception("Failed to send email:")
+            raise CommandError("Authentication failed. Please check credentials.") from error
+
+        except Exception as error:
+            self.logger.exception("Failed to send email:")
+            raise CommandError("Unable to send email. Please check configuration") from error
+
+    def build_message(
+        self,
+        config,
+        subject,
+        content,
+        recipient,
+        attachments,
+        sender,
+        inline_images,
+        body_type,
+        transforms=None,
+        cc=None,
+        bcc=None,
+    ):
+        """
+        Build email message
+
+        Args:
+            config (dict): send configuration
+            subject (str): email subject
+            content (str): email content
+            recipient (str): coma separated recipients
+            attachments (list): list of attachments
+            sender (str): overwrite default sender
+            inline_images (dict): inline images indexed by content id
+            body_type (str): negotiated body type
+            transforms (dict, optional): image transform futures indexed by attachment path. Defaults to None.
+            cc (str, optional): coma separated carbon copy recipients. Defaults to None.
+            bcc (str, optional): coma separated blind carbon copy recipients, only used for
+                envelope. Defaults to None.
+
+        Returns:
+            tuple: message (EmailMessage) and partial send report (dict)
+        """
+        transforms = transforms or {}
+        html = f"<html><head></head><body>{content}</body>"
+        payload_bytes = len(html.encode("utf-8"))
+        sender = sender or config.get("sender") or config.get("login")
+        message_id = make_msgid(domain=get_domain(sender))
+        mail = EmailMessage()
+        mail["Subject"] = subject
+        mail["From"] = sender
+        mail["To"] = recipient
+        if cc:
+            mail["Cc"] = cc
+        if bcc:
+            # removed before sending
+            mail["Bcc"] = bcc
+        mail["Message-ID"] = message_id
+        mail.preamble = "You will not see this in a MIME-aware mail reader.\n"
+        set_text_content(mail, html, "html", body_type)
+
+        for cid, filepath in (inline_images or {}).items():
+            if not os.path.isfile(filepath):
+                self.logger.warning('Inline image "%s" not found (%s)', cid, filepath)
+                continue
+            part = self.inline_resources.get_part(
+                filepath,
+                cid,
+                get_content_type(filepath),
+                get_bytes_content_options(body_type),
+            )
+            if mail.get_content_type() != "multipart/related":
+                mail.make_related()
+            mail.attach(part)
+            payload_bytes += os.path.getsize(filepath)
+
+        transform_reports = []
+        missing_attachments = []
+        for attachment in attachments:
+            if isinstance(attachment, str):
+                if not os.path.isfile(attachment):
+                    self.logger.warning('Attachment "%s" not found', attachment)
+                    missing_attachments.append(attachment)
+                    continue
+                filename = os.path.basename(attachment)
+                ctype = get_content_type(attachment)
+                data, transform_report = self.__read_attachment(attachment, transforms.get(attachment))
+                if transform_report:
+                    transform_reports.append(transform_report)
+            else:
+                filename = attachment["filename"]
+                ctype = attachment.get("mimetype") or get_content_type(filename)
+                data = self.__read_buffer(attachment["content"])
+
+            content_options = get_bytes_content_options(body_type)
+            if content_options and isinstance(data, memoryview):
+                # non base64 transfer encodings need bytes
+                data = data.tobytes()
+            maintype, subtype = ctype.split("/", 1)
+            payload_bytes += len(data)
+            mail.add_attachment(
+                data,
+                maintype=maintype,
+                subtype=subtype,
+                filename=filename,
+                **content_options,
+            )
+
+        return mail, {
+            "messageid": message_id,
+            "payloadbytes": payload_bytes,
+            "transforms": transform_reports,
+            "missingattachments": missing_attachments,
+        }
+
+    def open_delivery(self, config, job=None):
+        """
+        Return session to deliver messages: configured delivery backend, pre-warmed
+        smtp session or new smtp session
+
+        Args:
+            config (dict): send configuration snapshot
+            job (SendJob, optional): send job the smtp session is attached to. Defaults to None.
+
+        Returns:
+            tuple: session (DeliveryBackend or RelaySMTP), body type and chunking flag
+        """
+        delivery = self.delivery
+        if delivery:
+            return (delivery, *delivery.get_transfer_mode())
+
+        smtp_server = self.sessions.take_warm_session(config)
+        if smtp_server:
+            self.logger.debug("Use pre-warmed session")
+            if job:
+                job.attach(smtp_server)
+        else:
+            smtp_server = self.sessions.open(config, job, self.debug_enabled())
+
+        return (smtp_server, *get_transfer_mode(smtp_server))
+
+    def deliver(self, config, session, mail, message_id, body_type, chunking, stream=False):
+        """
+        Send message on opened session and index recipients delivery status
+
+        Delivery status notifications are requested when enabled and supported by relay.
+
+        Args:
+            config (dict): send configuration snapshot
+            session (DeliveryBackend|RelaySMTP): delivery backend or connected smtp server instance
+            mail (EmailMessage): message to send
+            message_id (str): message Message-ID
+            body_type (str): negotiated body type
+            chunking (bool): use BDAT instead of DATA
+            stream (bool, optional): serialize message straight to smtp socket. Defaults to False.
+
+        Returns:
+            int: number of bytes sent
+        """
+        envelope_sender, envelope_recipients = get_envelope(mail)
+        del mail["Bcc"]
+        if isinstance(session, DeliveryBackend):
+            wire_bytes = session.deliver(envelope_sender, envelope_recipients, serialize_message(mail))
+            self.delivery_status.add(message_id, envelope_recipients)
+            return wire_bytes
+
+        smtp_server = session
+        envelope_id = message_id if config.get("dsn") and is_dsn_supported(smtp_server) else None
+        with self.sessions.latencies.measure(
+            smtp_server.relay, "data", smtp_server.phase_timeouts["data"], smtp_server
+        ):
+            if stream:
+                refused, wire_bytes = stream_data(
+                    smtp_server,
+                    envelope_sender,
+                    envelope_recipients,
+                    mail,
+                    body_type,
+                    chunking,
+                    envelope_id,
+                )
+            else:
+                data = serialize_message(mail)
+                refused = send_data(
+                    smtp_server,
+                    envelope_sender,
+                    envelope_recipients,
+                    data,
+                    body_type,
+                    chunking,
+                    envelope_id,
+                )
+                wire_bytes = len(data)
+        self.delivery_status.add(message_id, envelope_recipients, refused)
+
+        return wire_bytes
+
+    def get_reports(self):
+        """
+        Return reports of latest sent emails
+
+        Returns:
+            list: list of reports (oldest first)::
+
+                [
+                    {
+                        timestamp (int): send timestamp
+                        messageid (str): message Message-ID
+                        delivery (str): delivery backend (smtp, capture or null)
+                        bodytype (str): body type used (7BIT, 8BITMIME or BINARYMIME)
+                        chunking (bool): True if message sent with BDAT command
+                        payloadbytes (int): bytes of content and attachments before encoding
+                        wirebytes (int): bytes of message sent to server
+                        transforms (list): image transforms::
+
+                            [
+                                {
+                                    filename (str): attachment filename
+                                    originalbytes (int): original image size
+                                    bytes (int): transformed image size
+                                    duration (float): transform duration in seconds (0 if cached)
+                                },
+                                ...
+                            ]
+
+                        missingattachments (list): attachment filepaths not found
+                    },
+                    ...
+                ]
+
+        """
+        return list(self.__reports)
+
+    def __add_report(self, report):
+        """
+        Store report of sent message
+
+        Args:
+            report (dict): send report
+        """
+        self.logger.info(
+            "Email sent: %s bytes of content sent as %s bytes (body=%s chunking=%s)",
+            report["payloadbytes"],
+            report["wirebytes"],
+            report["bodytype"],
+            report["chunking"],
+        )
+        self.__reports.append(report)
+
+    def __submit_image_transforms(self, attachments):
+        """
+        Submit transform of image attachments if enabled
+
+        Args:
+            attachments (list): list of attachments
+
+        Returns:
+            dict: transform futures indexed by attachment path
+        """
+        transforms = {}
+        image_transformer = self.image_transformer
+        if image_transformer is None:
+            return transforms
+
+        for attachment in attachments:
+            if not isinstance(attachment, str):
+                continue
+            ctype = get_content_type(attachment)
+            if not ImageTransformer.is_supported(ctype) or not os.path.isfile(attachment):
+                continue
+            try:
+                transforms[attachment] = image_transformer.submit(attachment, ctype)
+            except Exception:
+                self.logger.exception('Unable to submit transform of "%s"', attachment)
+
+        return transforms
+
+    def __read_attachment(self, filepath, transform=None):
+        """
+        Read attachment content, using transformed image when available and smaller
+
+        Original file is sent if transform fails or does not complete in time.
+
+        Args:
+            filepath (str): attachment path
+            transform (Future, optional): image transform future. Defaults to None.
+
+        Returns:
+            tuple: attachment content (bytes) and transform report (dict or None)
+        """
+        if transform is not None:
+            try:
+                original_size, data, duration = transform.result(
+                    timeout=MessageSender.IMAGE_TRANSFORM_TIMEOUT
+                )
+                report = {
+                    "filename": os.path.basename(filepath),
+                    "originalbytes": original_size,
+                    "bytes": len(data),
+                    "duration": duration,
+                }
+                self.logger.debug("Image transform: %s", report)
+                if len(data) < original_size:
+                    return data, report
+            except FutureTimeoutError:
+                transform.cancel()
+                self.logger.warning('Image transform of "%s" timed out, original file is sent', filepath)
+            except Exception:
+                self.logger.exception('Image transform of "%s" failed, original file is sent', filepath)
+
+        with open(filepath, "rb") as filep:
+            return filep.read(), None
+
+    @staticmethod
+    def __read_buffer(content):
+        """
+        Return content of in-memory attachment
+
+        Bytes-like contents are returned as is to avoid copies. File-like contents are not
+        streamed: they are read entirely, message parts need their whole payload to be encoded.
+
+        Args:
+            content (bytes|bytearray|memoryview|file-like): attachment content
+
+        Returns:
+            bytes-like: attachment content
+        """
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return content
+        return content.read()
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import errno
+import socket
+import logging
+import smtplib
+import selectors
+import threading
+from itertools import chain, zip_longest
+from .deliverybackends import DeliveryBackend
+from .smtptimeouts import RelayLatencies
+
+# delay before starting connection to next address (RFC 8305)
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+
+class RelayResolver:
+    """
+    Relay hostname resolver with cache and happy eyeballs (RFC 8305) connection
+
+    Standard resolver does not expose records TTL, so resolved addresses are
+    kept for a fixed ttl and dropped as soon as connecting to them fails.
+    """
+
+    def __init__(self, ttl=300.0, attempt_delay=CONNECTION_ATTEMPT_DELAY):
+        """
+        Constructor
+
+        Args:
+            ttl (float, optional): duration in seconds addresses are cached. Defaults to 300.
+            attempt_delay (float, optional): delay in seconds before trying next address. Defaults to 0.25.
+        """
+        self.ttl = ttl
+        self.attempt_delay = attempt_delay
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """
+        Resolve relay address
+
+        Args:
+            host (str): relay hostname or ip
+            port (int): relay port
+
+        Returns:
+            list: getaddrinfo results, IPv6 and IPv4 addresses interleaved
+        """
+        key = (host, port)
+        now = time.monotonic()
+        with self.__lock:
+            cached = self.__cache.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        ipv6 = [info for info in infos if info[0] == socket.AF_INET6]
+        others = [info for info in infos if info[0] != socket.AF_INET6]
+        addresses = [info for info in chain.from_iterable(zip_longest(ipv6, others)) if info]
+        with self.__lock:
+            self.__cache[key] = (now + self.ttl, addresses)
+
+        return addresses
+
+    def invalidate(self, host, port):
+        """
+        Drop cached addresses of relay
+
+        Args:
+            host (str): relay hostname or ip
+            port (int): relay port
+        """
+        with self.__lock:
+            self.__cache.pop((host, port), None)
+
+    def connect(self, host, port, timeout=None, source_address=None):
+        """
+        Connect to relay racing its addresses
+
+        A new address is tried every attempt_delay seconds (or as soon as previous attempt
+        failed) while previous attempts are still running. First established connection wins.
+
+        Args:
+            host (str): relay hostname or ip
+            port (int): relay port
+            timeout (float, optional): connection timeout in seconds. Defaults to None.
+            source_address (tuple, optional): local (host, port) to bind to. Defaults to None.
+
+        Returns:
+            socket: connected socket
+
+        Raises:
+            OSError: if connection failed (socket.timeout if it timed out)
+        """
+        addresses = self.resolve(host, port)
+        try:
+            sock = self.__race(addresses, timeout, source_address)
+        except OSError:
+            self.invalidate(host, port)
+            raise
+        sock.settimeout(timeout)
+        return sock
+
+    def __race(self, addresses, timeout, source_address):
+        """
+        Race connections to addresses
+
+        Args:
+            addresses (list): getaddrinfo results
+            timeout (float): connection timeout
+            source_address (tuple): local address to bind to
+
+        Returns:
+            socket: first connected socket
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        selector = selectors.DefaultSelector()
+        pending = []
+        error = None
+        index = 0
+        next_attempt = 0.0
+        try:
+            while True:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    raise socket.timeout("Connection to relay timed out")
+
+                if index < len(addresses) and now >= next_attempt:
+                    family, socktype, proto, _, sockaddr = addresses[index]
+                    index += 1
+                    sock = socket.socket(family, socktype, proto)
+                    sock.setblocking(False)
+                    if source_address:
+                        sock.bind(source_address)
+                    code = sock.connect_ex(sockaddr)
+                    if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        error = OSError(code, os.strerror(code))
+                        sock.close()
+                        continue
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    pending.append(sock)
+                    next_attempt = now + self.attempt_delay
+
+                if not pending:
+                    raise error or OSError("No address to connect to")
+
+                wait = None if deadline is None else deadline - now
+                if index < len(addresses):
+                    wait = max(0.0, next_attempt - now) if wait is None else min(wait, max(0.0, next_attempt - now))
+                for key, _ in selector.select(wait):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    pending.remove(sock)
+                    code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if code == 0:
+                        sock.setblocking(True)
+                        return sock
+                    error = OSError(code, os.strerror(code))
+                    sock.close()
+                    next_attempt = 0.0
+        finally:
+            for sock in pending:
+                sock.close()
+            selector.close()
+
+
+class RelaySMTP(smtplib.SMTP):
+    """
+    SMTP client connecting through a RelayResolver
+    """
+
+    def __init__(self, host="", port=0, resolver=None, **kwargs):
+        """
+        Constructor
+
+        Args:
+            host (str, optional): relay host. Connection is opened if specified.
+            port (int, optional): relay port
+            resolver (RelayResolver, optional): resolver. Defaults to standard connection.
+            **kwargs: smtplib.SMTP keyword arguments
+        """
+        self.resolver = resolver
+        smtplib.SMTP.__init__(self, host, port, **kwargs)
+
+    def _get_socket(self, host, port, timeout):
+        if self.resolver is None:
+            return smtplib.SMTP._get_socket(self, host, port, timeout)
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:  # pylint: disable=protected-access
+            timeout = socket.getdefaulttimeout()
+        if self.debuglevel > 0:
+            self._print_debug("connect: to", (host, port), self.source_address)
+        return self.resolver.connect(host, port, timeout, self.source_address)
+
+
+class RelaySMTP_SSL(smtplib.SMTP_SSL, RelaySMTP):  # pylint: disable=invalid-name
+    """
+    SMTP over SSL client connecting through a RelayResolver
+    """
+
+    def __init__(self, host="", port=0, resolver=None, **kwargs):
+        """
+        Constructor
+
+        Args:
+            host (str, optional): relay host. Connection is opened if specified.
+            port (int, optional): relay port
+            resolver (RelayResolver, optional): resolver. Defaults to standard connection.
+            **kwargs: smtplib.SMTP_SSL keyword arguments
+        """
+        self.resolver = resolver
+        smtplib.SMTP_SSL.__init__(self, host, port, **kwargs)
+
+
+class RelaySessions:
+    """
+    Authenticated relay sessions factory
+
+    Sessions share resolver (addresses cache) and observed phase latencies. One session
+    can be pre-warmed in background and kept for next send while its configuration is
+    unchanged and it is not idle for too long.
+    """
+
+    def __init__(self, default_timeouts, resolver_ttl=300.0, prewarm_max_idle=240.0):
+        """
+        Constructor
+
+        Args:
+            default_timeouts (dict): phase timeouts applied when configuration has none
+            resolver_ttl (float, optional): duration in seconds relay addresses are cached. Defaults to 300.
+            prewarm_max_idle (float, optional): duration in seconds pre-warmed session is kept. Defaults to 240.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.default_timeouts = default_timeouts
+        self.prewarm_max_idle = prewarm_max_idle
+        self.resolver = RelayResolver(resolver_ttl)
+        self.latencies = RelayLatencies()
+        self.__warm_session = None
+        self.__warm_lock = threading.Lock()
+
+    @property
+    def warm_session(self):
+        """
+        Pre-warmed session
+
+        Returns:
+            tuple: (config, smtp server instance, opening monotonic time) or None
+        """
+        return self.__warm_session
+
+    def open(self, config, job=None, debug=False):
+        """
+        Open authenticated session on smtp server
+
+        Args:
+            config (dict): send configuration
+            job (SendJob, optional): send job the session is attached to. Defaults to None.
+            debug (bool, optional): enable smtplib debug output. Defaults to False.
+
+        Returns:
+            RelaySMTP: connected smtp server instance
+        """
+        server = config.get("server")
+        port = config.get("port")
+        ssl = config.get("ssl", False)
+        relay = (server, port)
+        timeouts = self.latencies.get_timeouts(
+            relay,
+            config.get("timeouts") or self.default_timeouts,
+            config.get("adaptivetimeouts", False),
+        )
+        self.logger.debug("SSL enabled: %s", ssl)
+        self.logger.debug("Timeouts: %s", timeouts)
+        with self.latencies.measure(relay, "connect", timeouts["connect"]):
+            if ssl:
+                self.logger.debug("Connect SMTP server with SSL on %s:%s", server, port)
+                smtp_server = RelaySMTP_SSL(
+                    server, port, resolver=self.resolver, timeout=timeouts["connect"]
+                )
+            else:
+                self.logger.debug(
+                    "Connect SMTP server without SSL on %s:%s", server, port)
+                smtp_server = RelaySMTP(
+                    server, port, resolver=self.resolver, timeout=timeouts["connect"]
+                )
+        smtp_server.relay = relay
+        smtp_server.phase_timeouts = timeouts
+        if job:
+            job.attach(smtp_server)
+        self.logger.debug("Smtp server: %s", smtp_server)
+        if debug:
+            smtp_server.set_debuglevel(True)
+        if config.get("tls"):
+            self.logger.debug("StartTLS session")
+            with self.latencies.measure(relay, "tls", timeouts["tls"], smtp_server):
+                smtp_server.starttls()
+        if config.get("login"):
+            self.logger.debug("Connect to server using credentials")
+            with self.latencies.measure(relay, "auth", timeouts["auth"], smtp_server):
+                smtp_server.login(config.get("login"), config.get("password"))
+        self.logger.debug("Connected to server")
+
+        return smtp_server
+
+    @staticmethod
+    def close(smtp_server, abort=False):
+        """
+        Close smtp session. Delivery backends are kept opened.
+
+        Args:
+            smtp_server (DeliveryBackend|RelaySMTP): smtp server instance
+            abort (bool, optional): close connection without QUIT command, session state
+                is unknown after a failure. Defaults to False.
+        """
+        if isinstance(smtp_server, DeliveryBackend):
+            return
+        if abort:
+            smtp_server.close()
+            return
+        try:
+            smtp_server.quit()
+        except Exception:
+            smtp_server.close()
+
+    def prewarm(self, get_config, debug=False):
+        """
+        Open a session in background and keep it for next send
+
+        Args:
+            get_config (function): return send configuration snapshot
+            debug (bool, optional): enable smtplib debug output. Defaults to False.
+        """
+        threading.Thread(
+            target=self.__open_warm_session, args=(get_config, debug), name="EmailPrewarm", daemon=True
+        ).start()
+
+    def __open_warm_session(self, get_config, debug):
+        """
+        Open session kept for next send
+
+        Args:
+            get_config (function): return send configuration snapshot
+            debug (bool): enable smtplib debug output
+        """
+        try:
+            config = get_config()
+            smtp_server = self.open(config, debug=debug)
+        except Exception as error:
+            self.logger.warning("Unable to pre-warm smtp session: %s", str(error))
+            return
+
+        with self.__warm_lock:
+            previous = self.__warm_session
+            self.__warm_session = (config, smtp_server, time.monotonic())
+        if previous:
+            self.close(previous[1])
+        self.logger.debug("Smtp session pre-warmed")
+
+    def take_warm_session(self, config):
+        """
+        Return pre-warmed session if still usable with specified configuration
+
+        Args:
+            config (dict): send configuration snapshot
+
+        Returns:
+            RelaySMTP: connected smtp server instance or None
+        """
+        with self.__warm_lock:
+            warm_session = self.__warm_session
+            self.__warm_session = None
+        if warm_session is None:
+            return None
+
+        warm_config, smtp_server, opened_at = warm_session
+        if warm_config is config and time.monotonic() - opened_at < self.prewarm_max_idle:
+            try:
+                if smtp_server.noop()[0] == 250:
+                    return smtp_server
+            except Exception:
+                self.logger.debug("Pre-warmed session is closed")
+        self.close(smtp_server)
+        return None
+
+    def drop_warm_session(self):
+        """
+        Close pre-warmed session if any
+        """
+        with self.__warm_lock:
+            warm_session = self.__warm_session
+            self.__warm_session = None
+        if warm_session:
+            self.close(warm_session[1])
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from types import MappingProxyType
+from cleep.exception import MissingParameter
+
+CUSTOM_PROVIDER_KEY = "custom"
+PROVIDERS = {
+    "gmail": {
+        "label": "Google Gmail",
+        "server": "smtp.gmail.com",
+        "port": 465,
+        "tls": False,
+        "ssl": True,
+    },
+    "yahoo": {
+        "label": "Yahoo! Mail",
+        "server": "smtp.mail.yahoo.com",
+        "port": 587,
+        "tls": True,
+        "ssl": False,
+    },
+}
+
+
+def get_providers():
+    """
+    Return list of providers
+
+    Returns:
+        list: providers ({label (str), key (str)}), custom provider is last
+    """
+    providers = [{"label": provider["label"], "key": key} for key, provider in PROVIDERS.items()]
+    providers.append({"label": "Custom email provider", "key": CUSTOM_PROVIDER_KEY})
+    return providers
+
+
+def get_config_parameters(provider, server, port, login, password, tls, ssl, sender):
+    """
+    Return send configuration parameters, to be checked with _check_parameters
+
+    Args:
+        provider (str): choosen provider from list
+        server (str): custom smtp server address
+        port (int): smtp server port
+        login (str): login to connect to custom smtp server
+        password (str): password to connect to custom smtp server
+        tls (bool): TLS option
+        ssl (bool): SSL option
+        sender (str): email sender
+
+    Returns:
+        list: parameters description
+    """
+    return [
+        {
+            "name": "provider",
+            "value": provider,
+            "type": str,
+            "validator": lambda val: val in PROVIDERS or val == CUSTOM_PROVIDER_KEY,
+            "message": "Provider must be choosen from list",
+        },
+        {"name": "server", "value": server, "type": str, "none": True, "empty": False},
+        {"name": "port", "value": port, "type": int, "none": True},
+        {"name": "login", "value": login, "type": str, "none": True, "empty": True},
+        {"name": "password", "value": password, "type": str, "none": True, "empty": True},
+        {"name": "tls", "value": tls, "type": bool, "none": False},
+        {"name": "ssl", "value": ssl, "type": bool, "none": False},
+        {"name": "sender", "value": sender, "type": str, "none": True, "empty": False},
+    ]
+
+
+def get_send_config(config, check_relay=True):
+    """
+    Check and return configuration used to send emails
+
+    Args:
+        config (dict): module configuration
+        check_relay (bool, optional): check smtp relay is configured. Defaults to True.
+
+    Returns:
+        dict: configuration ready to be used to send mail::
+
+            {
+                server (str): smtp server address
+                port (int): smtp server port
+                ssl (bool): ssl flag
+                tls (bool): tls flag
+                sender (str): custom sender value
+                login (str): login
+                password (str): password
+                timeouts (dict): session phases timeouts (connect, tls, auth, data)
+                adaptivetimeouts (bool): adaptive timeouts flag
+                dsn (bool): request delivery status notifications flag
+            }
+
+    Raises:
+        MissingParameter: if inconsistent configuration value found
+    """
+    if check_relay and config.get("provider") in PROVIDERS and (
+        not config.get("login") or not config.get("password")
+    ):
+        raise MissingParameter(
+            "Credentials must be specified with choosen provider"
+        )
+    if check_relay and config["provider"] == CUSTOM_PROVIDER_KEY and (
+        not config.get("server") or not config.get("port")
+    ):
+        raise MissingParameter(
+            "Server/port address must be configured when using custom provider"
+        )
+
+    provider = config.get("provider")
+    relay = config if provider == CUSTOM_PROVIDER_KEY else PROVIDERS.get(provider)
+    return {
+        "server": relay.get("server"),
+        "port": relay.get("port"),
+        "ssl": relay.get("ssl"),
+        "tls": relay.get("tls"),
+        "sender": config.get("sender"),
+        "login": config.get("login"),
+        "password": config.get("password"),
+        "timeouts": config.get("timeouts"),
+        "adaptivetimeouts": config.get("adaptivetimeouts"),
+        "dsn": config.get("dsn"),
+    }
+
+
+class SendConfigSnapshot:
+    """
+    Read-only snapshot of send configuration
+
+    Snapshot is replaced (not modified) when configuration changes, so a running send
+    keeps using the configuration it started with.
+    """
+
+    def __init__(self, load):
+        """
+        Constructor
+
+        Args:
+            load (callable): return send configuration (see get_send_config)
+        """
+        self.load = load
+        self.__snapshot = None
+        self.__lock = threading.Lock()
+
+    def get(self):
+        """
+        Return snapshot of send configuration, loaded on first call after a change
+
+        Returns:
+            MappingProxyType: send configuration
+
+        Raises:
+            MissingParameter: if inconsistent configuration value found
+        """
+        snapshot = self.__snapshot
+        if snapshot is None:
+            with self.__lock:
+                if self.__snapshot is None:
+                    self.__snapshot = MappingProxyType(self.load())
+                snapshot = self.__snapshot
+        return snapshot
+
+    def update(self, apply):
+        """
+        Apply configuration change and drop current snapshot
+
+        Args:
+            apply (callable): function updating configuration
+
+        Returns:
+            any: apply result
+        """
+        with self.__lock:
+            result = apply()
+            self.__snapshot = None
+        return result
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import pickle
+import marshal
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import deque
+
+
+class SendProfiler:
+    """
+    Profiler of the next sends
+
+    When enabled, next sends run under cProfile (and tracemalloc if memory profiling
+    is requested) and their stats are written to output directory:
+
+        - <name>-<timestamp>-<index>.prof: cProfile stats (readable with pstats)
+        - <name>-<timestamp>-<index>.tracemalloc: tracemalloc snapshot
+
+    Profiled sends are serialized (a single profiler can be active at a time). When
+    disabled callers only read the remaining attribute, nothing is wrapped. Only latest
+    written files are listed in status.
+    """
+
+    TRACEMALLOC_FRAMES = 10
+    MAX_FILES = 100
+
+    def __init__(self, output_dir, cleep_filesystem):
+        """
+        Constructor
+
+        Args:
+            output_dir (str): stats files directory
+            cleep_filesystem (CleepFilesystem): cleep filesystem instance
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.output_dir = output_dir
+        self.cleep_filesystem = cleep_filesystem
+        self.remaining = 0
+        self.memory = False
+        self.files = deque(maxlen=SendProfiler.MAX_FILES)
+        self.__index = 0
+        self.__lock = threading.Lock()
+        self.__run_lock = threading.Lock()
+
+    def enable(self, sends, memory=False):
+        """
+        Profile next sends
+
+        Args:
+            sends (int): number of sends to profile (0 disables profiling)
+            memory (bool, optional): also trace memory allocations. Defaults to False.
+        """
+        with self.__lock:
+            self.memory = memory
+            self.remaining = sends
+
+    def disable(self):
+        """
+        Stop profiling. Running profiled send is still written.
+        """
+        self.enable(0)
+
+    def get_status(self):
+        """
+        Return profiler status
+
+        Returns:
+            dict: status::
+
+                {
+                    remaining (int): number of sends still to profile
+                    memory (bool): True if memory allocations are traced
+                    files (list): latest written stats files
+                }
+
+        """
+        with self.__lock:
+            return {
+                "remaining": self.remaining,
+                "memory": self.memory,
+                "files": list(self.files),
+            }
+
+    def wrap(self, func, name):
+        """
+        Wrap send function so its next call is profiled if a profiling slot remains
+
+        Args:
+            func (callable): send function
+            name (str): stats files prefix
+
+        Returns:
+            callable: wrapped function
+        """
+
+        def profiled(*args, **kwargs):
+            with self.__lock:
+                profile = self.remaining > 0
+                if profile:
+                    self.remaining -= 1
+                    self.__index += 1
+                index = self.__index
+                memory = self.memory
+            if not profile:
+                return func(*args, **kwargs)
+            return self.__run(func, name, index, memory, args, kwargs)
+
+        return profiled
+
+    def __run(self, func, name, index, memory, args, kwargs):
+        """
+        Run function under profilers and write stats
+
+        Args:
+            func (callable): function
+            name (str): stats files prefix
+            index (int): profiled send index
+            memory (bool): trace memory allocations
+            args (tuple): function arguments
+            kwargs (dict): function keyword arguments
+
+        Returns:
+            any: function result
+        """
+        with self.__run_lock:
+            profiler = cProfile.Profile()
+            trace_memory = memory and not tracemalloc.is_tracing()
+            if trace_memory:
+                tracemalloc.start(SendProfiler.TRACEMALLOC_FRAMES)
+            try:
+                return profiler.runcall(func, *args, **kwargs)
+            finally:
+                snapshot = tracemalloc.take_snapshot() if trace_memory else None
+                if trace_memory:
+                    tracemalloc.stop()
+                self.__write(profiler, snapshot, name, index)
+
+    def __write(self, profiler, snapshot, name, index):
+        """
+        Write stats files
+
+        Args:
+            profiler (cProfile.Profile): profiler
+            snapshot (tracemalloc.Snapshot): memory snapshot (None if memory not traced)
+            name (str): stats files prefix
+            index (int): profiled send index
+        """
+        basepath = os.path.join(
+            self.output_dir, f"{name}-{time.strftime('%Y%m%d%H%M%S')}-{index}"
+        )
+        filepaths = [basepath + ".prof"]
+        try:
+            if not os.path.exists(self.output_dir):
+                self.cleep_filesystem.mkdir(self.output_dir, True)
+            profiler.create_stats()
+            self.__dump(filepaths[0], lambda filep: marshal.dump(profiler.stats, filep))
+            if snapshot is not None:
+                filepaths.append(basepath + ".tracemalloc")
+                self.__dump(
+                    filepaths[1],
+                    lambda filep: pickle.dump(snapshot, filep, pickle.HIGHEST_PROTOCOL),
+                )
+        except Exception:
+            self.logger.exception("Unable to write profiling stats")
+            return
+
+        self.logger.info("Profiling stats written to %s", filepaths)
+        with self.__lock:
+            self.files.extend(filepaths)
+
+    def __dump(self, filepath, dump):
+        """
+        Write binary stats file (same content as cProfile dump_stats and tracemalloc
+        Snapshot.dump)
+
+        Args:
+            filepath (str): file path
+            dump (function): function writing stats to opened file
+        """
+        filep = self.cleep_filesystem.open(filepath, "wb")
+        try:
+            dump(filep)
+        finally:
+            self.cleep_filesystem.close(filep)
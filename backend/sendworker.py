@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class SendCancelled(Exception):
+    """
+    Raised inside a send job when it was cancelled
+    """
+
+
+class SendTimeout(Exception):
+    """
+    Raised when a send job does not complete in time
+    """
+
+
+class SendQueueFull(Exception):
+    """
+    Raised when no send slot is available in time
+    """
+
+
+class SendJob:
+    """
+    Cancellation handle of a running send
+
+    Cancelling a job closes its smtp connection so blocking calls in the worker
+    fail immediately instead of running until their own timeout.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.__cancelled = threading.Event()
+        self.__lock = threading.Lock()
+        self.__smtp_server = None
+
+    @property
+    def cancelled(self):
+        """
+        Return True if job was cancelled
+        """
+        return self.__cancelled.is_set()
+
+    def attach(self, smtp_server):
+        """
+        Attach smtp connection to job
+
+        Args:
+            smtp_server (SMTP): smtp connection used by job
+
+        Raises:
+            SendCancelled: if job is already cancelled
+        """
+        with self.__lock:
+            self.__smtp_server = smtp_server
+        self.check()
+
+    def check(self):
+        """
+        Stop job if it was cancelled
+
+        Raises:
+            SendCancelled: if job was cancelled
+        """
+        if self.__cancelled.is_set():
+            self.__close()
+            raise SendCancelled()
+
+    def cancel(self):
+        """
+        Cancel job
+        """
+        self.__cancelled.set()
+        self.__close()
+
+    def __close(self):
+        """
+        Close attached smtp connection
+        """
+        with self.__lock:
+            smtp_server = self.__smtp_server
+            self.__smtp_server = None
+        if smtp_server is not None:
+            try:
+                smtp_server.close()
+            except Exception:
+                pass
+
+
+class SendWorkerPool:
+    """
+    Bounded pool of send workers
+
+    At most workers sends run concurrently and at most queue_size sends wait for
+    a free worker. Callers wait for a free slot up to their send timeout.
+    """
+
+    def __init__(self, workers, queue_size):
+        """
+        Constructor
+
+        Args:
+            workers (int): number of concurrent sends
+            queue_size (int): number of sends waiting for a worker
+        """
+        self.__executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="EmailSend"
+        )
+        self.__slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, func, timeout, *args, **kwargs):
+        """
+        Run send function in pool and wait for its result
+
+        Send function is called with a SendJob instance as first argument.
+
+        Args:
+            func (callable): send function
+            timeout (float): maximum time to wait for result (including time waiting for a slot)
+            *args: send function arguments
+            **kwargs: send function keyword arguments
+
+        Returns:
+            any: send function result
+
+        Raises:
+            SendQueueFull: if no slot is available in time
+            SendTimeout: if send did not complete in time. Send is cancelled.
+        """
+        deadline = time.monotonic() + timeout
+        if not self.__slots.acquire(timeout=timeout):
+            raise SendQueueFull()
+
+        job = SendJob()
+        try:
+            future = self.__executor.submit(func, job, *args, **kwargs)
+        except Exception:
+            self.__slots.release()
+            raise
+        future.add_done_callback(lambda _: self.__slots.release())
+
+        try:
+            return future.result(max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError as error:
+            future.cancel()
+            job.cancel()
+            raise SendTimeout() from error
+
+    def shutdown(self):
+        """
+        Stop pool, pending sends are cancelled
+        """
+        self.__executor.shutdown(wait=False, cancel_futures=True)
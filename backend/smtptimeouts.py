@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import socket
+import smtplib
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+PHASES = ("connect", "tls", "auth", "data")
+
+
+class PhaseTimeout(Exception):
+    """
+    Raised when smtp server does not answer in time during a session phase
+    """
+
+    def __init__(self, phase, timeout):
+        """
+        Constructor
+
+        Args:
+            phase (str): session phase (connect, tls, auth, data)
+            timeout (float): applied timeout in seconds
+        """
+        Exception.__init__(self, f"Timeout during {phase} phase ({timeout:.1f}s)")
+        self.phase = phase
+        self.timeout = timeout
+
+
+def get_percentile(values, percentile):
+    """
+    Return percentile of values (nearest rank)
+
+    Args:
+        values (list): values
+        percentile (float): percentile (0-1)
+
+    Returns:
+        float: percentile value
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percentile * len(ordered))) - 1))
+    return ordered[index]
+
+
+class RelayLatencies:
+    """
+    Observed smtp session phase durations per relay
+
+    In adaptive mode phase timeouts are derived from observed durations: percentile
+    multiplied by factor, bounded by minimum timeout and configured timeout.
+    """
+
+    def __init__(self, samples=50, min_samples=5, percentile=0.95, factor=3.0, min_timeout=2.0):
+        """
+        Constructor
+
+        Args:
+            samples (int, optional): number of durations kept per relay and phase. Defaults to 50.
+            min_samples (int, optional): number of durations needed before adapting timeout. Defaults to 5.
+            percentile (float, optional): percentile of durations used (0-1). Defaults to 0.95.
+            factor (float, optional): factor applied to percentile. Defaults to 3.0.
+            min_timeout (float, optional): minimum adaptive timeout in seconds. Defaults to 2.0.
+        """
+        self.samples = samples
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.__durations = {}
+        self.__lock = threading.Lock()
+
+    def record(self, relay, phase, duration):
+        """
+        Record phase duration
+
+        Args:
+            relay (tuple): relay (host, port)
+            phase (str): session phase
+            duration (float): phase duration in seconds
+        """
+        with self.__lock:
+            durations = self.__durations.setdefault(
+                (relay, phase), deque(maxlen=self.samples)
+            )
+            durations.append(duration)
+
+    def get_timeouts(self, relay, configured, adaptive):
+        """
+        Return timeouts to apply for each phase
+
+        Args:
+            relay (tuple): relay (host, port)
+            configured (dict): configured timeouts in seconds indexed by phase
+            adaptive (bool): True to derive timeouts from observed durations
+
+        Returns:
+            dict: timeouts in seconds indexed by phase
+        """
+        timeouts = {}
+        for phase in PHASES:
+            timeout = float(configured[phase])
+            with self.__lock:
+                durations = list(self.__durations.get((relay, phase), []))
+            if adaptive and len(durations) >= self.min_samples:
+                adapted = get_percentile(durations, self.percentile) * self.factor
+                timeout = min(timeout, max(self.min_timeout, adapted))
+            timeouts[phase] = timeout
+
+        return timeouts
+
+    def get_stats(self):
+        """
+        Return observed durations statistics
+
+        Returns:
+            dict: statistics indexed by "host:port" then phase::
+
+                {
+                    "smtp.gmail.com:465": {
+                        connect: {
+                            samples (int): number of durations
+                            p50 (float): median duration
+                            p95 (float): 95th percentile duration
+                        },
+                        ...
+                    },
+                    ...
+                }
+
+        """
+        with self.__lock:
+            items = [(key, list(durations)) for key, durations in self.__durations.items()]
+
+        stats = {}
+        for (relay, phase), durations in items:
+            stats.setdefault(f"{relay[0]}:{relay[1]}", {})[phase] = {
+                "samples": len(durations),
+                "p50": get_percentile(durations, 0.5),
+                "p95": get_percentile(durations, 0.95),
+            }
+        return stats
+
+    @contextmanager
+    def measure(self, relay, phase, timeout, smtp_server=None):
+        """
+        Apply phase timeout and record phase duration
+
+        smtplib reports socket timeouts of established sessions as server disconnections,
+        they are raised as phase timeouts too.
+
+        Args:
+            relay (tuple): relay (host, port)
+            phase (str): session phase
+            timeout (float): phase timeout in seconds
+            smtp_server (SMTP, optional): connected smtp server whose socket timeout is updated. Defaults to None.
+
+        Raises:
+            PhaseTimeout: if phase timed out
+        """
+        if smtp_server is not None and smtp_server.sock is not None:
+            smtp_server.sock.settimeout(timeout)
+        start = time.monotonic()
+        try:
+            yield
+        except socket.timeout as error:
+            raise PhaseTimeout(phase, timeout) from error
+        except smtplib.SMTPServerDisconnected as error:
+            if isinstance(error.__context__, socket.timeout):
+                raise PhaseTimeout(phase, timeout) from error.__context__
+            raise
+        self.record(relay, phase, time.monotonic() - start)
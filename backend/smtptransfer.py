@@ -0,0 +1,544 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import smtplib
+from io import BytesIO
+from email.generator import BytesGenerator
+from email.utils import getaddresses, parseaddr
+
+BODY_7BIT = "7BIT"
+BODY_8BITMIME = "8BITMIME"
+BODY_BINARYMIME = "BINARYMIME"
+
+# RFC 5322 line length limit (without CRLF) allowed for 8bit bodies
+MAX_8BIT_LINE_LENGTH = 998
+
+# size of BDAT chunks sent to server (RFC 3030)
+BDAT_CHUNK_SIZE = 1024 * 1024
+
+# size of buffer written to socket when message is streamed with DATA command
+STREAM_BUFFER_SIZE = 64 * 1024
+
+EOL_RE = re.compile(rb"\r\n|\r|\n")
+TEXT_EOL_RE = re.compile(r"\r\n|\r|\n")
+XTEXT_RE = re.compile(r"\+([0-9A-Fa-f]{2})")
+
+
+class BinaryBytesGenerator(BytesGenerator):
+    """
+    Bytes generator that writes "binary" transfer encoded parts untouched
+
+    Default generator normalizes line endings of all text it writes, which would
+    corrupt binary payloads (RFC 3030 BINARYMIME).
+    """
+
+    def _handle_text(self, msg):
+        if str(msg.get("content-transfer-encoding", "")).lower() == "binary":
+            payload = msg.get_payload(decode=True)
+            if payload:
+                self._fp.write(payload)
+            return
+        super()._handle_text(msg)
+
+    _writeBody = _handle_text
+
+
+class StreamBytesGenerator(BinaryBytesGenerator):
+    """
+    Bytes generator writing message parts straight to output
+
+    Default generator renders each part body in a temporary buffer before writing
+    its headers (to be able to choose a multipart boundary not found in body), and
+    splits whole payloads into lists of lines. Here boundaries are chosen upfront
+    and lines are written one by one, so nothing the size of the message is allocated.
+    """
+
+    def _write(self, msg):
+        if self.policy.cte_type == "7bit":
+            # transfer encoding may be changed after body is rendered
+            super()._write(msg)
+            return
+
+        # message/rfc822 parts are multipart too but have no boundary
+        if msg.get_content_maintype() == "multipart" and not msg.get_boundary():
+            msg.set_boundary(self._make_boundary())
+        meth = getattr(msg, "_write_headers", None)
+        if meth is None:
+            self._write_headers(msg)
+        else:
+            meth(self)
+        self._dispatch(msg)
+
+    def _handle_text(self, msg):
+        payload = msg._payload  # pylint: disable=protected-access
+        if (
+            isinstance(payload, str)
+            and payload.isascii()
+            and str(msg.get("content-transfer-encoding", "")).lower() != "binary"
+        ):
+            # ascii payload is written as is, skip copies made to look for surrogates
+            self._write_lines(payload, self._mangle_from_)
+            return
+        super()._handle_text(msg)
+
+    _writeBody = _handle_text
+
+    def _handle_multipart(self, msg):
+        subparts = msg.get_payload()
+        if not isinstance(subparts, list):
+            super()._handle_multipart(msg)
+            return
+
+        boundary = msg.get_boundary()
+        if msg.preamble is not None:
+            self._write_lines(msg.preamble, self._mangle_from_)
+            self.write(self._NL)
+        self.write("--" + boundary + self._NL)
+        for index, part in enumerate(subparts):
+            if index > 0:
+                self.write(self._NL + "--" + boundary + self._NL)
+            self.clone(self._fp).flatten(part, unixfrom=False, linesep=self._NL)
+        self.write(self._NL + "--" + boundary + "--" + self._NL)
+        if msg.epilogue is not None:
+            self._write_lines(msg.epilogue, self._mangle_from_)
+
+    def _write_lines(self, lines, mangle_from=False):
+        start = 0
+        for match in TEXT_EOL_RE.finditer(lines):
+            self.__write_line(lines[start : match.start()], mangle_from)
+            self.write(self._NL)
+            start = match.end()
+        if start < len(lines):
+            self.__write_line(lines[start:], mangle_from)
+
+    def __write_line(self, line, mangle_from):
+        if mangle_from and line.startswith("From "):
+            self.write(">")
+        self.write(line)
+
+
+class DataWriter:
+    """
+    Buffered writer sending message on an opened DATA command
+
+    Line endings are normalized to CRLF and lines starting with a dot are escaped
+    (RFC 5321) on each buffered chunk, so the message is never held entirely in memory.
+    """
+
+    def __init__(self, smtp_server, buffer_size=STREAM_BUFFER_SIZE):
+        """
+        Constructor
+
+        Args:
+            smtp_server (SMTP): smtp server instance with DATA command accepted
+            buffer_size (int, optional): size of chunks sent to server. Defaults to STREAM_BUFFER_SIZE.
+        """
+        self.smtp_server = smtp_server
+        self.buffer_size = buffer_size
+        self.bytes = 0
+        self.__buffer = bytearray()
+        self.__line_start = True
+        self.__pending_cr = False
+
+    def write(self, data):
+        """
+        Write message data
+
+        Args:
+            data (bytes): message data
+
+        Returns:
+            int: number of bytes written
+        """
+        self.__buffer += data
+        self.bytes += len(data)
+        if len(self.__buffer) >= self.buffer_size:
+            self.__flush(False)
+        return len(data)
+
+    def __flush(self, last):
+        """
+        Send buffered data
+
+        Args:
+            last (bool): True if no more data will be written
+        """
+        data = self.__buffer
+        if self.__pending_cr:
+            data = b"\r" + data
+        # CR ending a chunk may be followed by LF in next chunk
+        self.__pending_cr = not last and data.endswith(b"\r")
+        if self.__pending_cr:
+            data = data[:-1]
+        data = EOL_RE.sub(b"\r\n", data)
+        if self.__line_start and data.startswith(b"."):
+            data = b"." + data
+        data = data.replace(b"\n.", b"\n..")
+        self.__buffer = bytearray()
+
+        if data:
+            self.__line_start = data.endswith(b"\n")
+            self.smtp_server.send(data)
+
+    def close(self):
+        """
+        Send remaining data and end of data marker
+        """
+        self.__flush(True)
+        self.smtp_server.send(b".\r\n" if self.__line_start else b"\r\n.\r\n")
+
+
+class BdatWriter:
+    """
+    Buffered writer sending message as BDAT chunks (RFC 3030). Data is sent untouched.
+    """
+
+    def __init__(self, smtp_server, chunk_size=BDAT_CHUNK_SIZE):
+        """
+        Constructor
+
+        Args:
+            smtp_server (SMTP): smtp server instance with envelope already sent
+            chunk_size (int, optional): chunk size. Defaults to BDAT_CHUNK_SIZE.
+        """
+        self.smtp_server = smtp_server
+        self.chunk_size = chunk_size
+        self.bytes = 0
+        self.__buffer = bytearray()
+
+    def write(self, data):
+        """
+        Write message data
+
+        Args:
+            data (bytes): message data
+
+        Returns:
+            int: number of bytes written
+
+        Raises:
+            SMTPDataError: if server refuses a chunk
+        """
+        self.__buffer += data
+        self.bytes += len(data)
+        if len(self.__buffer) >= self.chunk_size:
+            self.__send_chunk(False)
+        return len(data)
+
+    def __send_chunk(self, last):
+        """
+        Send buffered data as a chunk
+
+        Args:
+            last (bool): True if chunk is the last one
+        """
+        self.smtp_server.send(b"BDAT %d%s\r\n" % (len(self.__buffer), b" LAST" if last else b""))
+        self.smtp_server.send(self.__buffer)
+        self.__buffer = bytearray()
+        code, message = self.smtp_server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, message)
+
+    def close(self):
+        """
+        Send last chunk
+        """
+        self.__send_chunk(True)
+
+
+def get_transfer_mode(smtp_server):
+    """
+    Return the most compact transfer mode supported by server
+
+    Args:
+        smtp_server (SMTP): connected smtp server instance
+
+    Returns:
+        tuple: body type (BODY_7BIT, BODY_8BITMIME or BODY_BINARYMIME) and chunking flag (bool)
+    """
+    smtp_server.ehlo_or_helo_if_needed()
+    features = smtp_server.esmtp_features
+    chunking = "chunking" in features
+
+    if chunking and "binarymime" in features:
+        return BODY_BINARYMIME, chunking
+    if "8bitmime" in features:
+        return BODY_8BITMIME, chunking
+    return BODY_7BIT, chunking
+
+
+def set_text_content(mail, text, subtype, body_type):
+    """
+    Set message text content using the most compact transfer encoding allowed by body type
+
+    Args:
+        mail (EmailMessage): message
+        text (str): text content
+        subtype (str): text subtype (html, plain...)
+        body_type (str): negotiated body type
+    """
+    if body_type == BODY_7BIT:
+        mail.set_content(text, subtype=subtype)
+        return
+
+    encoded = text.encode("utf-8")
+    if max((len(line) for line in encoded.splitlines()), default=0) <= MAX_8BIT_LINE_LENGTH:
+        mail.set_content(text, subtype=subtype, cte="8bit")
+    elif body_type == BODY_BINARYMIME:
+        mail.set_content(
+            encoded,
+            maintype="text",
+            subtype=subtype,
+            cte="binary",
+            params={"charset": "utf-8"},
+        )
+    else:
+        mail.set_content(text, subtype=subtype)
+
+
+def get_bytes_content_options(body_type):
+    """
+    Return options to add binary content (attachment) to message according to body type
+
+    Args:
+        body_type (str): negotiated body type
+
+    Returns:
+        dict: add_attachment/set_content extra options
+    """
+    if body_type == BODY_BINARYMIME:
+        return {"cte": "binary"}
+    return {}
+
+
+def serialize_message(mail):
+    """
+    Serialize message as it will be sent on the wire (CRLF line endings)
+
+    Args:
+        mail (EmailMessage): message to serialize
+
+    Returns:
+        bytes: serialized message
+    """
+    buffer = BytesIO()
+    BinaryBytesGenerator(buffer).flatten(mail, linesep="\r\n")
+    return buffer.getvalue()
+
+
+def get_envelope(mail):
+    """
+    Return message envelope the same way smtplib send_message does
+
+    Args:
+        mail (EmailMessage): message
+
+    Returns:
+        tuple: sender (str) and recipients (list)
+    """
+    sender = parseaddr(mail["Sender"] or mail["From"])[1]
+    fields = mail.get_all("To", []) + mail.get_all("Cc", []) + mail.get_all("Bcc", [])
+    recipients = [address for _, address in getaddresses(fields)]
+    return sender, recipients
+
+
+def send_bdat(smtp_server, data, chunk_size=BDAT_CHUNK_SIZE):
+    """
+    Send message data using BDAT command (RFC 3030)
+
+    Args:
+        smtp_server (SMTP): smtp server instance with envelope already sent
+        data (bytes): serialized message
+        chunk_size (int, optional): chunk size. Defaults to BDAT_CHUNK_SIZE.
+
+    Returns:
+        tuple: last server reply (code, message)
+
+    Raises:
+        SMTPDataError: if server refuses a chunk
+    """
+    view = memoryview(data)
+    offset = 0
+    while True:
+        chunk = view[offset : offset + chunk_size]
+        offset += len(chunk)
+        last = offset >= len(view)
+        smtp_server.send(b"BDAT %d%s\r\n" % (len(chunk), b" LAST" if last else b""))
+        smtp_server.send(chunk)
+        code, message = smtp_server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, message)
+        if last:
+            return code, message
+
+
+def send_data(smtp_server, sender, recipients, data, body_type, chunking, envelope_id=None):
+    """
+    Send serialized message declaring its body type
+
+    Args:
+        smtp_server (SMTP): connected smtp server instance
+        sender (str): envelope sender
+        recipients (list): envelope recipients
+        data (bytes): serialized message
+        body_type (str): negotiated body type
+        chunking (bool): use BDAT instead of DATA
+        envelope_id (str, optional): request DSN with this envelope id. Defaults to None (no DSN).
+
+    Returns:
+        dict: refused recipients as returned by smtplib sendmail
+    """
+    if not chunking:
+        mail_options, rcpt_options = get_mail_options(body_type, envelope_id)
+        return smtp_server.sendmail(sender, recipients, data, mail_options, rcpt_options)
+
+    refused = send_envelope(smtp_server, sender, recipients, body_type, envelope_id)
+    send_bdat(smtp_server, data)
+
+    return refused
+
+
+def is_dsn_supported(smtp_server):
+    """
+    Return True if server accepts delivery status notification requests (RFC 3461)
+
+    Args:
+        smtp_server (SMTP): connected smtp server instance
+
+    Returns:
+        bool: True if DSN is supported
+    """
+    smtp_server.ehlo_or_helo_if_needed()
+    return "dsn" in smtp_server.esmtp_features
+
+
+def encode_xtext(value):
+    """
+    Encode value as xtext (RFC 3461)
+
+    Args:
+        value (str): value to encode
+
+    Returns:
+        str: encoded value
+    """
+    return "".join(
+        char if "!" <= char <= "~" and char not in "+=" else f"+{ord(char):02X}"
+        for char in value
+    )
+
+
+def decode_xtext(value):
+    """
+    Decode xtext value (RFC 3461)
+
+    Args:
+        value (str): encoded value
+
+    Returns:
+        str: decoded value
+    """
+    return XTEXT_RE.sub(lambda match: chr(int(match.group(1), 16)), value)
+
+
+def get_mail_options(body_type, envelope_id=None):
+    """
+    Return MAIL and RCPT commands options declaring body type and requesting DSN
+
+    DSN is requested for failed and delayed deliveries only, with original message
+    headers returned so bounces can be matched even if envelope id is lost.
+
+    Args:
+        body_type (str): negotiated body type
+        envelope_id (str, optional): request DSN with this envelope id. Defaults to None (no DSN).
+
+    Returns:
+        tuple: MAIL command options (list) and RCPT command options (list)
+    """
+    mail_options = [] if body_type == BODY_7BIT else [f"BODY={body_type}"]
+    rcpt_options = []
+    if envelope_id:
+        mail_options += ["RET=HDRS", f"ENVID={encode_xtext(envelope_id)}"]
+        rcpt_options.append("NOTIFY=FAILURE,DELAY")
+    return mail_options, rcpt_options
+
+
+def send_envelope(smtp_server, sender, recipients, body_type, envelope_id=None):
+    """
+    Send MAIL and RCPT commands
+
+    Args:
+        smtp_server (SMTP): connected smtp server instance
+        sender (str): envelope sender
+        recipients (list): envelope recipients
+        body_type (str): negotiated body type
+        envelope_id (str, optional): request DSN with this envelope id. Defaults to None (no DSN).
+
+    Returns:
+        dict: refused recipients as returned by smtplib sendmail
+
+    Raises:
+        SMTPSenderRefused: if server refuses sender
+        SMTPRecipientsRefused: if server refuses all recipients
+    """
+    smtp_server.ehlo_or_helo_if_needed()
+    mail_options, rcpt_options = get_mail_options(body_type, envelope_id)
+    code, message = smtp_server.mail(sender, mail_options)
+    if code != 250:
+        smtp_server.rset()
+        raise smtplib.SMTPSenderRefused(code, message, sender)
+    refused = {}
+    for recipient in recipients:
+        code, message = smtp_server.rcpt(recipient, rcpt_options)
+        if code not in (250, 251):
+            refused[recipient] = (code, message)
+    if len(refused) == len(recipients):
+        smtp_server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    return refused
+
+
+def stream_data(smtp_server, sender, recipients, mail, body_type, chunking, envelope_id=None):
+    """
+    Send message serialized incrementally to server
+
+    Message is written by the generator straight to a buffered socket writer instead of
+    being flattened first, so memory used does not grow with message size.
+
+    Args:
+        smtp_server (SMTP): connected smtp server instance
+        sender (str): envelope sender
+        recipients (list): envelope recipients
+        mail (EmailMessage): message to send (Bcc header already removed)
+        body_type (str): negotiated body type
+        chunking (bool): use BDAT instead of DATA
+        envelope_id (str, optional): request DSN with this envelope id. Defaults to None (no DSN).
+
+    Returns:
+        tuple: refused recipients (dict) as returned by smtplib sendmail and number of message bytes (int)
+
+    Raises:
+        SMTPDataError: if server refuses message
+    """
+    refused = send_envelope(smtp_server, sender, recipients, body_type, envelope_id)
+    if chunking:
+        writer = BdatWriter(smtp_server)
+    else:
+        code, message = smtp_server.docmd("data")
+        if code != 354:
+            smtp_server.rset()
+            raise smtplib.SMTPDataError(code, message)
+        writer = DataWriter(smtp_server)
+
+    StreamBytesGenerator(writer).flatten(mail, linesep="\r\n")
+    writer.close()
+
+    if not chunking:
+        code, message = smtp_server.getreply()
+        if code != 250:
+            smtp_server.rset()
+            raise smtplib.SMTPDataError(code, message)
+
+    return refused, writer.bytes
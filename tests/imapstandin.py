@@ -0,0 +1,121 @@
+import re
+import threading
+import socketserver
+
+
+class ImapStandinHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal IMAP4rev1 session serving a single mailbox
+    """
+
+    def reply(self, line):
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.reply(b"* OK [CAPABILITY IMAP4rev1] standin ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, command, *arguments = line.strip().split(b" ")
+            command = command.upper()
+            if command == b"CAPABILITY":
+                self.reply(b"* CAPABILITY IMAP4rev1")
+                self.reply(tag + b" OK CAPABILITY completed")
+            elif command == b"LOGIN":
+                self.reply(tag + b" OK LOGIN completed")
+            elif command in (b"SELECT", b"EXAMINE"):
+                uids = self.server.get_uids()
+                self.reply(b"* %d EXISTS" % len(uids))
+                self.reply(b"* OK [UIDVALIDITY %d] UIDs valid" % self.server.uid_validity)
+                self.reply(b"* OK [UIDNEXT %d] predicted next UID" % self.server.uid_next)
+                mode = b"READ-ONLY" if command == b"EXAMINE" else b"READ-WRITE"
+                self.reply(tag + b" OK [" + mode + b"] " + command + b" completed")
+            elif command == b"UID" and arguments[0].upper() == b"SEARCH":
+                self.server.searches.append(b" ".join(arguments[1:]))
+                uids = self.server.search(arguments[1:])
+                self.reply(b" ".join([b"* SEARCH"] + [str(uid).encode() for uid in uids]))
+                self.reply(tag + b" OK SEARCH completed")
+            elif command == b"UID" and arguments[0].upper() == b"FETCH":
+                uid = int(arguments[1])
+                if uid in self.server.dropped_fetches:
+                    # connection lost while fetching
+                    return
+                message = self.server.get_message(uid)
+                if message is not None:
+                    self.server.fetches.append(uid)
+                    self.wfile.write(
+                        b"* 1 FETCH (UID %d BODY[] {%d}\r\n" % (uid, len(message))
+                        + message
+                        + b")\r\n"
+                    )
+                self.reply(tag + b" OK FETCH completed")
+            elif command == b"LOGOUT":
+                self.reply(b"* BYE standin logging out")
+                self.reply(tag + b" OK LOGOUT completed")
+                return
+            else:
+                self.reply(tag + b" BAD unsupported command")
+
+
+class ImapStandin(socketserver.ThreadingTCPServer):
+    """
+    Local IMAP server for tests
+
+    Usage::
+
+        imap = ImapStandin()
+        imap.start()
+        imap.append(raw_message)
+        ... poll 127.0.0.1:imap.port ...
+        imap.stop()
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, uid_validity=1):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0), ImapStandinHandler)
+        self.uid_validity = uid_validity
+        self.uid_next = 1
+        self.searches = []
+        self.fetches = []
+        self.dropped_fetches = set()
+        self.__messages = {}
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def append(self, message):
+        with self.__lock:
+            self.__messages[self.uid_next] = message
+            self.uid_next += 1
+
+    def get_uids(self):
+        with self.__lock:
+            return sorted(self.__messages)
+
+    def get_message(self, uid):
+        with self.__lock:
+            return self.__messages.get(uid)
+
+    def search(self, criteria):
+        uids = self.get_uids()
+        if criteria[0].upper() != b"UID":
+            return uids
+        match = re.match(rb"(\d+):\*", criteria[1])
+        first = int(match.group(1))
+        selected = [uid for uid in uids if uid >= first]
+        # "n:*" always matches last message
+        return selected or uids[-1:]
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,47 @@
+import os
+
+
+class LocalFilesystem:
+    """
+    Cleep filesystem stand-in writing straight to local filesystem
+
+    Usage::
+
+        cleep_filesystem = LocalFilesystem()
+        app = session.setup(Email, bootstrap={"cleep_filesystem": cleep_filesystem})
+        ...
+        assert cleep_filesystem.writable == 0
+    """
+
+    def __init__(self):
+        # number of enable_write calls not yet balanced by disable_write
+        self.writable = 0
+
+    def enable_write(self, root=True, boot=False):
+        self.writable += 1
+
+    def disable_write(self, root=True, boot=False):
+        self.writable -= 1
+
+    def open(self, path, mode, encoding=None):
+        if "b" in mode:
+            return open(path, mode)
+        return open(path, mode, encoding=encoding)
+
+    def close(self, fd):
+        fd.close()
+
+    def mkdir(self, path, recursive=False):
+        if recursive:
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.mkdir(path)
+        return True
+
+    def rename(self, src, dst):
+        os.replace(src, dst)
+        return True
+
+    def rm(self, path):
+        os.remove(path)
+        return True
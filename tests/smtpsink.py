@@ -0,0 +1,112 @@
+import threading
+import socketserver
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP server session storing received messages
+    """
+
+    def reply(self, line):
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.server.add_session()
+        self.reply(b"220 sink ESMTP")
+        chunks = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.split(b" ", 1)[0].strip().upper()
+            if command == self.server.stall:
+                # never answer, as an overloaded server
+                self.server.released.wait(10)
+                return
+            if command == b"EHLO":
+                # first line is the greeting, last line has no continuation mark
+                lines = [b"sink"] + self.server.features
+                for feature in lines[:-1]:
+                    self.reply(b"250-" + feature)
+                self.reply(b"250 " + lines[-1])
+            elif command == b"DATA":
+                self.reply(b"354 go ahead")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b".\r\n", b""):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                self.server.store(b"".join(lines))
+                self.reply(b"250 queued")
+            elif command == b"BDAT":
+                arguments = line.split()
+                chunks.append(self.rfile.read(int(arguments[1])))
+                if len(arguments) > 2 and arguments[2].upper() == b"LAST":
+                    self.server.store(b"".join(chunks))
+                    chunks = []
+                self.reply(b"250 ok")
+            elif command in (b"MAIL", b"RCPT"):
+                self.server.add_command(line.strip())
+                self.reply(b"250 ok")
+            elif command == b"AUTH":
+                self.reply(b"235 authenticated")
+            elif command == b"QUIT":
+                self.reply(b"221 bye")
+                return
+            else:
+                self.reply(b"250 ok")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP sink for tests
+
+    Usage::
+
+        sink = SmtpSink()
+        sink.start()
+        ... send emails to 127.0.0.1:sink.port ...
+        sink.stop()
+        sink.messages
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, features=None, stall=None):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0), SmtpSinkHandler)
+        self.features = features or []
+        self.stall = stall
+        self.released = threading.Event()
+        self.messages = []
+        self.commands = []
+        self.sessions = 0
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def add_session(self):
+        with self.__lock:
+            self.sessions += 1
+
+    def add_command(self, command):
+        with self.__lock:
+            self.commands.append(command)
+
+    def store(self, message):
+        with self.__lock:
+            self.messages.append(message)
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.released.set()
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,300 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.bounces import parse_bounce, ImapBounceSource, PopBounceSource, BouncePoller
+from tests.imapstandin import ImapStandin
+from tests.localfilesystem import LocalFilesystem
+import os
+import json
+import tempfile
+import threading
+from unittest.mock import Mock, patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+def build_bounce(message_id, recipients, envelope_id=None, returned="headers"):
+    """
+    Build delivery status notification (RFC 3464) of message
+
+    Args:
+        message_id (str): original message Message-ID
+        recipients (list): tuples of (recipient, action, status)
+        envelope_id (str, optional): original envelope id (xtext). Defaults to None.
+        returned (str, optional): returned content (headers or message). Defaults to headers.
+    """
+    per_message = "Reporting-MTA: dns; relay.test.com\r\n"
+    if envelope_id:
+        per_message += f"Original-Envelope-Id: {envelope_id}\r\n"
+    per_recipients = "".join(
+        f"\r\nFinal-Recipient: rfc822; {recipient}\r\nAction: {action}\r\nStatus: {status}\r\n"
+        f"Diagnostic-Code: smtp; 550 mailbox unavailable\r\n"
+        for recipient, action, status in recipients
+    )
+    original = f"From: sender@test.com\r\nTo: a@test.com\r\nMessage-ID: {message_id}\r\nSubject: test\r\n"
+    if returned == "headers":
+        returned_part = f"Content-Type: text/rfc822-headers\r\n\r\n{original}"
+    else:
+        returned_part = f"Content-Type: message/rfc822\r\n\r\n{original}\r\nhello\r\n"
+    return (
+        "From: MAILER-DAEMON@relay.test.com\r\n"
+        "To: sender@test.com\r\n"
+        "Subject: Undelivered Mail Returned to Sender\r\n"
+        "MIME-Version: 1.0\r\n"
+        'Content-Type: multipart/report; report-type=delivery-status; boundary="BOUNDARY"\r\n'
+        "\r\n"
+        "--BOUNDARY\r\n"
+        "Content-Type: text/plain\r\n"
+        "\r\n"
+        "Your message could not be delivered.\r\n"
+        "--BOUNDARY\r\n"
+        "Content-Type: message/delivery-status\r\n"
+        "\r\n"
+        f"{per_message}{per_recipients}"
+        "--BOUNDARY\r\n"
+        f"{returned_part}"
+        "--BOUNDARY--\r\n"
+    ).encode()
+
+
+class TestParseBounce(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+
+    def test_parse_bounce(self):
+        bounce = build_bounce("<1@test.com>", [("a@test.com", "failed", "5.1.1"), ("b@test.com", "delayed", "4.4.1")])
+
+        statuses = parse_bounce(bounce)
+
+        self.assertEqual(statuses, [
+            {"messageid": "<1@test.com>", "recipient": "a@test.com", "status": "failed", "diagnostic": "5.1.1 smtp; 550 mailbox unavailable"},
+            {"messageid": "<1@test.com>", "recipient": "b@test.com", "status": "delayed", "diagnostic": "4.4.1 smtp; 550 mailbox unavailable"},
+        ])
+
+    def test_parse_bounce_envelope_id(self):
+        bounce = build_bounce("<other@test.com>", [("a@test.com", "failed", "5.1.1")], envelope_id="<1@test.com+2B>")
+
+        statuses = parse_bounce(bounce)
+
+        self.assertEqual(statuses[0]["messageid"], "<1@test.com+>")
+
+    def test_parse_bounce_returned_message(self):
+        bounce = build_bounce("<1@test.com>", [("a@test.com", "relayed", "2.0.0")], returned="message")
+
+        statuses = parse_bounce(bounce)
+
+        self.assertEqual(statuses[0]["messageid"], "<1@test.com>")
+        self.assertEqual(statuses[0]["status"], "delivered")
+
+    def test_parse_bounce_unknown_action_ignored(self):
+        bounce = build_bounce("<1@test.com>", [("a@test.com", "unknown", "5.0.0")])
+
+        self.assertEqual(parse_bounce(bounce), [])
+
+    def test_parse_not_a_bounce(self):
+        self.assertEqual(parse_bounce(b"From: a@test.com\r\nSubject: hello\r\n\r\nhello\r\n"), [])
+
+
+class TestImapBounceSource(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.imap = ImapStandin()
+        self.imap.start()
+        self.source = ImapBounceSource("127.0.0.1", self.imap.port, False, "login", "password")
+
+    def tearDown(self):
+        self.imap.stop()
+
+    def test_first_fetch_skips_existing_messages(self):
+        self.imap.append(b"Subject: old\r\n\r\nold\r\n")
+        state = {}
+
+        messages = self.source.fetch(state)
+
+        self.assertEqual(messages, [])
+        self.assertEqual(state, {"uidvalidity": 1, "lastuid": 1})
+        self.assertEqual(self.imap.fetches, [])
+
+    def test_fetch_incremental(self):
+        self.imap.append(b"Subject: old\r\n\r\nold\r\n")
+        state = {}
+        self.source.fetch(state)
+        self.imap.append(b"Subject: new1\r\n\r\nnew1\r\n")
+        self.imap.append(b"Subject: new2\r\n\r\nnew2\r\n")
+
+        messages = self.source.fetch(state)
+
+        self.assertEqual(messages, [b"Subject: new1\r\n\r\nnew1\r\n", b"Subject: new2\r\n\r\nnew2\r\n"])
+        self.assertEqual(state["lastuid"], 3)
+        self.assertEqual(self.imap.searches[-1], b"UID 2:*")
+
+    def test_fetch_nothing_new(self):
+        self.imap.append(b"Subject: old\r\n\r\nold\r\n")
+        state = {}
+        self.source.fetch(state)
+        self.imap.append(b"Subject: new\r\n\r\nnew\r\n")
+        self.source.fetch(state)
+
+        messages = self.source.fetch(state)
+
+        # last message matched by "3:*" range is not fetched again
+        self.assertEqual(messages, [])
+        self.assertEqual(self.imap.fetches, [2])
+
+    def test_fetch_uidvalidity_changed(self):
+        state = {"uidvalidity": 99, "lastuid": 50}
+        self.imap.append(b"Subject: old\r\n\r\nold\r\n")
+
+        messages = self.source.fetch(state)
+
+        self.assertEqual(messages, [])
+        self.assertEqual(state, {"uidvalidity": 1, "lastuid": 1})
+
+
+class TestPopBounceSource(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+
+    @patch("backend.bounces.poplib.POP3")
+    def test_fetch_incremental(self, pop_mock):
+        pop = pop_mock.return_value
+        pop.uidl.return_value = (b"+OK", [b"1 uid-a"], 0)
+        source = PopBounceSource("127.0.0.1", 110, False, "login", "password")
+        state = {}
+        self.assertEqual(source.fetch(state), [])
+        pop.uidl.return_value = (b"+OK", [b"1 uid-a", b"2 uid-b"], 0)
+        pop.retr.return_value = (b"+OK", [b"Subject: new", b"", b"new"], 0)
+
+        messages = source.fetch(state)
+
+        self.assertEqual(messages, [b"Subject: new\r\n\r\nnew"])
+        pop.retr.assert_called_once_with(2)
+        self.assertEqual(state, {"seen": ["uid-a", "uid-b"]})
+        pop.user.assert_called_with("login")
+        pop.pass_.assert_called_with("password")
+        pop.quit.assert_called()
+
+
+class TestBouncePoller(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_filepath = os.path.join(self.tmp_dir.name, "email.bounces")
+        self.callback = Mock()
+        self.cleep_filesystem = LocalFilesystem()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_poll(self):
+        source = Mock()
+        source.fetch.return_value = [
+            build_bounce("<1@test.com>", [("a@test.com", "failed", "5.1.1")]),
+            b"Subject: not a bounce\r\n\r\nhello\r\n",
+        ]
+        poller = BouncePoller(source, self.callback, self.state_filepath, self.cleep_filesystem)
+
+        self.assertEqual(poller.poll(), 1)
+
+        statuses = self.callback.call_args[0][0]
+        self.assertEqual([(status["messageid"], status["recipient"]) for status in statuses], [("<1@test.com>", "a@test.com")])
+
+    def test_poll_no_bounce(self):
+        source = Mock()
+        source.fetch.return_value = []
+        poller = BouncePoller(source, self.callback, self.state_filepath, self.cleep_filesystem)
+
+        self.assertEqual(poller.poll(), 0)
+
+        self.callback.assert_not_called()
+
+    def test_poll_state_persisted(self):
+        imap = ImapStandin()
+        imap.start()
+        try:
+            source = ImapBounceSource("127.0.0.1", imap.port, False, "login", "password")
+            imap.append(b"Subject: old\r\n\r\nold\r\n")
+            BouncePoller(source, self.callback, self.state_filepath, self.cleep_filesystem).poll()
+            imap.append(build_bounce("<1@test.com>", [("a@test.com", "failed", "5.1.1")]))
+
+            # new poller resumes from persisted state
+            BouncePoller(source, self.callback, self.state_filepath, self.cleep_filesystem).poll()
+        finally:
+            imap.stop()
+
+        with open(self.state_filepath) as filep:
+            self.assertEqual(json.load(filep), {"uidvalidity": 1, "lastuid": 2})
+        self.assertEqual(imap.fetches, [2])
+        self.callback.assert_called_once()
+
+    def test_poll_fetch_failure_keeps_state(self):
+        imap = ImapStandin()
+        imap.start()
+        try:
+            source = ImapBounceSource("127.0.0.1", imap.port, False, "login", "password", timeout=2.0)
+            poller = BouncePoller(source, self.callback, self.state_filepath, self.cleep_filesystem)
+            poller.poll()
+            imap.append(build_bounce("<1@test.com>", [("a@test.com", "failed", "5.1.1")]))
+            imap.append(build_bounce("<2@test.com>", [("b@test.com", "failed", "5.1.1")]))
+            imap.dropped_fetches.add(2)
+            with self.assertRaises(Exception):
+                poller.poll()
+
+            imap.dropped_fetches.clear()
+            self.assertEqual(poller.poll(), 2)
+        finally:
+            imap.stop()
+
+        statuses = self.callback.call_args[0][0]
+        self.assertEqual([status["messageid"] for status in statuses], ["<1@test.com>", "<2@test.com>"])
+        with open(self.state_filepath) as filep:
+            self.assertEqual(json.load(filep), {"uidvalidity": 1, "lastuid": 2})
+
+    def test_start_stop(self):
+        polled = threading.Event()
+        source = Mock()
+        source.fetch.side_effect = lambda state: polled.set() or []
+        poller = BouncePoller(source, self.callback, self.state_filepath, self.cleep_filesystem, interval=60)
+
+        poller.start()
+        self.assertTrue(polled.wait(5))
+        poller.stop()
+
+        source.fetch.assert_called_once()
+
+    def test_stop_waits_running_poll(self):
+        fetching = threading.Event()
+        release = threading.Event()
+        source = Mock()
+        source.fetch.side_effect = lambda state: fetching.set() or release.wait(5) and []
+        poller = BouncePoller(source, self.callback, self.state_filepath, self.cleep_filesystem)
+        polling = threading.Thread(target=poller.poll)
+        polling.start()
+        self.assertTrue(fetching.wait(5))
+
+        stopping = threading.Thread(target=poller.stop)
+        stopping.start()
+        stopping.join(0.2)
+        self.assertTrue(stopping.is_alive())
+        release.set()
+        stopping.join(5)
+        polling.join(5)
+
+        self.assertFalse(stopping.is_alive())
+        self.assertTrue(os.path.exists(self.state_filepath))
+        # stopped poller does not touch state anymore
+        os.remove(self.state_filepath)
+        self.assertEqual(poller.poll(), 0)
+        self.assertFalse(os.path.exists(self.state_filepath))
+        source.fetch.assert_called_once()
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_bounces.py; coverage report -m -i
+    unittest.main()
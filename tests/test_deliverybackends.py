@@ -0,0 +1,113 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.deliverybackends import DeliveryBackend, CaptureBackend, NullBackend
+from tests.localfilesystem import LocalFilesystem
+import os
+import mailbox
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+MESSAGE = b"From: sender@test.com\r\nTo: recipient@test.com\r\nSubject: test\r\n\r\ncontent\r\n"
+
+
+class TestNullBackend(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+
+    def test_deliver(self):
+        backend = NullBackend()
+
+        delivered = backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+        backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+
+        self.assertEqual(delivered, len(MESSAGE))
+        stats = backend.get_stats()
+        self.assertEqual(stats["backend"], "null")
+        self.assertEqual(stats["messages"], 2)
+        self.assertEqual(stats["bytes"], 2 * len(MESSAGE))
+        self.assertGreaterEqual(stats["duration"], 0.0)
+
+    def test_get_stats_no_delivery(self):
+        self.assertEqual(NullBackend().get_stats(), {
+            "backend": "null",
+            "messages": 0,
+            "bytes": 0,
+            "duration": 0.0,
+            "rate": 0.0,
+        })
+
+    def test_concurrent_deliveries(self):
+        backend = NullBackend()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: backend.deliver("s", ["r"], MESSAGE), range(500)))
+
+        self.assertEqual(backend.get_stats()["messages"], 500)
+
+    def test_interface(self):
+        with self.assertRaises(NotImplementedError):
+            DeliveryBackend().deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+
+
+class TestCaptureBackend(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cleep_filesystem = LocalFilesystem()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_maildir(self):
+        path = os.path.join(self.tmp_dir.name, "capture")
+        backend = CaptureBackend(path, self.cleep_filesystem)
+
+        backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+        backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+        backend.close()
+
+        messages = list(mailbox.Maildir(path, create=False))
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[0]["Subject"], "test")
+        self.assertEqual(backend.get_stats()["messages"], 2)
+        self.assertEqual(self.cleep_filesystem.writable, 0)
+
+    def test_mbox(self):
+        path = os.path.join(self.tmp_dir.name, "dir", "capture.mbox")
+        backend = CaptureBackend(path, self.cleep_filesystem, "mbox")
+
+        backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+        backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+        backend.close()
+
+        messages = list(mailbox.mbox(path, create=False))
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[1]["To"], "recipient@test.com")
+        self.assertTrue(messages[1].get_from().startswith("sender@test.com"))
+        self.assertNotIn(b"\r\n", messages[1].as_bytes())
+
+    def test_deliver_after_close(self):
+        path = os.path.join(self.tmp_dir.name, "capture")
+        backend = CaptureBackend(path, self.cleep_filesystem)
+        backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+        backend.close()
+
+        backend.deliver("sender@test.com", ["recipient@test.com"], MESSAGE)
+
+        self.assertEqual(len(mailbox.Maildir(path, create=False)), 2)
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            CaptureBackend(self.tmp_dir.name, self.cleep_filesystem, "mh")
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_deliverybackends.py; coverage report -m -i
+    unittest.main()
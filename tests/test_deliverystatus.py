@@ -0,0 +1,115 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.deliverystatus import DeliveryStatusIndex
+from tests.localfilesystem import LocalFilesystem
+import os
+import json
+import tempfile
+from unittest.mock import patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestDeliveryStatusIndex(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "email.status")
+        self.index = DeliveryStatusIndex(self.filepath, LocalFilesystem())
+        self.index.open()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_journal(self):
+        with open(self.filepath) as filep:
+            return [json.loads(line) for line in filep]
+
+    def test_add(self):
+        self.index.add("<1@test.com>", ["Ok@test.com", "refused@test.com"], {"refused@test.com": (550, b"No such user")})
+
+        entry = self.index.get("<1@test.com>")
+        self.assertEqual(entry["messageid"], "<1@test.com>")
+        self.assertDictEqual(entry["recipients"], {
+            "ok@test.com": {"status": "sent", "diagnostic": None},
+            "refused@test.com": {"status": "refused", "diagnostic": "550 No such user"},
+        })
+
+    def test_update_recipient(self):
+        self.index.add("<1@test.com>", ["a@test.com", "b@test.com"])
+
+        self.assertTrue(self.index.update("<1@test.com>", "A@test.com", "failed", "5.1.1"))
+
+        recipients = self.index.get("<1@test.com>")["recipients"]
+        self.assertEqual(recipients["a@test.com"], {"status": "failed", "diagnostic": "5.1.1"})
+        self.assertEqual(recipients["b@test.com"]["status"], "sent")
+
+    def test_update_all_recipients(self):
+        self.index.add("<1@test.com>", ["a@test.com", "b@test.com"])
+
+        self.index.update("<1@test.com>", None, "delayed")
+
+        recipients = self.index.get("<1@test.com>")["recipients"]
+        self.assertEqual([status["status"] for status in recipients.values()], ["delayed", "delayed"])
+
+    def test_update_unknown_message(self):
+        self.assertFalse(self.index.update("<unknown@test.com>", "a@test.com", "failed"))
+        self.assertIsNone(self.index.get("<unknown@test.com>"))
+
+    def test_get_returns_copy(self):
+        self.index.add("<1@test.com>", ["a@test.com"])
+
+        self.index.get("<1@test.com>")["recipients"]["a@test.com"]["status"] = "failed"
+
+        self.assertEqual(self.index.get("<1@test.com>")["recipients"]["a@test.com"]["status"], "sent")
+
+    def test_oldest_messages_dropped(self):
+        self.index.max_messages = 2
+        for number in range(3):
+            self.index.add(f"<{number}@test.com>", ["a@test.com"])
+
+        self.assertEqual([entry["messageid"] for entry in self.index.get_entries()], ["<1@test.com>", "<2@test.com>"])
+
+    def test_journal_reload(self):
+        self.index.add("<1@test.com>", ["a@test.com", "b@test.com"])
+        self.index.update("<1@test.com>", "b@test.com", "delivered")
+
+        index = DeliveryStatusIndex(self.filepath, LocalFilesystem())
+        index.open()
+        recipients = index.get("<1@test.com>")["recipients"]
+
+        self.assertEqual(recipients["a@test.com"]["status"], "sent")
+        self.assertEqual(recipients["b@test.com"]["status"], "delivered")
+
+    def test_journal_truncated_record_dropped(self):
+        self.index.add("<1@test.com>", ["a@test.com"])
+        with open(self.filepath, "a") as filep:
+            filep.write('{"op": "upd')
+
+        index = DeliveryStatusIndex(self.filepath, LocalFilesystem())
+        index.open()
+        entries = index.get_entries()
+
+        self.assertEqual(len(entries), 1)
+
+    @patch("backend.deliverystatus.DeliveryStatusIndex.COMPACT_MIN_RECORDS", 4)
+    def test_journal_compaction(self):
+        self.index.add("<1@test.com>", ["a@test.com"])
+        for _ in range(4):
+            self.index.update("<1@test.com>", "a@test.com", "delayed")
+        self.index.add("<2@test.com>", ["b@test.com"])
+
+        records = self.read_journal()
+
+        self.assertEqual([record["op"] for record in records], ["add", "add"])
+        self.assertEqual(records[0]["recipients"]["a@test.com"]["status"], "delayed")
+        self.assertEqual(records[1]["messageid"], "<2@test.com>")
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_deliverystatus.py; coverage report -m -i
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.deliverytracker import DeliveryTracker
+from tests.localfilesystem import LocalFilesystem
+import os
+import tempfile
+from unittest.mock import patch
+from cleep.exception import CommandError
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+POLLER = {
+    "protocol": "imap",
+    "server": "127.0.0.1",
+    "port": 143,
+    "ssl": False,
+    "login": "login",
+    "password": "password",
+    "mailbox": "INBOX",
+    "interval": 300,
+}
+
+
+class TestDeliveryTracker(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bounces_filepath = os.path.join(self.tmp_dir.name, "email.bounces")
+        self.tracker = DeliveryTracker(
+            os.path.join(self.tmp_dir.name, "email.status"), self.bounces_filepath, LocalFilesystem()
+        )
+        self.tracker.open()
+
+    def tearDown(self):
+        self.tracker.stop()
+        self.tmp_dir.cleanup()
+
+    def test_get_status(self):
+        self.tracker.status.add("<1@test.com>", ["a@test.com"])
+
+        self.assertEqual(self.tracker.get_status("<1@test.com>")["recipients"]["a@test.com"]["status"], "sent")
+        self.assertEqual(len(self.tracker.get_status()), 1)
+
+    def test_get_status_unknown_message(self):
+        with self.assertRaises(CommandError) as cm:
+            self.tracker.get_status("<unknown@test.com>")
+        self.assertEqual(str(cm.exception), 'Unknown message "<unknown@test.com>"')
+
+    def test_poll_not_configured(self):
+        with self.assertRaises(CommandError) as cm:
+            self.tracker.poll()
+        self.assertEqual(str(cm.exception), "Bounce poller is not configured")
+
+    @patch("backend.deliverytracker.BouncePoller")
+    def test_poll_updates_status(self, poller_mock):
+        self.tracker.status.add("<1@test.com>", ["a@test.com"])
+        self.tracker.configure_poller(POLLER)
+        callback = poller_mock.call_args.args[1]
+
+        callback([
+            {"messageid": "<1@test.com>", "recipient": "a@test.com", "status": "failed", "diagnostic": "5.1.1"},
+            {"messageid": "<unknown@test.com>", "recipient": "a@test.com", "status": "failed", "diagnostic": "5.1.1"},
+        ])
+
+        self.assertEqual(self.tracker.get_status("<1@test.com>")["recipients"]["a@test.com"]["status"], "failed")
+        poller_mock.return_value.start.assert_called()
+
+    @patch("backend.deliverytracker.BouncePoller")
+    def test_poll_failure(self, poller_mock):
+        poller_mock.return_value.poll.side_effect = OSError("Connection refused")
+        self.tracker.configure_poller(POLLER)
+
+        with self.assertRaises(CommandError) as cm:
+            self.tracker.poll()
+        self.assertEqual(str(cm.exception), "Unable to poll bounces: Connection refused")
+
+    @patch("backend.deliverytracker.BouncePoller")
+    def test_configure_poller_reset_state(self, poller_mock):
+        self.tracker.configure_poller(POLLER)
+        with open(self.bounces_filepath, "w") as filep:
+            filep.write("{}")
+
+        self.tracker.configure_poller(None, reset_state=True)
+
+        poller_mock.return_value.stop.assert_called()
+        self.assertFalse(os.path.exists(self.bounces_filepath))
+        with self.assertRaises(CommandError):
+            self.tracker.poll()
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_deliverytracker.py; coverage report -m -i
+    unittest.main()
@@ -4,13 +4,24 @@ import logging
 import sys
 sys.path.append('../')
 from backend.email import Email
+from backend.messagesender import MessageSender
+from tests.smtpsink import SmtpSink
+from tests.imapstandin import ImapStandin
+from tests.localfilesystem import LocalFilesystem
+from tests.test_bounces import build_bounce
 import os
+import io
 import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from email import message_from_bytes, policy
 from copy import deepcopy
 from unittest.mock import Mock, patch, mock_open
 from cleep.libs.tests.common import get_log_level
 from cleep.exception import CommandError, MissingParameter, InvalidParameter
 import smtplib
+import mailbox
 from cleep.libs.internals.tools import TRACE
 
 LOG_LEVEL = get_log_level()
@@ -28,12 +39,17 @@ CONFIG_CUSTOM = {
 class TestEmail(unittest.TestCase):
 
     def setUp(self):
+        self.config_dir = tempfile.TemporaryDirectory()
+        self.config_dir_patcher = patch.object(Email, "CONFIG_DIR", self.config_dir.name)
+        self.config_dir_patcher.start()
         self.session = session.TestSession(self)
         logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
-        self.app = self.session.setup(Email)
+        self.app = self.session.setup(Email, bootstrap={"cleep_filesystem": LocalFilesystem()})
 
     def tearDown(self):
         self.session.clean()
+        self.config_dir_patcher.stop()
+        self.config_dir.cleanup()
 
     def test_get_module_config(self):
         self.app._get_config = Mock(return_value=deepcopy(CONFIG_CUSTOM))
@@ -72,11 +88,12 @@ class TestEmail(unittest.TestCase):
 
         self.assertFalse(result)
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
-    @patch("backend.email.os.path.isfile", Mock(return_value=True))
-    @patch("backend.email.mimetypes.guess_type", Mock(return_value=(None, None)))
-    @patch("backend.email.open", new_callable=mock_open, read_data="some content")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=(None, None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data="some content")
     def test_send_email_ssl(self, open_mock, smtpssl_mock, emailmessage_mock):
         self.app._Email__get_config = Mock(return_value={
             "provider": "gmail",
@@ -91,13 +108,14 @@ class TestEmail(unittest.TestCase):
         emailmessage_mock.return_value.__setitem__.assert_any_call('Subject', 'test')
         emailmessage_mock.return_value.__setitem__.assert_any_call('From', 'forced-sender')
         emailmessage_mock.return_value.add_attachment.assert_called_with("some content", maintype="application", subtype="octet-stream", filename="attachment1.txt")
-        smtpssl_mock.return_value.send_message.assert_called()
-
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP")
-    @patch("backend.email.os.path.isfile", Mock(return_value=True))
-    @patch("backend.email.mimetypes.guess_type", Mock(return_value=(None, None)))
-    @patch("backend.email.open", new_callable=mock_open, read_data="some content")
+        smtpssl_mock.return_value.sendmail.assert_called()
+
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=(None, None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data="some content")
     def test_send_email(self, open_mock, smtp_mock, emailmessage_mock):
         self.app._Email__get_config = Mock(return_value={
             "provider": "gmail",
@@ -112,13 +130,14 @@ class TestEmail(unittest.TestCase):
         emailmessage_mock.return_value.__setitem__.assert_any_call('Subject', 'test')
         emailmessage_mock.return_value.__setitem__.assert_any_call('From', 'forced-sender')
         emailmessage_mock.return_value.add_attachment.assert_called_with("some content", maintype="application", subtype="octet-stream", filename="attachment1.txt")
-        smtp_mock.return_value.send_message.assert_called()
-
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP")
-    @patch("backend.email.os.path.isfile", Mock(return_value=True))
-    @patch("backend.email.mimetypes.guess_type", Mock(return_value=(None, None)))
-    @patch("backend.email.open", new_callable=mock_open, read_data="some content")
+        smtp_mock.return_value.sendmail.assert_called()
+
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=(None, None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data="some content")
     def test_send_email_tls(self, open_mock, smtp_mock, emailmessage_mock):
         self.app._Email__get_config = Mock(return_value={
             "provider": "gmail",
@@ -131,11 +150,12 @@ class TestEmail(unittest.TestCase):
 
         smtp_mock.return_value.starttls.assert_called()
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP")
-    @patch("backend.email.os.path.isfile", Mock(return_value=True))
-    @patch("backend.email.mimetypes.guess_type", Mock(return_value=(None, None)))
-    @patch("backend.email.open", new_callable=mock_open, read_data="some content")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=(None, None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data="some content")
     def test_send_email_enable_debug(self, open_mock, smtp_mock, emailmessage_mock):
         self.app._Email__get_config = Mock(return_value={
             "provider": "gmail",
@@ -144,18 +164,68 @@ class TestEmail(unittest.TestCase):
             "tls": True,
         })
         orig_getEffectiveLevel = self.app.logger.getEffectiveLevel
-        self.app.logger.getEffectiveLevel = Mock(side_effect=[TRACE])
+        self.app.logger.getEffectiveLevel = Mock(return_value=TRACE)
 
         self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc', ['/tmp/attachment1.txt'], 'forced-sender')
 
         smtp_mock.return_value.set_debuglevel.assert_called()
         self.app.logger.getEffectiveLevel = orig_getEffectiveLevel
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
-    @patch("backend.email.os.path.isfile", Mock(return_value=False))
-    @patch("backend.email.mimetypes.guess_type", Mock(return_value=(None, None)))
-    @patch("backend.email.open", new_callable=mock_open, read_data="some content")
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_8bitmime(self, smtp_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+            "ssl": False,
+        })
+        smtp_mock.return_value.esmtp_features = {"8bitmime": ""}
+
+        self.app.send_email('test', 'contenu accentué', 'recipient@test.com')
+
+        args, _ = smtp_mock.return_value.sendmail.call_args
+        self.assertEqual(args[1], ["recipient@test.com"])
+        self.assertIn(b"Content-Transfer-Encoding: 8bit", args[2])
+        self.assertIn("contenu accentué".encode("utf-8"), args[2])
+        self.assertEqual(args[3], ["BODY=8BITMIME"])
+
+    @patch("backend.relayconnection.RelaySMTP")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=(None, None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data=b"\x00\xff\r\n.binary")
+    def test_send_email_binarymime_chunking(self, open_mock, smtp_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+            "ssl": False,
+        })
+        smtp_mock.return_value.esmtp_features = {"8bitmime": "", "binarymime": "", "chunking": ""}
+        smtp_mock.return_value.mail.return_value = (250, b"ok")
+        smtp_mock.return_value.rcpt.return_value = (250, b"ok")
+        smtp_mock.return_value.getreply.return_value = (250, b"ok")
+
+        self.app.send_email('test', 'some email content', 'recipient@test.com', attachments=['/tmp/attachment1.bin'])
+
+        smtp_mock.return_value.sendmail.assert_not_called()
+        smtp_mock.return_value.mail.assert_called_with("login", ["BODY=BINARYMIME"])
+        smtp_mock.return_value.rcpt.assert_called_with("recipient@test.com", [])
+        command, data = [call.args[0] for call in smtp_mock.return_value.send.call_args_list]
+        self.assertEqual(command, b"BDAT %d LAST\r\n" % len(data))
+        self.assertIn(b"\r\n\r\n\x00\xff\r\n.binary\r\n--", bytes(data))
+        reports = self.app.get_send_reports()
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(reports[0]["bodytype"], "BINARYMIME")
+        self.assertTrue(reports[0]["chunking"])
+        self.assertEqual(reports[0]["payloadbytes"], len(b"<html><head></head><body>some email content</body>") + 11)
+        self.assertEqual(reports[0]["wirebytes"], len(data))
+
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=False))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=(None, None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data="some content")
     def test_send_email_invalid_attachment_path(self, open_mock, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
@@ -167,105 +237,467 @@ class TestEmail(unittest.TestCase):
 
         open_mock.assert_not_called()
         emailmessage_mock.return_value.add_attachment.assert_not_called()
+        self.assertEqual(self.app.get_send_reports()[0]["missingattachments"], ['/tmp/attachment1.txt'])
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
+    def test_send_email_in_memory_attachments(self, smtpssl_mock, emailmessage_mock):
+        self.app._get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+        })
+        content = memoryview(b"a,b\n1,2")
+        attachments = [
+            {"filename": "report.csv", "content": content},
+            {"filename": "frame.raw", "content": io.BytesIO(b"frame"), "mimetype": "image/x-raw"},
+        ]
+
+        self.app.send_email('test', 'some email content', 'recipient', attachments=attachments)
+
+        calls = emailmessage_mock.return_value.add_attachment.call_args_list
+        self.assertIs(calls[0].args[0], content)
+        self.assertEqual(calls[0].kwargs, {"maintype": "text", "subtype": "csv", "filename": "report.csv"})
+        self.assertEqual(calls[1].args[0], b"frame")
+        self.assertEqual(calls[1].kwargs, {"maintype": "image", "subtype": "x-raw", "filename": "frame.raw"})
+        self.assertEqual(self.app.get_send_reports()[0]["missingattachments"], [])
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_in_memory_attachments_binarymime(self, smtp_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+            "ssl": False,
+        })
+        smtp_mock.return_value.esmtp_features = {"binarymime": "", "chunking": ""}
+        smtp_mock.return_value.mail.return_value = (250, b"ok")
+        smtp_mock.return_value.rcpt.return_value = (250, b"ok")
+        smtp_mock.return_value.getreply.return_value = (250, b"ok")
+
+        self.app.send_email('test', 'some email content', 'recipient@test.com', attachments=[{"filename": "data.bin", "content": memoryview(b"\x00\x01")}])
+
+        data = bytes(smtp_mock.return_value.send.call_args_list[1].args[0])
+        self.assertIn(b"\r\n\r\n\x00\x01\r\n--", data)
+
+    def test_send_email_invalid_attachments(self):
+        invalid_attachments = [
+            [1],
+            [{"content": b"data"}],
+            [{"filename": "file.txt"}],
+            [{"filename": "file.txt", "content": "data"}],
+            [{"filename": "file.txt", "content": b"data", "mimetype": "text"}],
+        ]
+        for attachments in invalid_attachments:
+            with self.assertRaises(InvalidParameter):
+                self.app.send_email('test', 'content', 'recipient', attachments=attachments)
+
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
     def test_send_email_smtp_server_disconnected(self, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
             "login": "login",
             "password": "password",
         })
-        smtpssl_mock.return_value.send_message.side_effect = smtplib.SMTPServerDisconnected()
+        smtpssl_mock.return_value.sendmail.side_effect = smtplib.SMTPServerDisconnected()
         
         with self.assertRaises(CommandError) as cm:
             self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc')
         self.assertEqual(str(cm.exception), 'Server disconnected')
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
     def test_send_email_smtp_sender_refused(self, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
             "login": "login",
             "password": "password",
         })
-        smtpssl_mock.return_value.send_message.side_effect = smtplib.SMTPSenderRefused(code=123, msg="message", sender="email")
+        smtpssl_mock.return_value.sendmail.side_effect = smtplib.SMTPSenderRefused(code=123, msg="message", sender="email")
         
         with self.assertRaises(CommandError) as cm:
             self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc')
         self.assertEqual(str(cm.exception), 'Email sender must be a valid email address')
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
     def test_send_email_smtp_recipients_refused(self, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
             "login": "login",
             "password": "password",
         })
-        smtpssl_mock.return_value.send_message.side_effect = smtplib.SMTPRecipientsRefused(recipients="recipients")
+        smtpssl_mock.return_value.sendmail.side_effect = smtplib.SMTPRecipientsRefused(recipients="recipients")
         
         with self.assertRaises(CommandError) as cm:
             self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc')
         self.assertEqual(str(cm.exception), "Some recipients were refused")
         
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
     def test_send_email_smtp_data_error(self, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
             "login": "login",
             "password": "password",
         })
-        smtpssl_mock.return_value.send_message.side_effect = smtplib.SMTPDataError(code=123, msg="error")
+        smtpssl_mock.return_value.sendmail.side_effect = smtplib.SMTPDataError(code=123, msg="error")
         
         with self.assertRaises(CommandError) as cm:
             self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc')
         self.assertEqual(str(cm.exception), "Problem with email content")
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
     def test_send_email_smtp_connect_error(self, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
             "login": "login",
             "password": "password",
         })
-        smtpssl_mock.return_value.send_message.side_effect = smtplib.SMTPConnectError(code=123, msg="error")
+        smtpssl_mock.return_value.sendmail.side_effect = smtplib.SMTPConnectError(code=123, msg="error")
         
         with self.assertRaises(CommandError) as cm:
             self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc')
         self.assertEqual(str(cm.exception), "Unable to establish connection with smtp server. Please check server address")
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
     def test_send_email_smtp_authentication_error(self, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
             "login": "login",
             "password": "password",
         })
-        smtpssl_mock.return_value.send_message.side_effect = smtplib.SMTPAuthenticationError(code=123, msg="error")
+        smtpssl_mock.return_value.sendmail.side_effect = smtplib.SMTPAuthenticationError(code=123, msg="error")
         
         with self.assertRaises(CommandError) as cm:
             self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc')
         self.assertEqual(str(cm.exception), "Authentication failed. Please check credentials.")
 
-    @patch("backend.email.EmailMessage")
-    @patch("backend.email.smtplib.SMTP_SSL")
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP_SSL")
     def test_send_email_non_smtp_error(self, smtpssl_mock, emailmessage_mock):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
             "login": "login",
             "password": "password",
         })
-        smtpssl_mock.return_value.send_message.side_effect = Exception("Test error")
+        smtpssl_mock.return_value.sendmail.side_effect = Exception("Test error")
         
         with self.assertRaises(CommandError) as cm:
             self.app.send_email('test', 'some email content', 'recipient', 'cc', 'bcc')
         self.assertEqual(str(cm.exception), "Unable to send email. Please check configuration")
 
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_timeout(self, smtp_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+        })
+        release = threading.Event()
+        smtp_mock.return_value.login.side_effect = lambda *args: release.wait(2.0)
+
+        with self.assertRaises(CommandError) as cm:
+            self.app.send_email('test', 'some email content', 'recipient', timeout=1)
+        self.assertEqual(str(cm.exception), "Email sending timed out")
+        smtp_mock.return_value.close.assert_called()
+        release.set()
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_build_failure_closes_session(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server", port=25, login="login", password="password")
+        content = Mock()
+        content.read.side_effect = OSError("Test error")
+
+        with self.assertRaises(CommandError) as cm:
+            self.app.send_email('test', 'content', 'recipient@test.com', attachments=[{"filename": "data.bin", "content": content}])
+
+        self.assertEqual(str(cm.exception), "Unable to send email. Please check configuration")
+        smtp_mock.return_value.close.assert_called()
+        smtp_mock.return_value.sendmail.assert_not_called()
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_config_snapshot(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server1", port=25, login="login1", password="password1")
+        logged_in = threading.Event()
+        release = threading.Event()
+        def login(*args):
+            logged_in.set()
+            release.wait(2.0)
+        smtp_mock.return_value.login.side_effect = login
+        sender = threading.Thread(target=self.app.send_email, args=('test', 'content', 'recipient@test.com'))
+        sender.start()
+        logged_in.wait(2.0)
+
+        self.app.set_config(provider="custom", server="server2", port=25, login="login2", password="password2")
+        release.set()
+        sender.join()
+        self.app.send_email('test', 'content', 'recipient@test.com')
+
+        self.assertEqual(smtp_mock.call_args_list[0].args, ("server1", 25))
+        self.assertEqual(smtp_mock.call_args_list[1].args, ("server2", 25))
+        self.assertEqual(smtp_mock.return_value.login.call_args_list[0].args, ("login1", "password1"))
+        self.assertEqual(smtp_mock.return_value.login.call_args_list[1].args, ("login2", "password2"))
+        self.assertEqual(smtp_mock.return_value.sendmail.call_count, 2)
+
+    def test_send_email_check_timeout_param(self):
+        with self.assertRaises(InvalidParameter):
+            self.app.send_email('test', 'content', 'recipient', timeout=0)
+
+    def test_send_email_phase_timeout(self):
+        sink = SmtpSink([b"AUTH PLAIN LOGIN"], stall=b"AUTH")
+        sink.start()
+        self.addCleanup(sink.stop)
+        self.app.set_config(provider="custom", server="127.0.0.1", port=sink.port, login="login", password="password")
+        self.app.set_timeouts(auth=1)
+
+        start = time.monotonic()
+        with self.assertRaises(CommandError) as cm:
+            self.app.send_email('test', 'content', 'recipient@test.com')
+
+        self.assertEqual(str(cm.exception), "Smtp server did not answer in time (auth phase). Please check server address")
+        self.assertLess(time.monotonic() - start, 5)
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_set_timeouts(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server", port=25, login="login", password="password")
+        self.app.set_timeouts(connect=5, tls=6, auth=7, data=30)
+
+        self.app.send_email('test', 'content', 'recipient@test.com')
+
+        self.assertEqual(smtp_mock.call_args.kwargs["timeout"], 5.0)
+        smtp_mock.return_value.sock.settimeout.assert_any_call(7.0)
+        smtp_mock.return_value.sock.settimeout.assert_any_call(30.0)
+        stats = self.app.get_relay_latencies()
+        self.assertEqual(sorted(stats["server:25"].keys()), ["auth", "connect", "data"])
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_enable_profiling(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server", port=25)
+        self.assertTrue(self.app.enable_profiling(1, memory=True))
+
+        self.app.send_email('test', 'content', 'recipient@test.com')
+        self.app.send_email('test', 'content', 'recipient@test.com')
+
+        status = self.app.get_profiling_status()
+        self.assertEqual(status["remaining"], 0)
+        self.assertEqual(len(status["files"]), 2)
+        for filepath in status["files"]:
+            self.assertEqual(os.path.dirname(filepath), os.path.join(self.config_dir.name, "email.profiles"))
+            self.assertTrue(os.path.exists(filepath))
+        self.assertEqual(smtp_mock.return_value.sendmail.call_count, 2)
+
+    def test_disable_profiling(self):
+        self.app.enable_profiling(3)
+
+        self.app.disable_profiling()
+
+        self.assertEqual(self.app.get_profiling_status()["remaining"], 0)
+
+    def test_enable_profiling_check_params(self):
+        with self.assertRaises(InvalidParameter) as cm:
+            self.app.enable_profiling(0)
+        self.assertEqual(str(cm.exception), "Number of sends to profile must be greater than 0")
+        with self.assertRaises(InvalidParameter):
+            self.app.enable_profiling(1, memory="yes")
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_capture_backend(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server", port=25)
+        self.app.set_delivery_backend("capture")
+
+        self.app.send_email('test', 'content', 'recipient@test.com', bcc='hidden@test.com')
+
+        smtp_mock.assert_not_called()
+        messages = list(mailbox.Maildir(os.path.join(self.config_dir.name, "email.capture"), create=False))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]["To"], "recipient@test.com")
+        self.assertIsNone(messages[0]["Bcc"])
+        self.assertEqual(self.app.get_send_reports()[0]["delivery"], "capture")
+        self.assertEqual(self.app.get_delivery_stats()["messages"], 1)
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_null_backend(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server", port=25)
+        self.app.set_delivery_backend("null")
+
+        for _ in range(3):
+            self.app.send_email('test', 'content', 'recipient@test.com')
+
+        smtp_mock.assert_not_called()
+        stats = self.app.get_delivery_stats()
+        self.assertEqual(stats["messages"], 3)
+        self.assertEqual(stats["bytes"], sum(report["wirebytes"] for report in self.app.get_send_reports()))
+
+    def test_send_email_null_backend_without_relay(self):
+        self.app.set_delivery_backend("null")
+
+        self.assertTrue(self.app.send_email('test', 'content', 'recipient@test.com'))
+
+        self.assertEqual(self.app.get_delivery_stats()["messages"], 1)
+        self.app.set_delivery_backend("smtp")
+        with self.assertRaises(MissingParameter):
+            self.app.send_email('test', 'content', 'recipient@test.com')
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_set_delivery_backend_smtp(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server", port=25)
+        self.app.set_delivery_backend("null")
+
+        self.app.set_delivery_backend("smtp")
+        self.app.send_email('test', 'content', 'recipient@test.com')
+
+        smtp_mock.return_value.sendmail.assert_called()
+        self.assertIsNone(self.app.get_delivery_stats())
+        self.assertEqual(self.app.get_send_reports()[0]["delivery"], "smtp")
+
+    def test_set_delivery_backend_check_params(self):
+        with self.assertRaises(InvalidParameter) as cm:
+            self.app.set_delivery_backend("sendmail")
+        self.assertEqual(str(cm.exception), "Delivery backend must be choosen from list")
+        with self.assertRaises(InvalidParameter) as cm:
+            self.app.set_delivery_backend("capture", capture_format="mh")
+        self.assertEqual(str(cm.exception), "Capture format must be maildir or mbox")
+
+    def test_set_timeouts_check_params(self):
+        with self.assertRaises(InvalidParameter):
+            self.app.set_timeouts(connect=0)
+        with self.assertRaises(InvalidParameter):
+            self.app.set_timeouts(data="60")
+        with self.assertRaises(InvalidParameter):
+            self.app.set_timeouts(adaptive=1)
+
+    def wait_warm_session(self):
+        for _ in range(100):
+            if self.app._Email__sessions.warm_session:
+                return
+            time.sleep(0.01)
+        self.fail("Session not pre-warmed")
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_uses_prewarmed_session(self, smtp_mock):
+        smtp_mock.return_value.noop.return_value = (250, b"ok")
+        self.app.set_config(provider="custom", server="server", port=25, login="login", password="password")
+        self.app.set_prewarm(True)
+        self.wait_warm_session()
+
+        self.app.send_email('test', 'content', 'recipient@test.com')
+
+        self.assertEqual(smtp_mock.call_count, 1)
+        smtp_mock.return_value.login.assert_called_once_with("login", "password")
+        smtp_mock.return_value.noop.assert_called()
+        smtp_mock.return_value.sendmail.assert_called()
+        self.assertIsNone(self.app._Email__sessions.warm_session)
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_prewarmed_session_closed(self, smtp_mock):
+        smtp_mock.return_value.noop.side_effect = smtplib.SMTPServerDisconnected()
+        self.app.set_config(provider="custom", server="server", port=25)
+        self.app.set_prewarm(True)
+        self.wait_warm_session()
+
+        self.app.send_email('test', 'content', 'recipient@test.com')
+
+        self.assertEqual(smtp_mock.call_count, 2)
+        smtp_mock.return_value.sendmail.assert_called()
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_set_config_prewarms_new_session(self, smtp_mock):
+        self.app.set_config(provider="custom", server="server1", port=25)
+        self.app.set_prewarm(True)
+        self.wait_warm_session()
+        first_session = self.app._Email__sessions.warm_session
+
+        self.app.set_config(provider="custom", server="server2", port=25)
+        for _ in range(100):
+            if self.app._Email__sessions.warm_session is not first_session:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(smtp_mock.call_args.args, ("server2", 25))
+        self.assertEqual(self.app._Email__sessions.warm_session[0]["server"], "server2")
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_set_prewarm_disable(self, smtp_mock):
+        smtp_mock.return_value.noop.return_value = (250, b"ok")
+        self.app.set_config(provider="custom", server="server", port=25)
+        self.app.set_prewarm(True)
+        self.wait_warm_session()
+
+        self.app.set_prewarm(False)
+
+        self.assertIsNone(self.app._Email__sessions.warm_session)
+        smtp_mock.return_value.quit.assert_called()
+        self.assertFalse(self.app._get_config()["prewarm"])
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_prewarm_failure(self, smtp_mock):
+        smtp_mock.side_effect = OSError("Test error")
+        self.app.set_config(provider="custom", server="server", port=25)
+
+        self.app.set_prewarm(True)
+        time.sleep(0.1)
+
+        self.assertIsNone(self.app._Email__sessions.warm_session)
+
+    def test_schedule_email(self):
+        self.app.send_email = Mock(return_value=True)
+
+        scheduled_id = self.app.schedule_email(int(time.time()), "subject", "content", "recipient@test.com", attachments=["/tmp/file.txt"])
+        for _ in range(100):
+            if self.app.send_email.called:
+                break
+            time.sleep(0.01)
+
+        self.assertIsInstance(scheduled_id, str)
+        self.app.send_email.assert_called_with(
+            subject="subject",
+            content="content",
+            recipient="recipient@test.com",
+            cc=None,
+            bcc=None,
+            attachments=["/tmp/file.txt"],
+            sender=None,
+            inline_images=None,
+        )
+
+    def test_cancel_scheduled(self):
+        self.app.send_email = Mock(return_value=True)
+        scheduled_id = self.app.schedule_email(int(time.time()) + 3600, "subject", "content", "recipient@test.com")
+        self.assertEqual(len(self.app.get_scheduled_emails()), 1)
+        self.assertEqual(self.app.get_scheduled_emails()[0]["id"], scheduled_id)
+
+        cancelled = self.app.cancel_scheduled(scheduled_id)
+
+        self.assertTrue(cancelled)
+        self.assertEqual(self.app.get_scheduled_emails(), [])
+        self.assertFalse(self.app.cancel_scheduled(scheduled_id))
+
+    def test_scheduled_emails_persisted(self):
+        scheduled_id = self.app.schedule_email(int(time.time()) + 3600, "subject", "content", "recipient@test.com")
+
+        with open(os.path.join(self.config_dir.name, "email.schedule")) as filep:
+            self.assertIn(scheduled_id, filep.read())
+
+    def test_schedule_email_check_params(self):
+        with self.assertRaises(InvalidParameter):
+            self.app.schedule_email("now", "subject", "content", "recipient@test.com")
+        with self.assertRaises(InvalidParameter):
+            self.app.schedule_email(0, "subject", "content", "recipient@test.com", attachments=[{"filename": "f", "content": b""}])
+        with self.assertRaises(InvalidParameter):
+            self.app.cancel_scheduled("")
+
     def test__get_config_for_known_provider(self):
         self.app._get_config = Mock(return_value={
             "provider": "gmail",
@@ -283,7 +715,9 @@ class TestEmail(unittest.TestCase):
             "tls": False,
             "sender": None,
             "login": "login",
-            "password": "password",
+            "password": "password",    "timeouts": None,
+            "adaptivetimeouts": None,
+            "dsn": None,
         })
 
     def test__get_config_for_custom_provider(self):
@@ -308,7 +742,9 @@ class TestEmail(unittest.TestCase):
             "tls": True,
             "sender": "someone@test.com",
             "login": "login",
-            "password": "password",
+            "password": "password",    "timeouts": None,
+            "adaptivetimeouts": None,
+            "dsn": None,
         })
 
     def test__get_config_no_login_for_known_provider(self):
@@ -417,6 +853,163 @@ class TestEmail(unittest.TestCase):
         #     saved = self.app.set_config(provider="gmail", sender="")
         # self.assertEqual(str(cm.exception), 'Parameter "sender" is invalid (specified="")')
 
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_inline_images(self, smtp_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+        })
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logo = os.path.join(tmp_dir, "logo.png")
+            with open(logo, "wb") as filep:
+                filep.write(b"logo content")
+            attachment = os.path.join(tmp_dir, "report.csv")
+            with open(attachment, "w") as filep:
+                filep.write("a,b")
+
+            self.app.send_email('test', '<img src="cid:logo">', 'recipient@test.com', attachments=[attachment], inline_images={"logo": logo})
+            self.app.send_email('test', '<img src="cid:logo">', 'recipient@test.com', inline_images={"logo": logo})
+
+        messages = [message_from_bytes(call.args[2], policy=policy.default) for call in smtp_mock.return_value.sendmail.call_args_list]
+        self.assertEqual(messages[0].get_content_type(), "multipart/mixed")
+        related = messages[0].get_payload(0)
+        self.assertEqual(related.get_content_type(), "multipart/related")
+        self.assertEqual(related.get_payload(0).get_content_type(), "text/html")
+        self.assertEqual(related.get_payload(1)["Content-ID"], "<logo>")
+        self.assertEqual(related.get_payload(1).get_content(), b"logo content")
+        self.assertEqual(messages[0].get_payload(1).get_filename(), "report.csv")
+        self.assertEqual(messages[1].get_content_type(), "multipart/related")
+        self.assertEqual(messages[1].get_payload(1).get_content(), b"logo content")
+        self.assertEqual(self.app._Email__sender.inline_resources.hits, 1)
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_send_email_inline_images_not_found(self, smtp_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+        })
+
+        self.app.send_email('test', '<img src="cid:logo">', 'recipient@test.com', inline_images={"logo": "/tmp/notfound.png"})
+
+        message = message_from_bytes(smtp_mock.return_value.sendmail.call_args.args[2], policy=policy.default)
+        self.assertEqual(message.get_content_type(), "text/html")
+
+    def test_send_email_inline_images_check_params(self):
+        with self.assertRaises(InvalidParameter):
+            self.app.send_email('test', 'content', 'recipient@test.com', inline_images={"logo": 1})
+
+    @patch("backend.email.ImageTransformer")
+    def test_set_image_transform(self, transformer_mock):
+        self.app._update_config(
+            {"imagetransform": False, "imagemaxdimension": 1280, "imagequality": 75}
+        )
+        transformer_mock.is_available.return_value = True
+
+        saved = self.app.set_image_transform(True, max_dimension=640, quality=50)
+
+        self.assertTrue(saved)
+        self.assertTrue(self.app._get_config()["imagetransform"])
+        transformer_mock.assert_called_with(640, 50)
+
+    @patch("backend.email.ImageTransformer")
+    def test_set_image_transform_disable(self, transformer_mock):
+        transformer_mock.is_available.return_value = True
+        self.app.set_image_transform(True)
+
+        self.app.set_image_transform(False)
+
+        transformer_mock.return_value.shutdown.assert_called()
+        self.assertFalse(self.app._get_config()["imagetransform"])
+
+    @patch("backend.email.ImageTransformer")
+    def test_set_image_transform_pillow_not_installed(self, transformer_mock):
+        transformer_mock.is_available.return_value = False
+
+        with self.assertRaises(CommandError) as cm:
+            self.app.set_image_transform(True)
+        self.assertEqual(str(cm.exception), "Image transform requires Pillow library")
+
+    def test_set_image_transform_check_params(self):
+        with self.assertRaises(InvalidParameter):
+            self.app.set_image_transform(True, max_dimension=0)
+        with self.assertRaises(InvalidParameter):
+            self.app.set_image_transform(True, quality=100)
+
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=("image/jpeg", None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data=b"original content")
+    @patch("backend.email.ImageTransformer")
+    def test_send_email_with_image_transform(self, transformer_mock, open_mock, smtp_mock, emailmessage_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+        })
+        transformer_mock.is_available.return_value = True
+        transformer_mock.is_supported.return_value = True
+        transformer_mock.return_value.submit.return_value.result.return_value = (16, b"small", 0.5)
+        self.app.set_image_transform(True)
+
+        self.app.send_email('test', 'some email content', 'recipient', attachments=['/tmp/snapshot.jpg'])
+
+        transformer_mock.return_value.submit.assert_called_with('/tmp/snapshot.jpg', 'image/jpeg')
+        emailmessage_mock.return_value.add_attachment.assert_called_with(b"small", maintype="image", subtype="jpeg", filename="snapshot.jpg")
+        open_mock.assert_not_called()
+        reports = self.app.get_send_reports()
+        self.assertEqual(reports[0]["transforms"], [{"filename": "snapshot.jpg", "originalbytes": 16, "bytes": 5, "duration": 0.5}])
+
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=("image/jpeg", None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data=b"original content")
+    @patch("backend.email.ImageTransformer")
+    def test_send_email_with_image_transform_failure(self, transformer_mock, open_mock, smtp_mock, emailmessage_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+        })
+        transformer_mock.is_available.return_value = True
+        transformer_mock.is_supported.return_value = True
+        transformer_mock.return_value.submit.return_value.result.side_effect = Exception("Test error")
+        self.app.set_image_transform(True)
+
+        self.app.send_email('test', 'some email content', 'recipient', attachments=['/tmp/snapshot.jpg'])
+
+        emailmessage_mock.return_value.add_attachment.assert_called_with(b"original content", maintype="image", subtype="jpeg", filename="snapshot.jpg")
+
+    @patch("backend.messagesender.serialize_message", Mock(return_value=b"message"))
+    @patch("backend.messagesender.EmailMessage")
+    @patch("backend.relayconnection.RelaySMTP")
+    @patch("backend.messagesender.os.path.isfile", Mock(return_value=True))
+    @patch("backend.messagesender.mimetypes.guess_type", Mock(return_value=("image/jpeg", None)))
+    @patch("backend.messagesender.open", new_callable=mock_open, read_data=b"original content")
+    @patch("backend.email.ImageTransformer")
+    def test_send_email_with_image_transform_timeout(self, transformer_mock, open_mock, smtp_mock, emailmessage_mock):
+        self.app._Email__get_config = Mock(return_value={
+            "provider": "gmail",
+            "login": "login",
+            "password": "password",
+        })
+        transformer_mock.is_available.return_value = True
+        transformer_mock.is_supported.return_value = True
+        future = transformer_mock.return_value.submit.return_value
+        future.result.side_effect = FutureTimeoutError()
+        self.app.set_image_transform(True)
+
+        self.app.send_email('test', 'some email content', 'recipient', attachments=['/tmp/snapshot.jpg'])
+
+        future.result.assert_called_with(timeout=MessageSender.IMAGE_TRANSFORM_TIMEOUT)
+        future.cancel.assert_called()
+        emailmessage_mock.return_value.add_attachment.assert_called_with(b"original content", maintype="image", subtype="jpeg", filename="snapshot.jpg")
+
     def test_on_render(self):
         values = {
             "subject": "subject",
@@ -453,6 +1046,413 @@ class TestEmail(unittest.TestCase):
         self.app.send_email.assert_not_called()
 
 
+class TestEmailMailMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.TemporaryDirectory()
+        self.config_dir_patcher = patch.object(Email, "CONFIG_DIR", self.config_dir.name)
+        self.config_dir_patcher.start()
+        self.session = session.TestSession(self)
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.app = self.session.setup(Email, bootstrap={"cleep_filesystem": LocalFilesystem()})
+        self.sink = SmtpSink()
+        self.sink.start()
+        self.app.set_config(provider="custom", server="127.0.0.1", port=self.sink.port, sender="cleep@test.com")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        self.sink.stop()
+        self.session.clean()
+        self.config_dir_patcher.stop()
+        self.config_dir.cleanup()
+
+    def write_recipients(self, count, filename="recipients.csv"):
+        filepath = os.path.join(self.tmp_dir.name, filename)
+        with open(filepath, "w") as filep:
+            filep.write("email,name\n")
+            for index in range(count):
+                filep.write(f"user{index}@test.com,User{index}\n")
+        return filepath
+
+    def wait_mail_merge(self):
+        for _ in range(500):
+            status = self.app.get_mail_merge_status()
+            if not status["running"]:
+                return status
+            time.sleep(0.01)
+        self.fail("Mail merge still running")
+
+    def test_mail_merge(self):
+        filepath = self.write_recipients(200)
+
+        started = self.app.mail_merge(filepath, "Report for $name", "<p>Hello $name</p>")
+        status = self.wait_mail_merge()
+
+        self.assertTrue(started)
+        self.assertEqual(status["total"], 200)
+        self.assertEqual(status["sent"], 200)
+        self.assertEqual(status["failed"], 0)
+        self.assertEqual(status["eta"], 0.0)
+        self.assertEqual(len(self.sink.messages), 200)
+        self.assertEqual(self.sink.sessions, 1)
+        message = message_from_bytes(self.sink.messages[42], policy=policy.default)
+        self.assertEqual(message["To"], "user42@test.com")
+        self.assertEqual(message["Subject"], "Report for User42")
+        self.assertIn("<p>Hello User42</p>", message.get_content())
+
+    def test_mail_merge_missing_recipient_field(self):
+        filepath = os.path.join(self.tmp_dir.name, "recipients.jsonl")
+        with open(filepath, "w") as filep:
+            filep.write('{"mail": "user@test.com"}\n{"email": "user@test.com"}\n')
+
+        self.app.mail_merge(filepath, "subject", "content")
+        status = self.wait_mail_merge()
+
+        self.assertEqual(status["sent"], 1)
+        self.assertEqual(status["failed"], 1)
+        self.assertEqual(status["errors"], [{"index": 0, "error": 'No "email" field'}])
+
+    def test_mail_merge_record_not_an_object(self):
+        filepath = os.path.join(self.tmp_dir.name, "recipients.jsonl")
+        with open(filepath, "w") as filep:
+            filep.write('[1, 2]\n{"email": "user@test.com", "name": "Ann & <Bob>"}\n')
+
+        self.app.mail_merge(filepath, "Hello $name", "<p>Hello $name</p>")
+        status = self.wait_mail_merge()
+
+        self.assertEqual(status["sent"], 1)
+        self.assertEqual(status["errors"], [{"index": 0, "error": "Recipient record is not an object"}])
+        message = message_from_bytes(self.sink.messages[0], policy=policy.default)
+        self.assertEqual(message["Subject"], "Hello Ann & <Bob>")
+        self.assertIn("<p>Hello Ann &amp; &lt;Bob&gt;</p>", message.get_content())
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_mail_merge_reconnects_on_disconnection(self, smtp_mock):
+        filepath = self.write_recipients(3)
+        smtp_mock.return_value.sendmail.side_effect = [None, smtplib.SMTPServerDisconnected(), None, None]
+
+        self.app.mail_merge(filepath, "subject", "content")
+        status = self.wait_mail_merge()
+
+        self.assertEqual(status["sent"], 3)
+        self.assertEqual(smtp_mock.call_count, 2)
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_mail_merge_recipient_refused(self, smtp_mock):
+        filepath = self.write_recipients(3)
+        smtp_mock.return_value.sendmail.side_effect = [None, smtplib.SMTPRecipientsRefused({}), None]
+
+        self.app.mail_merge(filepath, "subject", "content")
+        status = self.wait_mail_merge()
+
+        self.assertEqual(status["sent"], 2)
+        self.assertEqual(status["failed"], 1)
+        self.assertEqual(status["errors"][0]["index"], 1)
+        smtp_mock.return_value.rset.assert_called_once()
+        self.assertEqual(smtp_mock.call_count, 1)
+
+    def test_mail_merge_delivery_backend_kept_on_failure(self):
+        filepath = self.write_recipients(3)
+        self.app.set_delivery_backend("null")
+        backend = self.app._Email__sender.delivery
+        backend.close = Mock()
+
+        with patch.object(backend, "_write", side_effect=[None, ValueError("Test error"), None]):
+            self.app.mail_merge(filepath, "subject", "content")
+            status = self.wait_mail_merge()
+
+        self.assertEqual(status["sent"], 2)
+        self.assertEqual(status["errors"], [{"index": 1, "error": "Test error"}])
+        backend.close.assert_not_called()
+
+    @patch("backend.relayconnection.RelaySMTP")
+    def test_mail_merge_aborted_on_session_failure(self, smtp_mock):
+        filepath = self.write_recipients(3)
+        smtp_mock.side_effect = smtplib.SMTPAuthenticationError(535, b"invalid")
+
+        self.app.mail_merge(filepath, "subject", "content")
+        status = self.wait_mail_merge()
+
+        self.assertEqual(status["processed"], 0)
+        self.assertEqual(len(status["errors"]), 1)
+        self.assertIsNone(status["errors"][0]["index"])
+        self.assertEqual(smtp_mock.call_count, 1)
+
+    def test_mail_merge_already_running(self):
+        filepath = self.write_recipients(1)
+        release = threading.Event()
+        with patch("backend.mailmerge.read_recipients", side_effect=lambda _: iter([release.wait(2.0) and {}])):
+            self.app.mail_merge(filepath, "subject", "content")
+
+            with self.assertRaises(CommandError) as cm:
+                self.app.mail_merge(filepath, "subject", "content")
+            self.assertEqual(str(cm.exception), "A mail merge is already running")
+            release.set()
+            self.wait_mail_merge()
+
+    def test_cancel_mail_merge(self):
+        filepath = self.write_recipients(1000)
+
+        self.app.mail_merge(filepath, "subject", "content")
+        cancelled = self.app.cancel_mail_merge()
+        status = self.wait_mail_merge()
+
+        self.assertTrue(cancelled)
+        self.assertTrue(status["cancelled"])
+        self.assertLess(status["processed"], 1000)
+        self.assertFalse(self.app.cancel_mail_merge())
+
+    def test_mail_merge_invalid_file(self):
+        with self.assertRaises(InvalidParameter) as cm:
+            self.app.mail_merge("/tmp/notfound.csv", "subject", "content")
+        self.assertEqual(str(cm.exception), "Recipients file does not exist")
+
+        filepath = os.path.join(self.tmp_dir.name, "recipients.jsonl")
+        with open(filepath, "w") as filep:
+            filep.write("invalid\n")
+        with self.assertRaises(CommandError) as cm:
+            self.app.mail_merge(filepath, "subject", "content")
+        self.assertEqual(str(cm.exception), "Invalid recipients file")
+
+    def test_get_mail_merge_status_no_mail_merge(self):
+        self.assertIsNone(self.app.get_mail_merge_status())
+
+
+class TestEmailStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.TemporaryDirectory()
+        self.config_dir_patcher = patch.object(Email, "CONFIG_DIR", self.config_dir.name)
+        self.config_dir_patcher.start()
+        self.session = session.TestSession(self)
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.app = self.session.setup(Email, bootstrap={"cleep_filesystem": LocalFilesystem()})
+        self.sink = None
+
+    def tearDown(self):
+        if self.sink:
+            self.sink.stop()
+        self.session.clean()
+        self.config_dir_patcher.stop()
+        self.config_dir.cleanup()
+
+    def send_large_email(self, features):
+        self.sink = SmtpSink(features)
+        self.sink.start()
+        self.app.set_config(provider="custom", server="127.0.0.1", port=self.sink.port, sender="cleep@test.com")
+        content = os.urandom(MessageSender.STREAM_MIN_BYTES + 1)
+
+        self.app.send_email(
+            "snapshot",
+            "From camera\n.\n",
+            "recipient@test.com",
+            attachments=[{"filename": "snapshot.bin", "content": content}],
+        )
+
+        self.assertEqual(len(self.sink.messages), 1)
+        message = message_from_bytes(self.sink.messages[0], policy=policy.default)
+        attachment = next(message.iter_attachments())
+        self.assertEqual(attachment.get_content(), content)
+        self.assertEqual(self.app.get_send_reports()[0]["wirebytes"], len(self.sink.messages[0]))
+        return message
+
+    def test_send_large_email_with_data(self):
+        message = self.send_large_email([b"8BITMIME"])
+
+        report = self.app.get_send_reports()[0]
+        self.assertEqual((report["bodytype"], report["chunking"]), ("8BITMIME", False))
+        self.assertEqual(self.sink.commands[0], b"mail FROM:<cleep@test.com> BODY=8BITMIME")
+        self.assertIn("From camera\r\n.\r\n</body>", message.get_body().get_content())
+
+    def test_send_email_cc_bcc(self):
+        self.sink = SmtpSink([b"8BITMIME"])
+        self.sink.start()
+        self.app.set_config(provider="custom", server="127.0.0.1", port=self.sink.port, sender="cleep@test.com")
+
+        self.app.send_email("test", "content", "recipient@test.com", cc="cc@test.com", bcc="bcc@test.com")
+
+        self.assertEqual(self.sink.commands[1:], [
+            b"rcpt TO:<recipient@test.com>",
+            b"rcpt TO:<cc@test.com>",
+            b"rcpt TO:<bcc@test.com>",
+        ])
+        message = message_from_bytes(self.sink.messages[0], policy=policy.default)
+        self.assertEqual(message["Cc"], "cc@test.com")
+        self.assertIsNone(message["Bcc"])
+
+    def test_send_large_email_with_bdat(self):
+        message = self.send_large_email([b"8BITMIME", b"CHUNKING", b"BINARYMIME"])
+
+        self.assertEqual(next(message.iter_attachments())["Content-Transfer-Encoding"], "binary")
+
+
+class TestEmailDeliveryStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.TemporaryDirectory()
+        self.config_dir_patcher = patch.object(Email, "CONFIG_DIR", self.config_dir.name)
+        self.config_dir_patcher.start()
+        self.session = session.TestSession(self)
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.app = self.session.setup(Email, bootstrap={"cleep_filesystem": LocalFilesystem()})
+        self.sink = None
+        self.imap = None
+
+    def tearDown(self):
+        if self.sink:
+            self.sink.stop()
+        self.session.clean()
+        if self.imap:
+            self.imap.stop()
+        self.config_dir_patcher.stop()
+        self.config_dir.cleanup()
+
+    def send_email(self, features, recipient="recipient@test.com"):
+        self.sink = SmtpSink(features)
+        self.sink.start()
+        self.app.set_config(provider="custom", server="127.0.0.1", port=self.sink.port, sender="cleep@test.com")
+
+        self.app.send_email("test", "content", recipient)
+
+        message = message_from_bytes(self.sink.messages[0], policy=policy.default)
+        return message["Message-ID"]
+
+    def test_send_email_with_dsn(self):
+        message_id = self.send_email([b"8BITMIME", b"DSN"])
+
+        self.assertTrue(message_id.endswith("@test.com>"))
+        self.assertEqual(self.app.get_send_reports()[0]["messageid"], message_id)
+        envid = message_id.replace("+", "+2B").replace("=", "+3D")
+        self.assertEqual(self.sink.commands, [
+            f"mail FROM:<cleep@test.com> BODY=8BITMIME RET=HDRS ENVID={envid}".encode(),
+            b"rcpt TO:<recipient@test.com> NOTIFY=FAILURE,DELAY",
+        ])
+
+    def test_send_email_without_dsn_support(self):
+        self.send_email([b"8BITMIME"])
+
+        self.assertEqual(self.sink.commands, [
+            b"mail FROM:<cleep@test.com> BODY=8BITMIME",
+            b"rcpt TO:<recipient@test.com>",
+        ])
+
+    def test_send_email_dsn_disabled(self):
+        self.app.set_dsn(False)
+
+        self.send_email([b"8BITMIME", b"DSN"])
+
+        self.assertEqual(self.sink.commands[0], b"mail FROM:<cleep@test.com> BODY=8BITMIME")
+
+    def test_get_delivery_status(self):
+        message_id = self.send_email([b"8BITMIME"], "Recipient@test.com, other@test.com")
+
+        status = self.app.get_delivery_status(message_id)
+
+        self.assertEqual(status["messageid"], message_id)
+        self.assertDictEqual(status["recipients"], {
+            "recipient@test.com": {"status": "sent", "diagnostic": None},
+            "other@test.com": {"status": "sent", "diagnostic": None},
+        })
+        self.assertEqual(self.app.get_delivery_status(), [status])
+
+    def test_get_delivery_status_unknown_message(self):
+        with self.assertRaises(CommandError) as cm:
+            self.app.get_delivery_status("<unknown@test.com>")
+        self.assertEqual(str(cm.exception), 'Unknown message "<unknown@test.com>"')
+
+    def test_get_delivery_status_capture_backend(self):
+        self.app.set_delivery_backend("null")
+        self.app.set_config(provider="custom", server="127.0.0.1", port=25, sender="cleep@test.com")
+
+        self.app.send_email("test", "content", "recipient@test.com")
+
+        message_id = self.app.get_send_reports()[0]["messageid"]
+        self.assertEqual(self.app.get_delivery_status(message_id)["recipients"]["recipient@test.com"]["status"], "sent")
+
+    def test_poll_bounces(self):
+        self.imap = ImapStandin()
+        self.imap.start()
+        self.imap.append(b"Subject: old\r\n\r\nold\r\n")
+        self.app.set_bounce_poller("imap", "127.0.0.1", self.imap.port, False, "login", "password", interval=3600)
+        # wait for first poll to skip existing messages
+        for _ in range(200):
+            if os.path.exists(os.path.join(self.config_dir.name, Email.BOUNCES_FILE)):
+                break
+            time.sleep(0.01)
+        message_id = self.send_email([b"8BITMIME"], "recipient@test.com, other@test.com")
+        self.imap.append(build_bounce(message_id, [("recipient@test.com", "failed", "5.1.1")]))
+
+        self.assertEqual(self.app.poll_bounces(), 1)
+        self.assertEqual(self.app.poll_bounces(), 0)
+
+        recipients = self.app.get_delivery_status(message_id)["recipients"]
+        self.assertEqual(recipients["recipient@test.com"]["status"], "failed")
+        self.assertEqual(recipients["other@test.com"]["status"], "sent")
+        # old message and bounce fetched once
+        self.assertEqual(self.imap.fetches, [2])
+
+    def test_poll_bounces_not_configured(self):
+        with self.assertRaises(CommandError) as cm:
+            self.app.poll_bounces()
+        self.assertEqual(str(cm.exception), "Bounce poller is not configured")
+
+    def test_set_bounce_poller_invalid_params(self):
+        with self.assertRaises(InvalidParameter):
+            self.app.set_bounce_poller("smtp", "127.0.0.1", 993, True, "login", "password")
+        with self.assertRaises(InvalidParameter):
+            self.app.set_bounce_poller("imap", "127.0.0.1", 993, True, "login", "password", interval=10)
+        with self.assertRaises(MissingParameter):
+            self.app.set_bounce_poller("pop", None, 995, True, "login", "password")
+
+    def test_set_bounce_poller_password_not_returned(self):
+        self.app.set_bounce_poller("pop", "127.0.0.1", 995, True, "login", "password")
+        self.app.set_bounce_poller(None)
+        self.app.set_bounce_poller("pop", "127.0.0.1", 995, True, "login", "password", interval=3600)
+
+        config = self.app.get_module_config()
+
+        self.assertNotIn("password", config["bouncepoller"])
+        self.assertEqual(config["bouncepoller"]["protocol"], "pop")
+
+
+class TestEmailStress(unittest.TestCase):
+
+    RENDERS = 2000
+    CALLERS = 50
+
+    def setUp(self):
+        self.config_dir = tempfile.TemporaryDirectory()
+        self.config_dir_patcher = patch.object(Email, "CONFIG_DIR", self.config_dir.name)
+        self.config_dir_patcher.start()
+        self.session = session.TestSession(self)
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.app = self.session.setup(Email, bootstrap={"cleep_filesystem": LocalFilesystem()})
+        self.sink = SmtpSink()
+        self.sink.start()
+
+    def tearDown(self):
+        self.sink.stop()
+        self.session.clean()
+        self.config_dir_patcher.stop()
+        self.config_dir.cleanup()
+
+    def test_concurrent_on_render(self):
+        self.app.set_config(provider="custom", server="127.0.0.1", port=self.sink.port, sender="cleep@test.com")
+        values = {
+            "subject": "subject",
+            "message": "content",
+            "attachment": [],
+        }
+
+        with ThreadPoolExecutor(max_workers=self.CALLERS) as executor:
+            results = list(executor.map(lambda _: self.app.on_render("AlertProfile", values), range(self.RENDERS)))
+
+        self.assertTrue(all(results))
+        self.assertEqual(len(self.sink.messages), self.RENDERS)
+        self.assertEqual(len(self.app.get_send_reports()), Email.SEND_REPORTS_SIZE)
+
+
 if __name__ == "__main__":
     # coverage run --include="**/backend/**/*.py" --concurrency=thread test_email.py; coverage report -m -i
     unittest.main()
@@ -0,0 +1,245 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.emailscheduler import EmailScheduler
+from tests.localfilesystem import LocalFilesystem
+import os
+import json
+import time
+import tempfile
+import threading
+from unittest.mock import Mock, patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestEmailScheduler(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "email.schedule")
+        self.sent = []
+        self.sent_event = threading.Event()
+        self.scheduler = None
+
+    def tearDown(self):
+        if self.scheduler:
+            self.scheduler.stop()
+        self.tmp_dir.cleanup()
+
+    def callback(self, params):
+        self.sent.append(params)
+        self.sent_event.set()
+
+    def start_scheduler(self):
+        self.scheduler = EmailScheduler(self.filepath, LocalFilesystem(), self.callback)
+        self.scheduler.start()
+        return self.scheduler
+
+    def wait_sent(self, count):
+        for _ in range(200):
+            if len(self.sent) >= count:
+                return
+            time.sleep(0.01)
+        self.fail(f"{count} emails not sent")
+
+    def read_journal(self):
+        with open(self.filepath) as filep:
+            return [json.loads(line) for line in filep]
+
+    def test_add_and_dispatch_in_order(self):
+        scheduler = self.start_scheduler()
+        now = time.time()
+
+        scheduler.add(now + 0.2, {"subject": "second"})
+        scheduler.add(now + 0.1, {"subject": "first"})
+        self.wait_sent(2)
+
+        self.assertEqual(self.sent, [{"subject": "first"}, {"subject": "second"}])
+        self.assertEqual(scheduler.get_entries(), [])
+
+    def test_add_sooner_email_wakes_scheduler(self):
+        scheduler = self.start_scheduler()
+        scheduler.add(time.time() + 3600, {"subject": "later"})
+
+        scheduler.add(time.time(), {"subject": "now"})
+        self.wait_sent(1)
+
+        self.assertEqual(self.sent, [{"subject": "now"}])
+
+    def test_cancel(self):
+        scheduler = self.start_scheduler()
+        scheduled_id = scheduler.add(time.time() + 0.1, {"subject": "cancelled"})
+
+        self.assertTrue(scheduler.cancel(scheduled_id))
+        self.assertFalse(scheduler.cancel(scheduled_id))
+        self.assertFalse(scheduler.cancel("unknown"))
+        time.sleep(0.2)
+
+        self.assertEqual(self.sent, [])
+
+    def test_cancel_sent_email(self):
+        scheduler = self.start_scheduler()
+        scheduled_id = scheduler.add(time.time(), {"subject": "sent"})
+        self.wait_sent(1)
+
+        self.assertFalse(scheduler.cancel(scheduled_id))
+
+    def test_get_entries(self):
+        scheduler = self.start_scheduler()
+        id2 = scheduler.add(4000000000, {"subject": "2"})
+        id1 = scheduler.add(3000000000, {"subject": "1"})
+
+        entries = scheduler.get_entries()
+
+        self.assertEqual(entries, [
+            {"id": id1, "sendat": 3000000000, "params": {"subject": "1"}},
+            {"id": id2, "sendat": 4000000000, "params": {"subject": "2"}},
+        ])
+
+    def test_callback_failure(self):
+        self.scheduler = EmailScheduler(self.filepath, LocalFilesystem(), Mock(side_effect=Exception("Test error")))
+        self.scheduler.start()
+
+        self.scheduler.add(time.time(), {"subject": "failed"})
+        time.sleep(0.1)
+
+        self.assertEqual(self.scheduler.get_entries(), [])
+        self.assertEqual([record["op"] for record in self.read_journal()], ["add", "remove"])
+
+    def test_persistence(self):
+        scheduler = self.start_scheduler()
+        scheduled_id = scheduler.add(4000000000, {"subject": "kept"})
+        cancelled_id = scheduler.add(4000000000, {"subject": "cancelled"})
+        scheduler.cancel(cancelled_id)
+        scheduler.stop()
+
+        self.scheduler = self.start_scheduler()
+
+        self.assertEqual(self.scheduler.get_entries(), [{"id": scheduled_id, "sendat": 4000000000, "params": {"subject": "kept"}}])
+        # journal compacted at startup
+        self.assertEqual(self.read_journal(), [{"op": "add", "id": scheduled_id, "sendat": 4000000000, "params": {"subject": "kept"}}])
+
+    def test_missed_emails_sent_at_startup(self):
+        with open(self.filepath, "w") as filep:
+            filep.write(json.dumps({"op": "add", "id": "1", "sendat": 1000, "params": {"subject": "missed"}}) + "\n")
+            filep.write('{"op": "add", "id": "2", "sen')
+
+        self.start_scheduler()
+        self.wait_sent(1)
+
+        self.assertEqual(self.sent, [{"subject": "missed"}])
+
+    @patch("backend.emailscheduler.EmailScheduler.COMPACT_MIN_RECORDS", 10)
+    def test_journal_compaction(self):
+        scheduler = self.start_scheduler()
+
+        for _ in range(20):
+            scheduler.cancel(scheduler.add(4000000000, {}))
+        kept_id = scheduler.add(4000000000, {})
+
+        records = self.read_journal()
+        self.assertLessEqual(len(records), 11)
+        self.assertIn({"op": "add", "id": kept_id, "sendat": 4000000000, "params": {}}, records)
+
+    @patch("backend.emailscheduler.EmailScheduler.COMPACT_MIN_RECORDS", 10)
+    def test_journal_compaction_keeps_added_email(self):
+        scheduler = self.start_scheduler()
+        for index in range(10):
+            scheduled_id = scheduler.add(4000000000, {"index": index})
+            if index == 5:
+                # 11th journal record, triggers compaction
+                kept_id = scheduled_id
+            else:
+                scheduler.cancel(scheduled_id)
+        scheduler.stop()
+
+        self.scheduler = self.start_scheduler()
+
+        self.assertEqual([entry["id"] for entry in self.scheduler.get_entries()], [kept_id])
+
+    @patch("backend.emailscheduler.EmailScheduler.COMPACT_MIN_RECORDS", 4)
+    def test_journal_compaction_keeps_email_being_sent(self):
+        release = threading.Event()
+        self.callback = lambda params: release.wait(2.0)
+        scheduler = self.start_scheduler()
+        sending_id = scheduler.add(time.time(), {"subject": "sending"})
+        time.sleep(0.1)
+
+        # compaction while first email is being sent
+        for _ in range(3):
+            scheduler.cancel(scheduler.add(4000000000, {}))
+
+        self.assertIn(sending_id, [record["id"] for record in self.read_journal()])
+        self.assertFalse(scheduler.cancel(sending_id))
+        release.set()
+        for _ in range(200):
+            if self.read_journal()[-1] == {"op": "remove", "id": sending_id}:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.read_journal()[-1], {"op": "remove", "id": sending_id})
+
+    def test_stop_does_not_wait_email_being_sent(self):
+        sending = threading.Event()
+        release = threading.Event()
+        self.callback = lambda params: sending.set() or release.wait(2.0)
+        scheduler = self.start_scheduler()
+        sending_id = scheduler.add(time.time(), {"subject": "sending"})
+        scheduler.add(time.time(), {"subject": "queued"})
+        self.assertTrue(sending.wait(2.0))
+
+        start = time.monotonic()
+        scheduler.stop()
+        self.scheduler = None
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        release.set()
+        for _ in range(200):
+            if self.read_journal()[-1] == {"op": "remove", "id": sending_id}:
+                break
+            time.sleep(0.01)
+        # queued email is sent at next start
+        self.assertEqual([record["params"]["subject"] for record in self.read_journal() if record["op"] == "add"], ["sending", "queued"])
+        self.assertEqual(self.read_journal()[-1], {"op": "remove", "id": sending_id})
+
+    @patch("backend.emailscheduler.EmailScheduler.MAX_WAIT", 0.05)
+    def test_wall_clock_step(self):
+        offset = [0.0]
+        with patch("backend.emailscheduler.time.time", side_effect=lambda: time.monotonic() + offset[0]):
+            scheduler = self.start_scheduler()
+            scheduler.add(time.monotonic() + 3600, {"subject": "due after clock step"})
+            time.sleep(0.1)
+            offset[0] = 3600.0
+
+            self.wait_sent(1)
+
+        self.assertEqual(self.sent, [{"subject": "due after clock step"}])
+
+    def test_thousands_of_emails(self):
+        scheduler = self.start_scheduler()
+        now = time.time()
+        start = time.monotonic()
+
+        ids = [scheduler.add(now + 3600 + index, {"index": index}) for index in range(5000)]
+        for scheduled_id in ids[:4000]:
+            scheduler.cancel(scheduled_id)
+
+        self.assertLess(time.monotonic() - start, 5.0)
+        self.assertEqual(len(scheduler.get_entries()), 1000)
+        self.assertLess(len(scheduler._EmailScheduler__heap), 2 * 1000 + 65)
+
+    def test_idle_scheduler_does_not_poll(self):
+        with patch("backend.emailscheduler.time.time", wraps=time.time) as time_mock:
+            scheduler = self.start_scheduler()
+            scheduler.add(time.time() + 3600, {})
+            time.sleep(0.2)
+
+            self.assertLessEqual(time_mock.call_count, 2)
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_emailscheduler.py; coverage report -m -i
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.imagetransform import ImageTransformer, transform_image, Image
+import os
+import io
+import tempfile
+import multiprocessing
+from concurrent.futures import Future
+from unittest.mock import patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+def completed_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class TestImageTransformer(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "snapshot.jpg")
+        with open(self.filepath, "wb") as filep:
+            filep.write(b"original content")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_is_supported(self):
+        self.assertTrue(ImageTransformer.is_supported("image/jpeg"))
+        self.assertTrue(ImageTransformer.is_supported("image/png"))
+        self.assertFalse(ImageTransformer.is_supported("image/gif"))
+        self.assertFalse(ImageTransformer.is_supported("application/octet-stream"))
+
+    @patch("backend.imagetransform.ProcessPoolExecutor")
+    def test_submit(self, executor_mock):
+        executor_mock.return_value.submit.return_value = completed_future((16, b"small", 0.5))
+        transformer = ImageTransformer(640, 60, workers=2)
+
+        result = transformer.submit(self.filepath, "image/jpeg").result()
+
+        self.assertEqual(result, (16, b"small", 0.5))
+        executor_mock.assert_called_with(max_workers=2, mp_context=multiprocessing.get_context("forkserver"))
+        executor_mock.return_value.submit.assert_called_with(transform_image, self.filepath, "JPEG", 640, 60)
+
+    @patch("backend.imagetransform.ProcessPoolExecutor")
+    def test_submit_cached(self, executor_mock):
+        executor_mock.return_value.submit.return_value = completed_future((16, b"small", 0.5))
+        transformer = ImageTransformer(640, 60)
+        transformer.submit(self.filepath, "image/jpeg").result()
+
+        result = transformer.submit(self.filepath, "image/jpeg").result()
+
+        self.assertEqual(result, (16, b"small", 0.0))
+        self.assertEqual(executor_mock.return_value.submit.call_count, 1)
+
+    @patch("backend.imagetransform.ProcessPoolExecutor")
+    def test_submit_cache_invalidated_by_mtime(self, executor_mock):
+        executor_mock.return_value.submit.return_value = completed_future((16, b"small", 0.5))
+        transformer = ImageTransformer(640, 60)
+        transformer.submit(self.filepath, "image/jpeg").result()
+        stat = os.stat(self.filepath)
+        os.utime(self.filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        transformer.submit(self.filepath, "image/jpeg").result()
+
+        self.assertEqual(executor_mock.return_value.submit.call_count, 2)
+
+    @patch("backend.imagetransform.ProcessPoolExecutor")
+    def test_submit_cache_size(self, executor_mock):
+        executor_mock.return_value.submit.return_value = completed_future((16, b"small", 0.5))
+        transformer = ImageTransformer(640, 60, cache_size=1)
+        other_filepath = os.path.join(self.tmp_dir.name, "other.png")
+        with open(other_filepath, "wb") as filep:
+            filep.write(b"other content")
+        transformer.submit(self.filepath, "image/jpeg").result()
+        transformer.submit(other_filepath, "image/png").result()
+
+        transformer.submit(self.filepath, "image/jpeg").result()
+
+        self.assertEqual(executor_mock.return_value.submit.call_count, 3)
+
+    @patch("backend.imagetransform.ProcessPoolExecutor")
+    def test_submit_failure_not_cached(self, executor_mock):
+        future = Future()
+        future.set_exception(Exception("Test error"))
+        executor_mock.return_value.submit.return_value = future
+        transformer = ImageTransformer(640, 60)
+        transformer.submit(self.filepath, "image/jpeg")
+
+        transformer.submit(self.filepath, "image/jpeg")
+
+        self.assertEqual(executor_mock.return_value.submit.call_count, 2)
+
+    @patch("backend.imagetransform.ProcessPoolExecutor")
+    def test_shutdown(self, executor_mock):
+        executor_mock.return_value.submit.return_value = completed_future((16, b"small", 0.5))
+        transformer = ImageTransformer(640, 60)
+        transformer.submit(self.filepath, "image/jpeg")
+
+        transformer.shutdown()
+
+        executor_mock.return_value.shutdown.assert_called_with(wait=False, cancel_futures=True)
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_transform_image(self):
+        image = Image.new("RGB", (2000, 1000), color=(200, 10, 10))
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        image.save(self.filepath, format="JPEG", quality=100, exif=exif)
+
+        original_size, data, duration = transform_image(self.filepath, "JPEG", 500, 60)
+
+        self.assertEqual(original_size, os.path.getsize(self.filepath))
+        self.assertLess(len(data), original_size)
+        self.assertGreaterEqual(duration, 0)
+        with Image.open(io.BytesIO(data)) as transformed:
+            self.assertEqual(transformed.size, (500, 250))
+            self.assertEqual(len(transformed.getexif()), 0)
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_transform_image_strip_comment(self):
+        image = Image.new("RGB", (200, 100), color=(200, 10, 10))
+        image.save(self.filepath, format="JPEG", quality=100, comment=b"secret")
+
+        _, data, _ = transform_image(self.filepath, "JPEG", 100, 60)
+
+        with Image.open(io.BytesIO(data)) as transformed:
+            self.assertNotIn("comment", transformed.info)
+            self.assertNotIn(b"secret", data)
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_transform_in_process_pool(self):
+        Image.new("RGB", (2000, 1000), color=(200, 10, 10)).save(self.filepath, format="JPEG", quality=100)
+        transformer = ImageTransformer(500, 60)
+
+        try:
+            _, data, _ = transformer.submit(self.filepath, "image/jpeg").result(timeout=60)
+        finally:
+            transformer.shutdown()
+
+        with Image.open(io.BytesIO(data)) as transformed:
+            self.assertEqual(transformed.size, (500, 250))
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_imagetransform.py; coverage report -m -i
+    unittest.main()
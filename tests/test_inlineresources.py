@@ -0,0 +1,80 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.inlineresources import InlineResourceCache
+import os
+import tempfile
+from unittest.mock import patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestInlineResourceCache(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "logo.png")
+        with open(self.filepath, "wb") as filep:
+            filep.write(b"\x89PNG content")
+        self.cache = InlineResourceCache(max_size=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_part(self):
+        part = self.cache.get_part(self.filepath, "logo", "image/png")
+
+        self.assertEqual(part["Content-ID"], "<logo>")
+        self.assertEqual(part.get_content_type(), "image/png")
+        self.assertEqual(part.get_content_disposition(), "inline")
+        self.assertEqual(part["Content-Transfer-Encoding"], "base64")
+        self.assertEqual(part.get_content(), b"\x89PNG content")
+
+    def test_get_part_with_content_options(self):
+        part = self.cache.get_part(self.filepath, "logo", "image/png", {"cte": "binary"})
+
+        self.assertEqual(part["Content-Transfer-Encoding"], "binary")
+        self.assertEqual(part.get_payload(decode=True), b"\x89PNG content")
+
+    def test_get_part_reused(self):
+        part1 = self.cache.get_part(self.filepath, "logo", "image/png")
+
+        with patch("backend.inlineresources.open") as open_mock:
+            part2 = self.cache.get_part(self.filepath, "logo", "image/png")
+            open_mock.assert_not_called()
+
+        self.assertIs(part1, part2)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_get_part_not_reused(self):
+        part = self.cache.get_part(self.filepath, "logo", "image/png")
+
+        self.assertIsNot(self.cache.get_part(self.filepath, "other", "image/png"), part)
+        self.assertIsNot(self.cache.get_part(self.filepath, "logo", "image/png", {"cte": "binary"}), part)
+        stat = os.stat(self.filepath)
+        os.utime(self.filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertIsNot(self.cache.get_part(self.filepath, "logo", "image/png"), part)
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_cache_is_bounded(self):
+        part = self.cache.get_part(self.filepath, "cid1", "image/png")
+        self.cache.get_part(self.filepath, "cid2", "image/png")
+        self.cache.get_part(self.filepath, "cid3", "image/png")
+
+        self.assertIsNot(self.cache.get_part(self.filepath, "cid1", "image/png"), part)
+
+    def test_clear(self):
+        part = self.cache.get_part(self.filepath, "logo", "image/png")
+
+        self.cache.clear()
+
+        self.assertIsNot(self.cache.get_part(self.filepath, "logo", "image/png"), part)
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_inlineresources.py; coverage report -m -i
+    unittest.main()
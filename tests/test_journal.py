@@ -0,0 +1,56 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.journal import JsonLinesJournal
+from tests.localfilesystem import LocalFilesystem
+import os
+import tempfile
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestJsonLinesJournal(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "data", "journal")
+        self.journal = JsonLinesJournal(self.filepath, LocalFilesystem())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_missing_journal(self):
+        self.assertEqual(list(self.journal.load()), [])
+
+    def test_append_and_load(self):
+        self.journal.append({"op": "add", "id": 1})
+        self.journal.append({"op": "remove", "id": 1})
+
+        self.assertEqual(list(JsonLinesJournal(self.filepath, LocalFilesystem()).load()), [{"op": "add", "id": 1}, {"op": "remove", "id": 1}])
+        self.assertEqual(self.journal.records, 2)
+
+    def test_load_drops_truncated_record(self):
+        self.journal.append({"op": "add", "id": 1})
+        with open(self.filepath, "a") as filep:
+            filep.write('{"op": "rem')
+
+        self.assertEqual(list(self.journal.load()), [{"op": "add", "id": 1}])
+
+    def test_rewrite(self):
+        for index in range(5):
+            self.journal.append({"op": "add", "id": index})
+
+        self.journal.rewrite([{"op": "add", "id": 4}])
+        self.journal.append({"op": "add", "id": 5})
+
+        self.assertEqual(list(self.journal.load()), [{"op": "add", "id": 4}, {"op": "add", "id": 5}])
+        self.assertEqual(self.journal.records, 2)
+        self.assertFalse(os.path.exists(self.filepath + ".tmp"))
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_journal.py; coverage report -m -i
+    unittest.main()
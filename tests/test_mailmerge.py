@@ -0,0 +1,145 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.mailmerge import read_recipients, count_recipients, render, MailMergeProgress
+import os
+import json
+import tempfile
+import tracemalloc
+from string import Template
+from unittest.mock import patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestMailMerge(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_file(self, filename, content):
+        filepath = os.path.join(self.tmp_dir.name, filename)
+        with open(filepath, "w", encoding="utf-8") as filep:
+            filep.write(content)
+        return filepath
+
+    def test_read_recipients_csv(self):
+        filepath = self.write_file("recipients.csv", "email,name\na@test.com,Ann\nb@test.com,\"Bob, Jr\"\n")
+
+        recipients = list(read_recipients(filepath))
+
+        self.assertEqual(recipients, [
+            {"email": "a@test.com", "name": "Ann"},
+            {"email": "b@test.com", "name": "Bob, Jr"},
+        ])
+
+    def test_read_recipients_json_lines(self):
+        filepath = self.write_file("recipients.jsonl", '{"email": "a@test.com", "count": 3}\n\n{"email": "b@test.com"}\n')
+
+        recipients = list(read_recipients(filepath))
+
+        self.assertEqual(recipients, [{"email": "a@test.com", "count": 3}, {"email": "b@test.com"}])
+
+    def test_read_recipients_is_lazy(self):
+        filepath = self.write_file("recipients.jsonl", '{"email": "a@test.com"}\ninvalid\n')
+
+        recipients = read_recipients(filepath)
+
+        self.assertEqual(next(recipients), {"email": "a@test.com"})
+        with self.assertRaises(json.JSONDecodeError):
+            next(recipients)
+
+    def test_read_recipients_constant_memory(self):
+        filepath = os.path.join(self.tmp_dir.name, "recipients.csv")
+        with open(filepath, "w", encoding="utf-8") as filep:
+            filep.write("email,name,city\n")
+            for index in range(50000):
+                filep.write(f"user{index}@test.com,User {index},City {index}\n")
+
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in read_recipients(filepath))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(count, 50000)
+        self.assertLess(peak, 256 * 1024)
+
+    def test_count_recipients(self):
+        filepath = self.write_file("recipients.csv", "email\na@test.com\nb@test.com\n")
+
+        self.assertEqual(count_recipients(filepath), 2)
+
+    def test_render(self):
+        template = Template("Hello $name, you have ${count} alerts. Unknown $field. Price 5$")
+
+        rendered = render(template, {"name": "Ann", "count": 3, "other": None})
+
+        self.assertEqual(rendered, "Hello Ann, you have 3 alerts. Unknown $field. Price 5$")
+
+    def test_render_escape(self):
+        template = Template("<p>Hello $name</p>")
+
+        rendered = render(template, {"name": "Ann & <Bob>"}, escape=True)
+
+        self.assertEqual(rendered, "<p>Hello Ann &amp; &lt;Bob&gt;</p>")
+
+    @patch("backend.mailmerge.time.monotonic")
+    def test_progress(self, monotonic_mock):
+        monotonic_mock.return_value = 100.0
+        progress = MailMergeProgress("/tmp/recipients.csv", 10)
+        monotonic_mock.return_value = 102.0
+
+        progress.add_sent()
+        progress.add_sent()
+        progress.add_sent()
+        progress.add_failed(3, "refused")
+        status = progress.get_status()
+
+        self.assertEqual(status, {
+            "filepath": "/tmp/recipients.csv",
+            "running": True,
+            "cancelled": False,
+            "total": 10,
+            "processed": 4,
+            "sent": 3,
+            "failed": 1,
+            "rate": 2.0,
+            "eta": 3.0,
+            "errors": [{"index": 3, "error": "refused"}],
+        })
+
+    @patch("backend.mailmerge.time.monotonic")
+    def test_progress_finished(self, monotonic_mock):
+        monotonic_mock.return_value = 100.0
+        progress = MailMergeProgress("/tmp/recipients.csv", 10)
+        progress.cancel()
+        progress.add_error("Authentication failed")
+        monotonic_mock.return_value = 101.0
+        progress.finish()
+        monotonic_mock.return_value = 200.0
+
+        status = progress.get_status()
+
+        self.assertFalse(status["running"])
+        self.assertTrue(status["cancelled"])
+        self.assertEqual(status["rate"], 0.0)
+        self.assertEqual(status["eta"], 0.0)
+        self.assertEqual(status["errors"], [{"index": None, "error": "Authentication failed"}])
+
+    def test_progress_no_rate(self):
+        progress = MailMergeProgress("/tmp/recipients.csv", 10)
+
+        self.assertIsNone(progress.get_status()["eta"])
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_mailmerge.py; coverage report -m -i
+    unittest.main()
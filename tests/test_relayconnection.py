@@ -0,0 +1,235 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.relayconnection import RelayResolver, RelaySMTP, RelaySMTP_SSL, RelaySessions
+from backend.deliverybackends import NullBackend
+from tests.smtpsink import SmtpSink
+import socket
+import time
+from unittest.mock import Mock, patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+INFO_V4_1 = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", 25))
+INFO_V4_2 = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.2", 25))
+INFO_V6_1 = (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("2001:db8::1", 25, 0, 0))
+
+
+class TestRelayResolver(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(("127.0.0.1", 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def get_info(self, port):
+        return (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))
+
+    @patch("backend.relayconnection.socket.getaddrinfo")
+    def test_resolve_cached(self, getaddrinfo_mock):
+        getaddrinfo_mock.return_value = [INFO_V4_1]
+        resolver = RelayResolver()
+
+        self.assertEqual(resolver.resolve("smtp.test.com", 25), [INFO_V4_1])
+        self.assertEqual(resolver.resolve("smtp.test.com", 25), [INFO_V4_1])
+
+        getaddrinfo_mock.assert_called_once_with("smtp.test.com", 25, type=socket.SOCK_STREAM)
+
+    @patch("backend.relayconnection.socket.getaddrinfo")
+    def test_resolve_ttl(self, getaddrinfo_mock):
+        getaddrinfo_mock.return_value = [INFO_V4_1]
+        resolver = RelayResolver(ttl=0)
+
+        resolver.resolve("smtp.test.com", 25)
+        resolver.resolve("smtp.test.com", 25)
+
+        self.assertEqual(getaddrinfo_mock.call_count, 2)
+
+    @patch("backend.relayconnection.socket.getaddrinfo")
+    def test_resolve_interleaves_families(self, getaddrinfo_mock):
+        getaddrinfo_mock.return_value = [INFO_V4_1, INFO_V4_2, INFO_V6_1]
+        resolver = RelayResolver()
+
+        self.assertEqual(resolver.resolve("smtp.test.com", 25), [INFO_V6_1, INFO_V4_1, INFO_V4_2])
+
+    @patch("backend.relayconnection.socket.getaddrinfo")
+    def test_invalidate(self, getaddrinfo_mock):
+        getaddrinfo_mock.return_value = [INFO_V4_1]
+        resolver = RelayResolver()
+        resolver.resolve("smtp.test.com", 25)
+
+        resolver.invalidate("smtp.test.com", 25)
+        resolver.resolve("smtp.test.com", 25)
+
+        self.assertEqual(getaddrinfo_mock.call_count, 2)
+
+    def test_connect(self):
+        resolver = RelayResolver()
+
+        sock = resolver.connect("127.0.0.1", self.port, timeout=2.0)
+
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        self.assertEqual(sock.gettimeout(), 2.0)
+        sock.close()
+
+    def test_connect_next_address_on_failure(self):
+        resolver = RelayResolver(attempt_delay=10.0)
+        resolver.resolve = Mock(return_value=[self.get_info(self.closed_port), self.get_info(self.port)])
+
+        sock = resolver.connect("relay", 25, timeout=2.0)
+
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        sock.close()
+
+    def test_connect_races_slow_address(self):
+        resolver = RelayResolver(attempt_delay=0.05)
+        # first address never answers
+        slow_info = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", 25))
+        resolver.resolve = Mock(return_value=[slow_info, self.get_info(self.port)])
+
+        sock = resolver.connect("relay", 25, timeout=2.0)
+
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        sock.close()
+
+    def test_connect_failure_invalidates_cache(self):
+        resolver = RelayResolver()
+        resolver.resolve = Mock(return_value=[self.get_info(self.closed_port)])
+        resolver.invalidate = Mock()
+
+        with self.assertRaises(OSError):
+            resolver.connect("relay", 25, timeout=2.0)
+        resolver.invalidate.assert_called_with("relay", 25)
+
+    def test_connect_timeout(self):
+        resolver = RelayResolver()
+        slow_info = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", 25))
+        resolver.resolve = Mock(return_value=[slow_info])
+
+        with self.assertRaises(OSError):
+            resolver.connect("relay", 25, timeout=0.2)
+
+
+class TestRelaySMTP(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.sink = SmtpSink()
+        self.sink.start()
+
+    def tearDown(self):
+        self.sink.stop()
+
+    def test_connect_with_resolver(self):
+        resolver = RelayResolver()
+        resolver.connect = Mock(wraps=resolver.connect)
+
+        smtp_server = RelaySMTP("127.0.0.1", self.sink.port, resolver=resolver, timeout=2.0)
+        code, _ = smtp_server.noop()
+        smtp_server.quit()
+
+        self.assertEqual(code, 250)
+        resolver.connect.assert_called_with("127.0.0.1", self.sink.port, 2.0, None)
+
+    def test_connect_without_resolver(self):
+        smtp_server = RelaySMTP("127.0.0.1", self.sink.port)
+        code, _ = smtp_server.noop()
+        smtp_server.quit()
+
+        self.assertEqual(code, 250)
+
+    def test_ssl_uses_resolver(self):
+        resolver = Mock()
+        resolver.connect.side_effect = OSError("Test error")
+
+        with self.assertRaises(OSError):
+            RelaySMTP_SSL("relay", 465, resolver=resolver, timeout=2.0)
+        resolver.connect.assert_called_with("relay", 465, 2.0, None)
+
+
+
+class TestRelaySessions(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.sink = SmtpSink()
+        self.sink.start()
+        self.sessions = RelaySessions({"connect": 2.0, "tls": 2.0, "auth": 2.0, "data": 2.0})
+        self.config = {"server": "127.0.0.1", "port": self.sink.port}
+
+    def tearDown(self):
+        self.sessions.drop_warm_session()
+        self.sink.stop()
+
+    def wait_warm_session(self):
+        for _ in range(100):
+            if self.sessions.warm_session:
+                return
+            time.sleep(0.01)
+        self.fail("Session not pre-warmed")
+
+    def test_open(self):
+        job = Mock()
+
+        smtp_server = self.sessions.open(self.config, job)
+        code, _ = smtp_server.noop()
+        RelaySessions.close(smtp_server)
+
+        self.assertEqual(code, 250)
+        self.assertEqual(smtp_server.relay, ("127.0.0.1", self.sink.port))
+        self.assertEqual(smtp_server.phase_timeouts["connect"], 2.0)
+        job.attach.assert_called_with(smtp_server)
+        self.assertIn("connect", self.sessions.latencies.get_stats()[f"127.0.0.1:{self.sink.port}"])
+
+    def test_take_warm_session(self):
+        self.sessions.prewarm(lambda: self.config)
+        self.wait_warm_session()
+
+        smtp_server = self.sessions.take_warm_session(self.config)
+
+        self.assertIsNotNone(smtp_server)
+        self.assertIsNone(self.sessions.warm_session)
+        RelaySessions.close(smtp_server)
+
+    def test_take_warm_session_config_changed(self):
+        self.sessions.prewarm(lambda: self.config)
+        self.wait_warm_session()
+
+        self.assertIsNone(self.sessions.take_warm_session(dict(self.config)))
+        self.assertIsNone(self.sessions.warm_session)
+
+    def test_take_warm_session_idle(self):
+        self.sessions.prewarm_max_idle = 0.0
+        self.sessions.prewarm(lambda: self.config)
+        self.wait_warm_session()
+
+        self.assertIsNone(self.sessions.take_warm_session(self.config))
+
+    def test_prewarm_failure(self):
+        self.sessions.prewarm(Mock(side_effect=Exception("Test error")))
+        time.sleep(0.1)
+
+        self.assertIsNone(self.sessions.warm_session)
+
+    def test_close_keeps_delivery_backend(self):
+        backend = NullBackend()
+        backend.close = Mock()
+
+        RelaySessions.close(backend)
+
+        backend.close.assert_not_called()
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_relayconnection.py; coverage report -m -i
+    unittest.main()
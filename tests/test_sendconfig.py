@@ -0,0 +1,82 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.sendconfig import get_send_config, get_providers, SendConfigSnapshot, CUSTOM_PROVIDER_KEY
+from unittest.mock import Mock
+from cleep.exception import MissingParameter
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestSendConfig(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+
+    def test_get_providers(self):
+        providers = get_providers()
+
+        self.assertEqual(providers[0], {"label": "Google Gmail", "key": "gmail"})
+        self.assertEqual(providers[-1]["key"], CUSTOM_PROVIDER_KEY)
+
+    def test_get_send_config_provider(self):
+        config = get_send_config({"provider": "gmail", "login": "login", "password": "password", "server": "ignored"})
+
+        self.assertEqual(config["server"], "smtp.gmail.com")
+        self.assertEqual(config["port"], 465)
+        self.assertTrue(config["ssl"])
+        self.assertEqual(config["login"], "login")
+
+    def test_get_send_config_custom(self):
+        config = get_send_config({"provider": "custom", "server": "smtp.test.com", "port": 25, "tls": True})
+
+        self.assertEqual(config["server"], "smtp.test.com")
+        self.assertEqual(config["port"], 25)
+        self.assertTrue(config["tls"])
+
+    def test_get_send_config_missing_credentials(self):
+        with self.assertRaises(MissingParameter):
+            get_send_config({"provider": "gmail", "login": "login"})
+
+    def test_get_send_config_missing_server(self):
+        with self.assertRaises(MissingParameter):
+            get_send_config({"provider": "custom", "port": 25})
+
+        # relay is not checked
+        self.assertIsNone(get_send_config({"provider": "custom"}, check_relay=False)["server"])
+
+
+class TestSendConfigSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+
+    def test_get(self):
+        load = Mock(return_value={"server": "server1"})
+        snapshot = SendConfigSnapshot(load)
+
+        config = snapshot.get()
+
+        self.assertIs(snapshot.get(), config)
+        load.assert_called_once()
+        with self.assertRaises(TypeError):
+            config["server"] = "server2"
+
+    def test_update(self):
+        load = Mock(side_effect=[{"server": "server1"}, {"server": "server2"}])
+        snapshot = SendConfigSnapshot(load)
+        previous = snapshot.get()
+
+        result = snapshot.update(lambda: True)
+
+        self.assertTrue(result)
+        self.assertEqual(snapshot.get()["server"], "server2")
+        # running send keeps its snapshot
+        self.assertEqual(previous["server"], "server1")
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_sendconfig.py; coverage report -m -i
+    unittest.main()
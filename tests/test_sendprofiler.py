@@ -0,0 +1,107 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.sendprofiler import SendProfiler
+from tests.localfilesystem import LocalFilesystem
+import os
+import pstats
+import tempfile
+import tracemalloc
+from unittest.mock import Mock, patch
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+def work(value):
+    return [value] * 1000
+
+
+class TestSendProfiler(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.profiler = SendProfiler(os.path.join(self.output_dir.name, "profiles"), LocalFilesystem())
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def test_disabled(self):
+        func = Mock(return_value="result")
+
+        result = self.profiler.wrap(func, "send")("arg")
+
+        self.assertEqual(result, "result")
+        func.assert_called_once_with("arg")
+        self.assertEqual(self.profiler.get_status(), {"remaining": 0, "memory": False, "files": []})
+
+    def test_profile_next_sends(self):
+        self.profiler.enable(2)
+
+        for _ in range(3):
+            self.assertEqual(len(self.profiler.wrap(work, "send")(1)), 1000)
+
+        status = self.profiler.get_status()
+        self.assertEqual(status["remaining"], 0)
+        self.assertEqual(len(status["files"]), 2)
+        for filepath in status["files"]:
+            self.assertTrue(filepath.endswith(".prof"))
+            stats = pstats.Stats(filepath)
+            self.assertTrue(any(func[2] == "work" for func in stats.stats))
+
+    @patch("backend.sendprofiler.SendProfiler.MAX_FILES", 2)
+    def test_files_capped(self):
+        profiler = SendProfiler(os.path.join(self.output_dir.name, "profiles"), LocalFilesystem())
+        profiler.enable(3)
+
+        for _ in range(3):
+            profiler.wrap(work, "send")(1)
+
+        files = profiler.get_status()["files"]
+        self.assertEqual(len(files), 2)
+        self.assertTrue(files[-1].endswith("-3.prof"))
+
+    def test_profile_memory(self):
+        self.profiler.enable(1, memory=True)
+
+        self.profiler.wrap(work, "send")(1)
+
+        files = self.profiler.get_status()["files"]
+        self.assertEqual(len(files), 2)
+        snapshot = tracemalloc.Snapshot.load(files[1])
+        self.assertTrue(snapshot.statistics("filename"))
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_profile_failing_send(self):
+        self.profiler.enable(1)
+        func = Mock(side_effect=Exception("Test error"))
+
+        with self.assertRaises(Exception):
+            self.profiler.wrap(func, "send")()
+
+        self.assertEqual(len(self.profiler.get_status()["files"]), 1)
+
+    def test_disable(self):
+        self.profiler.enable(5)
+
+        self.profiler.disable()
+        self.profiler.wrap(work, "send")(1)
+
+        self.assertEqual(self.profiler.get_status()["files"], [])
+
+    def test_write_failure(self):
+        with open(os.path.join(self.output_dir.name, "profiles"), "w") as filep:
+            filep.write("not a directory")
+        self.profiler.enable(1)
+
+        result = self.profiler.wrap(work, "send")(1)
+
+        self.assertEqual(len(result), 1000)
+        self.assertEqual(self.profiler.get_status()["files"], [])
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_sendprofiler.py; coverage report -m -i
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.sendworker import SendJob, SendWorkerPool, SendCancelled, SendTimeout, SendQueueFull
+import threading
+from unittest.mock import Mock
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestSendJob(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+
+    def test_check(self):
+        job = SendJob()
+
+        job.check()
+
+        self.assertFalse(job.cancelled)
+
+    def test_cancel_closes_connection(self):
+        job = SendJob()
+        smtp_server = Mock()
+        job.attach(smtp_server)
+
+        job.cancel()
+
+        self.assertTrue(job.cancelled)
+        smtp_server.close.assert_called()
+        with self.assertRaises(SendCancelled):
+            job.check()
+
+    def test_cancel_close_failure(self):
+        job = SendJob()
+        smtp_server = Mock()
+        smtp_server.close.side_effect = Exception("Test error")
+        job.attach(smtp_server)
+
+        job.cancel()
+
+        self.assertTrue(job.cancelled)
+
+    def test_attach_cancelled_job(self):
+        job = SendJob()
+        job.cancel()
+        smtp_server = Mock()
+
+        with self.assertRaises(SendCancelled):
+            job.attach(smtp_server)
+        smtp_server.close.assert_called()
+
+
+class TestSendWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.pool = SendWorkerPool(2, 1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_run(self):
+        func = Mock(return_value=True)
+
+        result = self.pool.run(func, 1.0, "arg", key="value")
+
+        self.assertTrue(result)
+        job = func.call_args.args[0]
+        self.assertIsInstance(job, SendJob)
+        func.assert_called_with(job, "arg", key="value")
+
+    def test_run_exception(self):
+        func = Mock(side_effect=ValueError("Test error"))
+
+        with self.assertRaises(ValueError):
+            self.pool.run(func, 1.0)
+
+    def test_run_timeout_cancels_job(self):
+        jobs = []
+        release = threading.Event()
+
+        def func(job):
+            jobs.append(job)
+            release.wait(1.0)
+
+        with self.assertRaises(SendTimeout):
+            self.pool.run(func, 0.1)
+        self.assertTrue(jobs[0].cancelled)
+        release.set()
+
+    def test_run_queue_full(self):
+        pool = SendWorkerPool(2, 0)
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def func(job):
+            started.release()
+            release.wait(2.0)
+
+        callers = [threading.Thread(target=pool.run, args=(func, 2.0)) for _ in range(2)]
+        for caller in callers:
+            caller.start()
+        started.acquire()
+        started.acquire()
+
+        with self.assertRaises(SendQueueFull):
+            pool.run(func, 0.1)
+
+        release.set()
+        for caller in callers:
+            caller.join()
+        self.assertTrue(pool.run(Mock(return_value=True), 1.0))
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_sendworker.py; coverage report -m -i
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.smtptimeouts import RelayLatencies, PhaseTimeout, get_percentile
+import socket
+import smtplib
+from unittest.mock import Mock
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+CONFIGURED = {"connect": 10, "tls": 10, "auth": 10, "data": 60}
+RELAY = ("server", 25)
+
+
+class TestRelayLatencies(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.latencies = RelayLatencies(samples=10, min_samples=3, factor=2.0, min_timeout=1.0)
+
+    def test_get_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(get_percentile(values, 0.5), 50)
+        self.assertEqual(get_percentile(values, 0.95), 95)
+        self.assertEqual(get_percentile([3], 0.95), 3)
+
+    def test_get_timeouts_not_adaptive(self):
+        for _ in range(5):
+            self.latencies.record(RELAY, "connect", 0.1)
+
+        timeouts = self.latencies.get_timeouts(RELAY, CONFIGURED, False)
+
+        self.assertEqual(timeouts, {"connect": 10.0, "tls": 10.0, "auth": 10.0, "data": 60.0})
+
+    def test_get_timeouts_adaptive(self):
+        for duration in (1.0, 2.0, 3.0):
+            self.latencies.record(RELAY, "data", duration)
+        for _ in range(3):
+            self.latencies.record(RELAY, "connect", 0.01)
+        self.latencies.record(RELAY, "auth", 0.5)
+
+        timeouts = self.latencies.get_timeouts(RELAY, CONFIGURED, True)
+
+        self.assertEqual(timeouts["data"], 6.0)
+        # bounded by minimum timeout
+        self.assertEqual(timeouts["connect"], 1.0)
+        # not enough samples
+        self.assertEqual(timeouts["auth"], 10.0)
+        self.assertEqual(timeouts["tls"], 10.0)
+
+    def test_get_timeouts_adaptive_bounded_by_configured(self):
+        for _ in range(3):
+            self.latencies.record(RELAY, "auth", 8.0)
+
+        timeouts = self.latencies.get_timeouts(RELAY, CONFIGURED, True)
+
+        self.assertEqual(timeouts["auth"], 10.0)
+
+    def test_get_timeouts_per_relay(self):
+        for _ in range(3):
+            self.latencies.record(RELAY, "data", 1.0)
+
+        timeouts = self.latencies.get_timeouts(("other", 25), CONFIGURED, True)
+
+        self.assertEqual(timeouts["data"], 60.0)
+
+    def test_samples_window(self):
+        for _ in range(10):
+            self.latencies.record(RELAY, "data", 20.0)
+        for _ in range(10):
+            self.latencies.record(RELAY, "data", 1.0)
+
+        timeouts = self.latencies.get_timeouts(RELAY, CONFIGURED, True)
+
+        self.assertEqual(timeouts["data"], 2.0)
+
+    def test_get_stats(self):
+        for duration in (1.0, 2.0, 3.0, 4.0):
+            self.latencies.record(RELAY, "connect", duration)
+
+        stats = self.latencies.get_stats()
+
+        self.assertEqual(stats, {
+            "server:25": {
+                "connect": {"samples": 4, "p50": 2.0, "p95": 4.0},
+            },
+        })
+
+    def test_measure(self):
+        smtp_server = Mock()
+
+        with self.latencies.measure(RELAY, "tls", 5.0, smtp_server):
+            pass
+
+        smtp_server.sock.settimeout.assert_called_with(5.0)
+        self.assertEqual(self.latencies.get_stats()["server:25"]["tls"]["samples"], 1)
+
+    def test_measure_timeout(self):
+        with self.assertRaises(PhaseTimeout) as cm:
+            with self.latencies.measure(RELAY, "data", 5.0):
+                raise socket.timeout()
+
+        self.assertEqual(cm.exception.phase, "data")
+        self.assertEqual(str(cm.exception), "Timeout during data phase (5.0s)")
+        self.assertEqual(self.latencies.get_stats(), {})
+
+    def test_measure_smtp_disconnected_on_timeout(self):
+        with self.assertRaises(PhaseTimeout) as cm:
+            with self.latencies.measure(RELAY, "auth", 5.0):
+                try:
+                    raise socket.timeout("timed out")
+                except OSError:
+                    raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed: timed out")
+
+        self.assertEqual(cm.exception.phase, "auth")
+
+    def test_measure_smtp_disconnected(self):
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            with self.latencies.measure(RELAY, "auth", 5.0):
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+    def test_measure_other_error(self):
+        with self.assertRaises(ValueError):
+            with self.latencies.measure(RELAY, "auth", 5.0):
+                raise ValueError()
+
+        self.assertEqual(self.latencies.get_stats(), {})
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_smtptimeouts.py; coverage report -m -i
+    unittest.main()
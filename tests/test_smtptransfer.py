@@ -0,0 +1,372 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.smtptransfer import (
+    BODY_7BIT,
+    BODY_8BITMIME,
+    BODY_BINARYMIME,
+    get_transfer_mode,
+    set_text_content,
+    get_bytes_content_options,
+    serialize_message,
+    get_envelope,
+    send_bdat,
+    send_data,
+    stream_data,
+    DataWriter,
+    BdatWriter,
+)
+from tests.smtpsink import SmtpSink
+from email.message import EmailMessage
+from email import message_from_bytes, policy
+from unittest.mock import Mock
+import io
+import os
+import tracemalloc
+from cleep.libs.tests.common import get_log_level
+import smtplib
+
+LOG_LEVEL = get_log_level()
+
+
+class TestSmtpTransfer(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+
+    def test_get_transfer_mode(self):
+        smtp = Mock()
+
+        smtp.esmtp_features = {}
+        self.assertEqual(get_transfer_mode(smtp), (BODY_7BIT, False))
+        smtp.esmtp_features = {"8bitmime": ""}
+        self.assertEqual(get_transfer_mode(smtp), (BODY_8BITMIME, False))
+        smtp.esmtp_features = {"binarymime": ""}
+        self.assertEqual(get_transfer_mode(smtp), (BODY_7BIT, False))
+        smtp.esmtp_features = {"chunking": ""}
+        self.assertEqual(get_transfer_mode(smtp), (BODY_7BIT, True))
+        smtp.esmtp_features = {"8bitmime": "", "chunking": "", "binarymime": ""}
+        self.assertEqual(get_transfer_mode(smtp), (BODY_BINARYMIME, True))
+        smtp.ehlo_or_helo_if_needed.assert_called()
+
+    def test_get_transfer_mode_negotiated_with_sink(self):
+        sink = SmtpSink([b"8BITMIME"])
+        sink.start()
+        try:
+            smtp = smtplib.SMTP("127.0.0.1", sink.port)
+            mode = get_transfer_mode(smtp)
+            smtp.quit()
+        finally:
+            sink.stop()
+
+        self.assertEqual(mode, (BODY_8BITMIME, False))
+
+    def test_set_text_content_7bit(self):
+        mail = EmailMessage()
+
+        set_text_content(mail, "é" * 100, "html", BODY_7BIT)
+
+        self.assertIn(mail["Content-Transfer-Encoding"], ("base64", "quoted-printable"))
+
+    def test_set_text_content_8bit(self):
+        mail = EmailMessage()
+
+        set_text_content(mail, "é" * 100, "html", BODY_8BITMIME)
+
+        self.assertEqual(mail["Content-Transfer-Encoding"], "8bit")
+        self.assertEqual(mail.get_content(), "é" * 100 + "\n")
+
+    def test_set_text_content_too_long_lines(self):
+        mail = EmailMessage()
+        set_text_content(mail, "é" * 1000, "html", BODY_8BITMIME)
+        self.assertIn(mail["Content-Transfer-Encoding"], ("base64", "quoted-printable"))
+
+        mail = EmailMessage()
+        set_text_content(mail, "é" * 1000, "html", BODY_BINARYMIME)
+        self.assertEqual(mail["Content-Transfer-Encoding"], "binary")
+        self.assertEqual(mail.get_content(), "é" * 1000)
+
+    def test_get_bytes_content_options(self):
+        self.assertEqual(get_bytes_content_options(BODY_7BIT), {})
+        self.assertEqual(get_bytes_content_options(BODY_8BITMIME), {})
+        self.assertEqual(get_bytes_content_options(BODY_BINARYMIME), {"cte": "binary"})
+
+    def test_serialize_message_keeps_binary_untouched(self):
+        data = bytes(range(256)) * 4
+        mail = EmailMessage()
+        mail["Subject"] = "test"
+        set_text_content(mail, "content", "html", BODY_BINARYMIME)
+        mail.add_attachment(data, maintype="application", subtype="octet-stream", filename="file.bin", **get_bytes_content_options(BODY_BINARYMIME))
+
+        serialized = serialize_message(mail)
+
+        self.assertIn(b"\r\n\r\n" + data + b"\r\n--", serialized)
+        self.assertNotIn(b"\r\n", serialized.replace(data, b"").replace(b"\r\n", b""))
+        parsed = message_from_bytes(serialized, policy=policy.default)
+        attachment = list(parsed.iter_attachments())[0]
+        self.assertEqual(attachment.get_payload(decode=True), data)
+
+    def test_serialize_message_is_smaller_than_7bit(self):
+        data = bytes(range(256)) * 100
+        sizes = {}
+        for body_type in (BODY_7BIT, BODY_BINARYMIME):
+            mail = EmailMessage()
+            set_text_content(mail, "content", "html", body_type)
+            mail.add_attachment(data, maintype="application", subtype="octet-stream", **get_bytes_content_options(body_type))
+            sizes[body_type] = len(serialize_message(mail))
+
+        self.assertLess(sizes[BODY_BINARYMIME], len(data) * 1.05)
+        self.assertGreater(sizes[BODY_7BIT], len(data) * 1.33)
+
+    def test_get_envelope(self):
+        mail = EmailMessage()
+        mail["From"] = "Sender <sender@test.com>"
+        mail["To"] = "to1@test.com, To 2 <to2@test.com>"
+        mail["Cc"] = "cc@test.com"
+        mail["Bcc"] = "bcc@test.com"
+
+        self.assertEqual(get_envelope(mail), ("sender@test.com", ["to1@test.com", "to2@test.com", "cc@test.com", "bcc@test.com"]))
+
+    def test_send_bdat(self):
+        smtp = Mock()
+        smtp.getreply.return_value = (250, b"ok")
+
+        send_bdat(smtp, b"0123456789", chunk_size=4)
+
+        sent = [bytes(call.args[0]) for call in smtp.send.call_args_list]
+        self.assertEqual(sent, [b"BDAT 4\r\n", b"0123", b"BDAT 4\r\n", b"4567", b"BDAT 2 LAST\r\n", b"89"])
+
+    def test_send_bdat_refused(self):
+        smtp = Mock()
+        smtp.getreply.return_value = (552, b"too big")
+
+        with self.assertRaises(smtplib.SMTPDataError):
+            send_bdat(smtp, b"0123456789", chunk_size=4)
+        self.assertEqual(smtp.send.call_count, 2)
+
+    def test_send_data_without_chunking(self):
+        smtp = Mock()
+
+        send_data(smtp, "sender", ["to"], b"data", BODY_8BITMIME, False)
+        smtp.sendmail.assert_called_with("sender", ["to"], b"data", ["BODY=8BITMIME"], [])
+
+        send_data(smtp, "sender", ["to"], b"data", BODY_7BIT, False)
+        smtp.sendmail.assert_called_with("sender", ["to"], b"data", [], [])
+
+    def test_send_data_with_chunking(self):
+        smtp = Mock()
+        smtp.mail.return_value = (250, b"ok")
+        smtp.rcpt.side_effect = [(250, b"ok"), (550, b"unknown")]
+        smtp.getreply.return_value = (250, b"ok")
+
+        refused = send_data(smtp, "sender", ["to1", "to2"], b"data", BODY_BINARYMIME, True)
+
+        self.assertEqual(refused, {"to2": (550, b"unknown")})
+        smtp.mail.assert_called_with("sender", ["BODY=BINARYMIME"])
+        smtp.sendmail.assert_not_called()
+        smtp.send.assert_any_call(b"BDAT 4 LAST\r\n")
+
+    def test_send_data_with_chunking_sender_refused(self):
+        smtp = Mock()
+        smtp.mail.return_value = (550, b"refused")
+
+        with self.assertRaises(smtplib.SMTPSenderRefused):
+            send_data(smtp, "sender", ["to"], b"data", BODY_BINARYMIME, True)
+        smtp.rset.assert_called()
+
+    def test_send_data_with_chunking_all_recipients_refused(self):
+        smtp = Mock()
+        smtp.mail.return_value = (250, b"ok")
+        smtp.rcpt.return_value = (550, b"unknown")
+
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            send_data(smtp, "sender", ["to"], b"data", BODY_BINARYMIME, True)
+        smtp.send.assert_not_called()
+
+
+    def test_data_writer(self):
+        smtp = Mock()
+        writer = DataWriter(smtp, buffer_size=4)
+
+        for data in (b".first\r", b"\nsecond\n", b".third\rfourth"):
+            writer.write(data)
+        writer.close()
+
+        sent = b"".join(call.args[0] for call in smtp.send.call_args_list)
+        self.assertEqual(sent, b"..first\r\nsecond\r\n..third\r\nfourth\r\n.\r\n")
+        self.assertEqual(writer.bytes, 28)
+
+    def test_data_writer_dot_at_chunk_start(self):
+        smtp = Mock()
+        writer = DataWriter(smtp, buffer_size=6)
+
+        writer.write(b"line\r\n")
+        writer.write(b".dot\r\n")
+        writer.close()
+
+        sent = b"".join(call.args[0] for call in smtp.send.call_args_list)
+        self.assertEqual(sent, b"line\r\n..dot\r\n.\r\n")
+
+    def test_bdat_writer(self):
+        smtp = Mock()
+        smtp.getreply.return_value = (250, b"ok")
+        writer = BdatWriter(smtp, chunk_size=4)
+
+        writer.write(b"0123")
+        writer.write(b"45\n")
+        writer.close()
+
+        smtp.send.assert_any_call(b"BDAT 4\r\n")
+        smtp.send.assert_any_call(b"BDAT 3 LAST\r\n")
+        sent = b"".join(bytes(call.args[0]) for call in smtp.send.call_args_list[1::2])
+        self.assertEqual(sent, b"012345\n")
+        self.assertEqual(writer.bytes, 7)
+
+    def test_bdat_writer_refused(self):
+        smtp = Mock()
+        smtp.getreply.return_value = (552, b"too big")
+        writer = BdatWriter(smtp, chunk_size=4)
+
+        with self.assertRaises(smtplib.SMTPDataError):
+            writer.write(b"0123")
+
+    def test_stream_data(self):
+        smtp = Mock()
+        smtp.mail.return_value = (250, b"ok")
+        smtp.rcpt.return_value = (250, b"ok")
+        smtp.docmd.return_value = (354, b"go ahead")
+        smtp.getreply.return_value = (250, b"queued")
+        mail = EmailMessage()
+        mail["Subject"] = "test"
+        mail.set_content("line\n.dot line\n")
+
+        refused, wire_bytes = stream_data(smtp, "sender", ["to"], mail, BODY_8BITMIME, False)
+
+        self.assertEqual(refused, {})
+        self.assertEqual(wire_bytes, len(serialize_message(mail)))
+        smtp.mail.assert_called_with("sender", ["BODY=8BITMIME"])
+        smtp.docmd.assert_called_with("data")
+        sent = b"".join(call.args[0] for call in smtp.send.call_args_list)
+        self.assertTrue(sent.endswith(b"line\r\n..dot line\r\n.\r\n"))
+
+    def test_stream_data_refused(self):
+        smtp = Mock()
+        smtp.mail.return_value = (250, b"ok")
+        smtp.rcpt.return_value = (250, b"ok")
+        smtp.docmd.return_value = (354, b"go ahead")
+        smtp.getreply.return_value = (554, b"rejected")
+        mail = EmailMessage()
+        mail.set_content("content")
+
+        with self.assertRaises(smtplib.SMTPDataError):
+            stream_data(smtp, "sender", ["to"], mail, BODY_7BIT, False)
+        smtp.rset.assert_called()
+
+    def test_stream_data_with_chunking(self):
+        smtp = Mock()
+        smtp.mail.return_value = (250, b"ok")
+        smtp.rcpt.return_value = (250, b"ok")
+        smtp.getreply.return_value = (250, b"ok")
+        mail = EmailMessage()
+        mail.set_content(b"\x00\r\x01\n.", maintype="application", subtype="octet-stream", cte="binary")
+
+        _, wire_bytes = stream_data(smtp, "sender", ["to"], mail, BODY_BINARYMIME, True)
+
+        smtp.docmd.assert_not_called()
+        smtp.send.assert_any_call(b"BDAT %d LAST\r\n" % wire_bytes)
+        self.assertEqual(bytes(smtp.send.call_args_list[1].args[0]), serialize_message(mail))
+
+    def test_stream_generator_output(self):
+        mail = EmailMessage()
+        mail["From"] = "sender@test.com"
+        mail["Subject"] = "test"
+        mail.set_content("From here\n.dot\n", cte="8bit")
+        mail.add_related(b"image", maintype="image", subtype="png", cid="<image>")
+        mail.add_attachment(b"\x00" * 1000, maintype="application", subtype="octet-stream", filename="file.bin")
+        mail.add_attachment("text attachment\nFrom line\n", filename="file.txt")
+        forwarded = EmailMessage()
+        forwarded["Subject"] = "forwarded"
+        forwarded.set_content("forwarded content\n")
+        mail.add_attachment(forwarded)
+        mail.preamble = "From preamble\n"
+        mail.epilogue = "epilogue\n"
+        # sets multipart boundaries, streaming must not change anything else
+        expected = serialize_message(mail)
+        smtp = Mock()
+        smtp.mail.return_value = (250, b"ok")
+        smtp.rcpt.return_value = (250, b"ok")
+        smtp.getreply.return_value = (250, b"ok")
+
+        _, wire_bytes = stream_data(smtp, "sender", ["to"], mail, BODY_8BITMIME, True)
+
+        streamed = b"".join(bytes(call.args[0]) for call in smtp.send.call_args_list[1::2])
+        self.assertEqual(streamed, expected)
+        self.assertEqual(serialize_message(mail), expected)
+        self.assertEqual(wire_bytes, len(streamed))
+
+
+class NullSocket:
+    """
+    Socket dropping sent data
+    """
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestSerializationMemory(unittest.TestCase):
+    """
+    Peak memory allocated while sending a large message, flattened first or streamed
+    """
+
+    ATTACHMENT_SIZE = 4 * 1024 * 1024
+
+    def setUp(self):
+        logging.basicConfig(level=LOG_LEVEL, format=u'%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s')
+        self.mail = EmailMessage()
+        self.mail["From"] = "sender@test.com"
+        self.mail["To"] = "recipient@test.com"
+        self.mail["Subject"] = "snapshot"
+        self.mail.set_content("content\n" * 100, cte="8bit")
+        self.mail.add_attachment(os.urandom(self.ATTACHMENT_SIZE), maintype="image", subtype="jpeg", filename="snapshot.jpg")
+        self.mail.preamble = "You will not see this in a MIME-aware mail reader.\n"
+
+    def get_smtp(self):
+        smtp = smtplib.SMTP()
+        smtp.sock = NullSocket()
+        smtp.file = io.BytesIO(b"250 ok\r\n250 ok\r\n354 go ahead\r\n250 queued\r\n")
+        smtp.ehlo_resp = b"sink"
+        smtp.does_esmtp = True
+        smtp.esmtp_features = {"8bitmime": ""}
+        return smtp
+
+    def measure(self, send):
+        smtp = self.get_smtp()
+        tracemalloc.start()
+        try:
+            send(smtp)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory(self):
+        def flattened(smtp):
+            send_data(smtp, "sender@test.com", ["recipient@test.com"], serialize_message(self.mail), BODY_8BITMIME, False)
+
+        def streamed(smtp):
+            stream_data(smtp, "sender@test.com", ["recipient@test.com"], self.mail, BODY_8BITMIME, False)
+
+        flattened_peak = self.measure(flattened)
+        streamed_peak = self.measure(streamed)
+        logging.info("Peak memory: flattened=%d bytes streamed=%d bytes", flattened_peak, streamed_peak)
+
+        self.assertLess(streamed_peak, flattened_peak / 10)
+
+
+if __name__ == "__main__":
+    # coverage run --include="**/backend/**/*.py" --concurrency=thread test_smtptransfer.py; coverage report -m -i
+    unittest.main()